@@ -0,0 +1,53 @@
+"""
+Compare loading a .grd grid with a naive ``np.loadtxt`` parse, the first conversion
+to the binary sidecar, and later memory-mapped loads.
+
+Usage: python benchmarks/bench_grd.py [--n 200] [--dir /tmp]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.grd import read_grd, write_grd
+
+
+def _timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<32} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the .grd reader")
+    parser.add_argument("--n", type=int, default=200, help="Grid points per axis")
+    parser.add_argument("--dir", default=None, help="Scratch directory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = Path(tmp) / "bench.grd"
+        n = args.n
+        rng = np.random.default_rng(0)
+        write_grd(path, rng.random((n, n, n)), [10.0, 10.0, 10.0, 90.0, 90.0, 90.0])
+        print(f"{n}^3 grid, {path.stat().st_size / 1e6:.0f} MB of text")
+
+        naive = _timed("np.loadtxt", lambda: np.loadtxt(path, skiprows=5))
+        grid = _timed("first load (convert + memmap)", lambda: read_grd(path).data)
+        _timed("reload (memmap)", lambda: read_grd(path).data)
+        total = _timed("reload + full reduction", lambda: float(read_grd(path).data.sum()))
+        _timed(
+            "stream z-slabs (no sidecar)",
+            lambda: sum(
+                float(slab.sum()) for _, slab in read_grd(path, sidecar=False).iter_z_slabs(16)
+            ),
+        )
+        assert np.allclose(naive.sum(), total, rtol=1e-5)
+        del grid
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import castepkit.config
+from castepkit.testing import install_fakes
+
+pytest.importorskip("pytest_benchmark")
+
+GAAS = Path(__file__).parent.parent / "tests" / "data" / "GaAs"
+
+
+@pytest.fixture
+def fake_env(tmp_path, monkeypatch):
+    """
+    GaAs inputs in a fresh working directory and fake executables that sleep 50 ms.
+
+    Returns a function ``setup(extra_config="", **spec)`` that reinstalls the fakes with
+    other :class:`castepkit.testing.FakeSpec` fields and extra config sections.
+    """
+    work = tmp_path / "work"
+    work.mkdir()
+    for f in [*GAAS.glob("GaAs_Optics*"), *GAAS.glob("*.recpot")]:
+        shutil.copy(f, work / f.name)
+    for suffix in ("param", "switch", "orbitals"):
+        (work / f"GaAs_Optics.{suffix}").write_text(suffix)
+    monkeypatch.chdir(work)
+
+    def setup(extra_config="", **spec):
+        spec = {"sleep": 0.05, "output_size": "256KB", **spec}
+        config = install_fakes(tmp_path / "bin", config=extra_config, **spec)
+        monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+        return work
+
+    setup()
+    return setup
@@ -0,0 +1,75 @@
+"""
+Start-up time of the ``castepkit`` command line.
+
+Every ``castepkit`` invocation and every line of a shell loop over calculations pays the
+import time of :mod:`castepkit.cli`; it should stay close to that of the bare interpreter
+however many commands are added. The benchmarks time fresh interpreters, so compare them
+with ``test_interpreter_baseline`` rather than in absolute terms; ``test_import_footprint``
+fails outright when heavy modules are imported eagerly again.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+# Modules the lazy CLI must not import before a command runs.
+HEAVY = ["numpy", "castepkit.config", "castepkit.utils", "castepkit.wrappers.shg"]
+
+# Modules ``castepkit shg --help`` and ``castepkit dens --help`` must not import: the
+# wrappers defer them to their runs.
+WRAPPER_HEAVY = [
+    "numpy",
+    "castepkit.cache",
+    "castepkit.utils",
+    "castepkit.io.bands",
+    "castepkit.analysis.band_weights",
+]
+
+
+def _python(*args):
+    subprocess.run([sys.executable, *args], check=True, capture_output=True)
+
+
+def test_interpreter_baseline(benchmark):
+    """``python -c pass``: the floor for any command-line start-up."""
+    benchmark(_python, "-c", "pass")
+
+
+def test_import_cli(benchmark):
+    benchmark(_python, "-c", "import castepkit.cli")
+
+
+def test_cli_help(benchmark):
+    """``castepkit --help``, which builds the parser of every command."""
+    benchmark(_python, "-m", "castepkit.cli", "--help")
+
+
+def test_import_footprint():
+    code = (
+        "import sys; before = set(sys.modules); import castepkit.cli; "
+        "print(len(set(sys.modules) - before)); "
+        f"print(*[m for m in {HEAVY!r} if m in sys.modules])"
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    count, heavy = (out.stdout.split("\n") + [""])[:2]
+    assert not heavy.strip(), f"imported at start-up: {heavy}"
+    # The standard library modules of argparse, shlex and pathlib, with some headroom.
+    assert int(count) < 60
+
+
+@pytest.mark.parametrize("command", ["shg", "dens"])
+def test_wrapper_help(benchmark, command):
+    """``castepkit shg --help`` and ``castepkit dens --help``, which import the wrapper."""
+    benchmark(_python, "-m", "castepkit.cli", command, "--help")
+
+
+@pytest.mark.parametrize("command", ["shg", "dens"])
+def test_wrapper_help_footprint(command):
+    code = (
+        "import sys; from castepkit.cli import main\n"
+        f"try:\n    main([{command!r}, '--help'])\nexcept SystemExit:\n    pass\n"
+        f"print(*[m for m in {WRAPPER_HEAVY!r} if m in sys.modules], file=sys.stderr)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    assert not out.stderr.strip(), f"imported by castepkit {command} --help: {out.stderr}"
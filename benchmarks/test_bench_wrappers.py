@@ -0,0 +1,103 @@
+"""
+Throughput and overhead of the wrapper layer, measured on the fake executables of
+:mod:`castepkit.testing` so no Fortran binaries or real calculations are needed.
+
+Usage: pip install pytest-benchmark && python -m pytest benchmarks
+       [--benchmark-compare] [--benchmark-autosave]
+
+Every fake run sleeps 50 ms; the time above ``n_runs * 0.05 s`` (serial) or ``0.05 s``
+(fully parallel) is the orchestration overhead.
+"""
+
+import asyncio
+import shutil
+import subprocess
+from pathlib import Path
+
+from castepkit.pipeline import shg_pipeline
+from castepkit.utils import run_program
+from castepkit.wrappers.shg import arun_shg, run_shg, run_shg_batch
+
+DIRECTIONS = ["111", "123", "131", "222", "231", "333"]
+
+
+def _clean():
+    for d in Path(".").glob("*.shg_runs"):
+        shutil.rmtree(d)
+    for f in [*Path(".").glob("*.chi*"), *Path(".").glob("*.pipeline.json")]:
+        f.unlink()
+
+
+def test_subprocess_baseline(benchmark, fake_env):
+    """Plain ``subprocess.run`` of a fake without any work: the floor for every run."""
+    fake_env(sleep=0)
+    exe = str(Path("..") / "bin" / "fake_shg")
+    stdin = "0.0\n123\n0\n0\n0\n0\n2\n0\n"
+    benchmark(subprocess.run, [exe, "GaAs_Optics"], input=stdin, text=True, capture_output=True)
+
+
+def test_run_program_overhead(benchmark, fake_env):
+    """:func:`run_program` of the same fake: config lookup, rusage and metrics on top."""
+    fake_env(sleep=0)
+    benchmark(run_program, "shg", "0.0\n123\n0\n0\n0\n0\n2\n0\n", ["GaAs_Optics"])
+
+
+def test_run_shg_overhead(benchmark, fake_env):
+    """The full wrapper: input checks, metal detection, output checks."""
+    fake_env(sleep=0)
+    benchmark(run_shg, "GaAs_Optics", direction="123")
+
+
+def test_serial(benchmark, fake_env):
+    benchmark.extra_info["runs"] = len(DIRECTIONS)
+    benchmark.pedantic(
+        run_shg_batch,
+        args=("GaAs_Optics", DIRECTIONS),
+        kwargs=dict(ncores=1, max_workers=1),
+        setup=_clean,
+        rounds=3,
+    )
+
+
+def test_parallel(benchmark, fake_env):
+    benchmark.extra_info["runs"] = len(DIRECTIONS)
+    benchmark.pedantic(
+        run_shg_batch,
+        args=("GaAs_Optics", DIRECTIONS),
+        kwargs=dict(ncores=len(DIRECTIONS), max_workers=len(DIRECTIONS)),
+        setup=_clean,
+        rounds=3,
+    )
+
+
+def test_async_parallel(benchmark, fake_env):
+    async def _all():
+        await asyncio.gather(*(arun_shg("GaAs_Optics", direction=d) for d in DIRECTIONS))
+
+    benchmark.extra_info["runs"] = len(DIRECTIONS)
+    benchmark.pedantic(lambda: asyncio.run(_all()), setup=_clean, rounds=3)
+
+
+def test_cached(benchmark, fake_env, tmp_path):
+    """Every run after the first is a cache hit: hashing inputs and restoring outputs."""
+    fake_env(f'[cache]\nenabled = true\ndir = "{tmp_path / "cache"}"\n', output_size="4MB")
+    run_shg("GaAs_Optics", direction="123")
+    result = benchmark(run_shg, "GaAs_Optics", direction="123")
+    assert result.metrics.cached
+
+
+def test_pipelined(benchmark, fake_env):
+    """atom_cutting -> ome -> 3 x shg -> 2 x weighted_den, with independent steps in parallel."""
+
+    pipe = shg_pipeline("GaAs_Optics", directions=DIRECTIONS[:3], atom_cutting=True, ome=True)
+    benchmark.extra_info["runs"] = len(pipe.nodes)
+    status = benchmark.pedantic(pipe.run, kwargs=dict(force=True), rounds=3)
+    assert set(status.values()) == {"done"}, status
+
+
+def test_pipeline_up_to_date(benchmark, fake_env):
+    """A re-run where every step is up to date: only the mtime checks."""
+    pipe = shg_pipeline("GaAs_Optics", directions=DIRECTIONS[:3], atom_cutting=True, ome=True)
+    pipe.run()
+    status = benchmark(pipe.run)
+    assert set(status.values()) == {"skipped"}
@@ -0,0 +1,250 @@
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+
+from castepkit.analysis.grid import BLOCK, _as_grid
+from castepkit.io.cell import read_cell
+
+__all__ = ["PeriodicCellList", "AtomContributions", "atom_contributions"]
+
+_OFFSETS = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+
+
+def _cell_heights(lattice) -> np.ndarray:
+    """Distance between opposite faces of the cell along each lattice vector."""
+    volume = abs(np.linalg.det(lattice))
+    return np.array(
+        [volume / np.linalg.norm(np.cross(lattice[i - 2], lattice[i - 1])) for i in range(3)]
+    )
+
+
+class PeriodicCellList:
+    """
+    Cell-list index of atoms in a periodic cell.
+
+    The cell is divided into bins at least ``cutoff`` thick along every lattice vector,
+    so all atoms (and periodic images) within ``cutoff`` of a point lie in the 27 bins
+    around it. Queries take points in batches and only compute distances to those
+    candidates, which keeps the cost linear in the number of points for large cells.
+
+    Parameters
+    ----------
+    lattice : array_like
+        (3, 3) lattice vectors as rows.
+    positions : array_like
+        (N, 3) fractional coordinates of the atoms.
+    cutoff : float
+        Bin thickness; the search radius for which the neighbour search is exact.
+    """
+
+    def __init__(self, lattice, positions, cutoff):
+        self.lattice = np.asarray(lattice, dtype=float)
+        self.positions = np.mod(np.asarray(positions, dtype=float), 1.0)
+        self.cutoff = float(cutoff)
+        self.nbins = np.maximum(1, np.floor(_cell_heights(self.lattice) / cutoff)).astype(int)
+        flat = self._bin_of(self.positions)
+        self._order = np.argsort(flat, kind="stable")
+        self._starts = np.searchsorted(flat[self._order], np.arange(np.prod(self.nbins) + 1))
+
+    def _bin_index(self, frac):
+        return np.minimum((np.mod(frac, 1.0) * self.nbins).astype(int), self.nbins - 1)
+
+    def _bin_of(self, frac):
+        return np.ravel_multi_index(self._bin_index(frac).T, self.nbins)
+
+    def candidates(self, bin_index):
+        """Atom indices and Cartesian image positions in the 27 bins around ``bin_index``."""
+        shifted = np.asarray(bin_index) + _OFFSETS
+        wrapped, images = np.mod(shifted, self.nbins), np.floor_divide(shifted, self.nbins)
+        flat = np.ravel_multi_index(wrapped.T, self.nbins)
+        atoms, cart = [], []
+        for b, image in zip(flat, images):
+            idx = self._order[self._starts[b] : self._starts[b + 1]]
+            if idx.size:
+                atoms.append(idx)
+                cart.append((self.positions[idx] + image) @ self.lattice)
+        if not atoms:
+            return np.empty(0, dtype=int), np.empty((0, 3))
+        return np.concatenate(atoms), np.concatenate(cart)
+
+    def _groups(self, frac):
+        """Yield (bin index, point indices) for the points grouped by bin."""
+        bins = self._bin_index(frac)
+        flat = np.ravel_multi_index(bins.T, self.nbins)
+        order = np.argsort(flat, kind="stable")
+        bounds = np.flatnonzero(np.diff(flat[order])) + 1
+        for group in np.split(order, bounds):
+            if group.size:
+                yield bins[group[0]], group
+
+    def _brute_nearest(self, cart):
+        images = (self.positions[None, :, :] + _OFFSETS[:, None, :]).reshape(-1, 3) @ self.lattice
+        d2 = _squared_distances(cart, images)
+        best = np.argmin(d2, axis=1)
+        return best % len(self.positions), np.sqrt(d2[np.arange(len(cart)), best])
+
+    def nearest(self, frac):
+        """
+        Nearest atom of every point, with periodic images.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Atom index and distance for each point.
+        """
+        frac = np.asarray(frac, dtype=float)
+        cart = frac @ self.lattice
+        index = np.full(len(frac), -1)
+        dist = np.full(len(frac), np.inf)
+        for bin_index, group in self._groups(frac):
+            atoms, positions = self.candidates(bin_index)
+            if atoms.size:
+                d2 = _squared_distances(cart[group], positions)
+                best = np.argmin(d2, axis=1)
+                index[group] = atoms[best]
+                dist[group] = np.sqrt(d2[np.arange(len(group)), best])
+        # Only hits within the cutoff are guaranteed to be the nearest atom.
+        far = dist > self.cutoff
+        if far.any():
+            index[far], dist[far] = self._brute_nearest(cart[far])
+        return index, dist
+
+    def within(self, frac, radius):
+        """
+        All (point, atom) pairs closer than ``radius`` (at most the cutoff).
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Point indices and atom indices of the pairs.
+        """
+        if radius > self.cutoff:
+            raise ValueError(f"radius {radius} exceeds the cell-list cutoff {self.cutoff}")
+        frac = np.asarray(frac, dtype=float)
+        cart = frac @ self.lattice
+        points, atoms = [], []
+        for bin_index, group in self._groups(frac):
+            candidates, positions = self.candidates(bin_index)
+            if candidates.size:
+                i, j = np.nonzero(_squared_distances(cart[group], positions) < radius**2)
+                points.append(group[i])
+                atoms.append(candidates[j])
+        if not points:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        return np.concatenate(points), np.concatenate(atoms)
+
+
+def _squared_distances(a, b):
+    """(len(a), len(b)) squared distances without the (n, m, 3) intermediate."""
+    d2 = np.sum(a**2, axis=1)[:, None] - 2.0 * a @ b.T + np.sum(b**2, axis=1)[None, :]
+    return np.maximum(d2, 0.0)
+
+
+@dataclass
+class AtomContributions:
+    """
+    Integrals of a grid assigned to atoms.
+
+    Attributes
+    ----------
+    symbols : list of str
+        Species of every atom.
+    per_atom : np.ndarray
+        Integral assigned to each atom.
+    interstitial : float
+        Integral over points not assigned to any atom (``"sphere"`` method only).
+    total : float
+        Integral over the whole cell.
+    method : str
+        ``"voronoi"`` or ``"sphere"``.
+    radius : float or None
+        Sphere radius of the ``"sphere"`` method.
+    """
+
+    symbols: list
+    per_atom: np.ndarray
+    interstitial: float
+    total: float
+    method: str
+    radius: float = None
+
+    @property
+    def per_species(self) -> dict:
+        """Sum of ``per_atom`` over the atoms of each species, in order of appearance."""
+        result = {}
+        for symbol, value in zip(self.symbols, self.per_atom):
+            result[symbol] = result.get(symbol, 0.0) + float(value)
+        return result
+
+
+def atom_contributions(
+    grid, cell_file, method: str = "voronoi", radius: float = None, block: int = BLOCK
+) -> AtomContributions:
+    """
+    Integrate a grid (e.g. ``{prefix}_veocc.grd``) per atom and per species.
+
+    Parameters
+    ----------
+    grid : Grid or str
+        The grid or the path to a ``.grd`` file.
+    cell_file : str or Path
+        CASTEP ``.cell`` file with the atomic positions. Fractional coordinates are used
+        with the lattice of the grid.
+    method : str
+        ``"voronoi"``: every point belongs to its nearest atom. ``"sphere"``: points
+        within ``radius`` of an atom belong to it; points in overlapping spheres count
+        for every such atom and points outside all spheres are interstitial.
+    radius : float, optional
+        Sphere radius in Angstrom, required for ``"sphere"``.
+    block : int
+        Number of z-planes processed at a time.
+
+    Returns
+    -------
+    AtomContributions
+        The per-atom integrals.
+    """
+    if method not in ("voronoi", "sphere"):
+        raise ValueError(f"Unknown method: {method}")
+    if method == "sphere" and not radius:
+        raise ValueError("The sphere method needs a radius")
+    grid = _as_grid(grid)
+    cell = read_cell(cell_file)
+    natoms = len(cell["symbols"])
+    if method == "sphere":
+        cutoff = radius
+    else:
+        # About one atom per bin.
+        cutoff = (abs(np.linalg.det(grid.lattice)) / natoms) ** (1 / 3)
+    index = PeriodicCellList(grid.lattice, cell["positions"], cutoff)
+
+    nx, ny, nz = grid.shape
+    fx, fy = np.meshgrid(np.arange(nx) / nx, np.arange(ny) / ny, indexing="ij")
+    per_atom = np.zeros(natoms)
+    total = assigned = 0.0
+    for z0, slab in grid.iter_z_slabs(block):
+        k = slab.shape[2]
+        frac = np.empty((nx, ny, k, 3))
+        frac[..., 0], frac[..., 1] = fx[:, :, None], fy[:, :, None]
+        frac[..., 2] = ((z0 + np.arange(k)) / nz)[None, None, :]
+        values = np.asarray(slab, dtype=np.float64).reshape(-1)
+        total += values.sum()
+        if method == "voronoi":
+            atoms, _ = index.nearest(frac.reshape(-1, 3))
+            per_atom += np.bincount(atoms, weights=values, minlength=natoms)
+        else:
+            points, atoms = index.within(frac.reshape(-1, 3), radius)
+            per_atom += np.bincount(atoms, weights=values[points], minlength=natoms)
+            assigned += values[np.unique(points)].sum()
+
+    dv = grid.voxel_volume
+    interstitial = (total - assigned) * dv if method == "sphere" else 0.0
+    return AtomContributions(
+        symbols=list(cell["symbols"]),
+        per_atom=per_atom * dv,
+        interstitial=interstitial,
+        total=total * dv,
+        method=method,
+        radius=radius,
+    )
@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.bands import Bands
+from castepkit.io.weights import write_weights
+
+__all__ = [
+    "energy_window",
+    "band_selection",
+    "expand_weights",
+    "write_band_weights",
+    "parse_indices",
+]
+
+REFERENCES = ("vbm", "cbm", "fermi", "absolute")
+
+
+def _as_bands(bands) -> Bands:
+    return bands if isinstance(bands, Bands) else Bands(bands)
+
+
+def parse_indices(text: str) -> list:
+    """Parse 1-based index lists such as ``"5-9,12"`` into ``[5, 6, 7, 8, 9, 12]``."""
+    indices = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        indices.extend(range(int(first), int(last or first) + 1))
+    return indices
+
+
+def energy_window(bands, emin: float, emax: float, reference: str = "vbm") -> np.ndarray:
+    """
+    Weight 1 for the states with ``emin <= E - E_ref <= emax``, 0 for all others.
+
+    Parameters
+    ----------
+    bands : Bands or str or Path
+        Band structure or ``.bands`` file.
+    emin, emax : float
+        Window in eV relative to the reference energy.
+    reference : {"vbm", "cbm", "fermi", "absolute"}
+        Valence band maximum, conduction band minimum, Fermi energy of the file, or 0.
+
+    Returns
+    -------
+    np.ndarray
+        Weights of shape (nspins, nkpts, nbands).
+    """
+    bands = _as_bands(bands)
+    if reference not in REFERENCES:
+        raise ValueError(f"Unknown reference '{reference}', expected one of {REFERENCES}")
+    if reference in ("vbm", "cbm"):
+        gap = bands.band_gap()
+        ref = gap.vbm if reference == "vbm" else gap.cbm
+    else:
+        ref = bands.efermi if reference == "fermi" else 0.0
+    eig = bands.eigenvalues - ref
+    return ((eig >= emin) & (eig <= emax)).astype(float)
+
+
+def band_selection(bands, band_indices=None, kpoints=None, spins=None) -> np.ndarray:
+    """
+    Weight 1 for the selected bands, k-points and spins, 0 for all others.
+
+    Indices are 1-based as in CASTEP; ``None`` selects all. ``band_indices`` may also be
+    ``"occupied"`` or ``"unoccupied"``, following the electron count.
+
+    Returns
+    -------
+    np.ndarray
+        Weights of shape (nspins, nkpts, nbands).
+    """
+    bands = _as_bands(bands)
+    if isinstance(band_indices, str):
+        if band_indices not in ("occupied", "unoccupied"):
+            raise ValueError(f"Unknown band selection '{band_indices}'")
+        occupied = bands.occupied()
+        return (occupied if band_indices == "occupied" else ~occupied).astype(float)
+    weights = np.zeros((bands.nspins, bands.nkpts, bands.nbands))
+    select = tuple(
+        slice(None) if indices is None else np.asarray(indices) - 1
+        for indices in (spins, kpoints, band_indices)
+    )
+    weights[np.ix_(*(np.arange(n)[s] for n, s in zip(weights.shape, select)))] = 1.0
+    return weights
+
+
+def expand_weights(bands, weights) -> np.ndarray:
+    """
+    Broadcast custom weights to shape (nspins, nkpts, nbands).
+
+    ``weights`` may hold one value per band (nbands,), per k-point and band
+    (nkpts, nbands), or per state (nspins, nkpts, nbands).
+    """
+    bands = _as_bands(bands)
+    shape = (bands.nspins, bands.nkpts, bands.nbands)
+    weights = np.asarray(weights, dtype=float)
+    try:
+        return np.broadcast_to(weights, shape).copy()
+    except ValueError:
+        raise ValueError(f"Cannot use weights of shape {weights.shape} for states {shape}")
+
+
+def write_band_weights(prefix: str, name: str, weights, bands=None) -> Path:
+    """
+    Write a weight file ``{prefix}.{name}`` for :func:`run_weighted_den`.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation; ``{prefix}.bands`` is read unless ``bands``
+        is given.
+    name : str
+        Suffix of the weight file, which also names the weighted_den.x output
+        ``{prefix}_{name}.grd``.
+    weights : array_like
+        Weights, see :func:`expand_weights`; combine selections by multiplying them.
+    bands : Bands, optional
+        Band structure the weights refer to.
+
+    Returns
+    -------
+    Path
+        The weight file.
+    """
+    bands = _as_bands(bands if bands is not None else f"{prefix}.bands")
+    path = write_weights(f"{prefix}.{name}", bands, expand_weights(bands, weights))
+    selected = int(np.count_nonzero(weights))
+    print(f"✅ Wrote {path} ({selected} weighted states)")
+    return path
@@ -0,0 +1,470 @@
+import argparse
+import ast
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.grd import Grid, write_grd
+
+__all__ = [
+    "compile_expression",
+    "evaluate",
+    "integrate",
+    "planar_average",
+    "spherical_average",
+    "downsample",
+    "crop",
+]
+
+# Number of z-planes processed at a time; memory use is bounded by a few such slabs.
+BLOCK = 8
+
+_FUNCS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "maximum": np.maximum,
+    "minimum": np.minimum,
+    "where": np.where,
+}
+_BINOPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+_COMPARE = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+}
+
+
+def _as_grid(grid) -> Grid:
+    return grid if isinstance(grid, Grid) else Grid(grid)
+
+
+def compile_expression(expression: str, names):
+    """
+    Compile an element-wise arithmetic expression over named grids.
+
+    Only numbers, the given names, ``+ - * / **``, comparisons and the functions
+    ``abs sqrt exp log maximum minimum where`` are allowed; anything else raises
+    ``ValueError``. No Python code is executed.
+
+    Parameters
+    ----------
+    expression : str
+        E.g. ``"a - b"`` or ``"a / (a + b)"``.
+    names : iterable of str
+        Names of the grids that may appear in the expression.
+
+    Returns
+    -------
+    callable
+        Function taking a dict of arrays by name and returning the result array.
+    """
+    names = set(names)
+
+    def build(node):
+        if isinstance(node, ast.Expression):
+            return build(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            value = node.value
+            return lambda env: value
+        if isinstance(node, ast.Name):
+            if node.id not in names:
+                raise ValueError(f"Unknown grid '{node.id}' in expression; known: {sorted(names)}")
+            name = node.id
+            return lambda env: env[name]
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            op, left, right = _BINOPS[type(node.op)], build(node.left), build(node.right)
+            return lambda env: op(left(env), right(env))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            sign = -1 if isinstance(node.op, ast.USub) else 1
+            operand = build(node.operand)
+            return lambda env: sign * operand(env)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+            op = _COMPARE[type(node.ops[0])]
+            left, right = build(node.left), build(node.comparators[0])
+            return lambda env: op(left(env), right(env))
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in _FUNCS
+            and not node.keywords
+        ):
+            func, args = _FUNCS[node.func.id], [build(arg) for arg in node.args]
+            return lambda env: func(*(arg(env) for arg in args))
+        raise ValueError(f"Unsupported syntax in expression: {ast.dump(node)}")
+
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as err:
+        raise ValueError(f"Invalid expression '{expression}': {err}") from None
+    return build(tree)
+
+
+def evaluate(expression: str, grids: dict, output, block: int = BLOCK, fill: float = None) -> Path:
+    """
+    Evaluate an element-wise expression over several grids into a new ``.grd`` file.
+
+    Points where the result is not finite (``a / b`` where ``b`` is 0, ``log`` of 0, ...)
+    are written as they are and counted in a printed warning, unless ``fill`` is given.
+
+    Parameters
+    ----------
+    expression : str
+        E.g. ``"veocc - veunocc"``; see :func:`compile_expression`.
+    grids : dict
+        Mapping from name to ``Grid`` or ``.grd`` path. All grids must have the same shape.
+    output : str or Path
+        Output ``.grd`` file; the cell is taken from the first grid.
+    block : int
+        Number of z-planes processed at a time.
+    fill : float, optional
+        Value written instead of NaN and infinities.
+
+    Returns
+    -------
+    Path
+        The output file.
+    """
+    grids = {name: _as_grid(g) for name, g in grids.items()}
+    first = next(iter(grids.values()))
+    for name, grid in grids.items():
+        if grid.shape != first.shape:
+            raise ValueError(f"Grid '{name}' has shape {grid.shape}, expected {first.shape}")
+    func = compile_expression(expression, grids)
+    nonfinite = 0
+
+    def slabs():
+        nonlocal nonfinite
+        iterators = {name: grid.iter_z_slabs(block) for name, grid in grids.items()}
+        for parts in zip(*iterators.values()):
+            env = {
+                name: np.asarray(slab, dtype=np.float64) for name, (_, slab) in zip(grids, parts)
+            }
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result = np.broadcast_to(func(env), parts[0][1].shape)
+            bad = ~np.isfinite(result)
+            count = int(np.count_nonzero(bad))
+            if count and fill is not None:
+                result = np.where(bad, fill, result)
+            nonfinite += count
+            yield result
+
+    write_grd(output, None, first.cell, title=expression, slabs=(first.shape, slabs()))
+    if nonfinite:
+        action = f"set to {fill:g}" if fill is not None else "written as NaN/inf (see --fill)"
+        print(
+            f"❌ {nonfinite} of {first.npoints} points of '{expression}' are not finite; "
+            f"{action}"
+        )
+    return Path(output)
+
+
+def _box_slices(shape, box):
+    if box is None:
+        return tuple(slice(0, n) for n in shape)
+    return tuple(slice(*s.indices(n)[:2]) for s, n in zip(box, shape))
+
+
+def integrate(grid, box=None, block: int = BLOCK) -> float:
+    """
+    Integrate a grid over the cell, or over a box of grid indices.
+
+    Parameters
+    ----------
+    grid : Grid or str
+        The grid or the path to a ``.grd`` file.
+    box : tuple of slice, optional
+        Index ranges along x, y and z, e.g. ``(slice(0, 10), slice(None), slice(5, 20))``.
+    block : int
+        Number of z-planes processed at a time.
+
+    Returns
+    -------
+    float
+        Sum of the values times the volume per grid point.
+    """
+    grid = _as_grid(grid)
+    if box is None:
+        # A stored periodic endpoint repeats the first plane; count it once.
+        box = tuple(slice(0, min(n, m)) for n, m in zip(grid.shape, grid.intervals))
+    sx, sy, sz = _box_slices(grid.shape, box)
+    total = 0.0
+    for z0, slab in grid.iter_z_slabs(block):
+        lo, hi = max(sz.start - z0, 0), min(sz.stop - z0, slab.shape[2])
+        if lo < hi:
+            total += float(np.sum(slab[sx, sy, lo:hi], dtype=np.float64))
+    return total * grid.voxel_volume
+
+
+def planar_average(grid, axis: int = 2, block: int = BLOCK):
+    """
+    Average a grid over the planes perpendicular to ``axis``.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Positions along the lattice vector (in its length unit) and the averages.
+    """
+    grid = _as_grid(grid)
+    profile = np.zeros(grid.shape[axis])
+    other = tuple(i for i in range(3) if i != axis)
+    for z0, slab in grid.iter_z_slabs(block):
+        sums = np.sum(slab, axis=other, dtype=np.float64)
+        if axis == 2:
+            profile[z0 : z0 + slab.shape[2]] += sums
+        else:
+            profile += sums
+    profile /= grid.npoints / grid.shape[axis]
+    length = np.linalg.norm(grid.lattice[axis])
+    return np.arange(grid.shape[axis]) * length / grid.shape[axis], profile
+
+
+def spherical_average(grid, center, rmax: float, nbins: int = 100, block: int = BLOCK):
+    """
+    Radial profile of a grid around a point, using minimum-image distances.
+
+    The minimum image is taken in fractional coordinates, which is exact for ``rmax``
+    below half the shortest cell height.
+
+    Parameters
+    ----------
+    grid : Grid or str
+        The grid or the path to a ``.grd`` file.
+    center : array_like
+        Center in fractional coordinates.
+    rmax : float
+        Largest radius, in the length unit of the cell.
+    nbins : int
+        Number of radial bins.
+    block : int
+        Number of z-planes processed at a time.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Bin centers, the spherical average in every shell and the integral within each
+        radius (cumulative).
+    """
+    grid = _as_grid(grid)
+    nx, ny, nz = grid.shape
+    center = np.asarray(center, dtype=float)
+    edges = np.linspace(0.0, rmax, nbins + 1)
+    sums, counts = np.zeros(nbins), np.zeros(nbins)
+    fx = (np.arange(nx) / nx - center[0])[:, None, None]
+    fy = (np.arange(ny) / ny - center[1])[None, :, None]
+    for z0, slab in grid.iter_z_slabs(block):
+        fz = ((z0 + np.arange(slab.shape[2])) / nz - center[2])[None, None, :]
+        frac = np.stack(np.broadcast_arrays(fx, fy, fz), axis=-1)
+        frac -= np.round(frac)
+        r = np.linalg.norm(frac @ grid.lattice, axis=-1)
+        index = np.searchsorted(edges, r.ravel(), side="right") - 1
+        inside = (index >= 0) & (index < nbins)
+        sums += np.bincount(index[inside], weights=np.ravel(slab)[inside], minlength=nbins)
+        counts += np.bincount(index[inside], minlength=nbins)
+    with np.errstate(invalid="ignore"):
+        average = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+    return (edges[:-1] + edges[1:]) / 2, average, np.cumsum(sums) * grid.voxel_volume
+
+
+def downsample(grid, factor: int, output) -> Path:
+    """
+    Average blocks of ``factor``^3 points into a coarser grid.
+
+    Trailing points that do not fill a whole block are dropped.
+    """
+    grid = _as_grid(grid)
+    nx, ny, nz = (n // factor for n in grid.shape)
+    if min(nx, ny, nz) == 0:
+        raise ValueError(f"Factor {factor} is larger than the grid {grid.shape}")
+
+    def slabs():
+        for z0, slab in grid.iter_z_slabs(factor):
+            if z0 // factor >= nz:
+                break
+            block = np.asarray(slab[: nx * factor, : ny * factor], dtype=np.float64)
+            block = block.reshape(nx, factor, ny, factor, factor).mean(axis=(1, 3, 4))
+            yield block[:, :, None]
+
+    write_grd(
+        output, None, grid.cell, title=f"{grid.title} /{factor}", slabs=((nx, ny, nz), slabs())
+    )
+    return Path(output)
+
+
+def crop(grid, box, output, block: int = BLOCK) -> Path:
+    """
+    Cut a box of grid indices out of a grid.
+
+    The cell lengths of the output are scaled by the fraction of points kept.
+    """
+    grid = _as_grid(grid)
+    sx, sy, sz = _box_slices(grid.shape, box)
+    shape = (sx.stop - sx.start, sy.stop - sy.start, sz.stop - sz.start)
+    if min(shape) <= 0:
+        raise ValueError(f"Empty crop box {box} for grid {grid.shape}")
+    cell = np.array(grid.cell, dtype=float)
+    cell[:3] *= np.array(shape) / np.array(grid.shape)
+
+    def slabs():
+        for z0, slab in grid.iter_z_slabs(block):
+            lo, hi = max(sz.start - z0, 0), min(sz.stop - z0, slab.shape[2])
+            if lo < hi:
+                yield slab[sx, sy, lo:hi]
+
+    write_grd(output, None, cell, title=f"{grid.title} (cropped)", slabs=(shape, slabs()))
+    return Path(output)
+
+
+def _parse_box(text):
+    """Parse ``x0:x1,y0:y1,z0:z1`` (empty bounds allowed) into slices."""
+    if text is None:
+        return None
+    parts = text.split(",")
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError("box must be x0:x1,y0:y1,z0:z1")
+    return tuple(slice(*(int(v) if v else None for v in p.split(":"))) for p in parts)
+
+
+def _parse_named(values):
+    grids = {}
+    for item in values:
+        name, _, path = item.partition("=")
+        if not path:
+            raise argparse.ArgumentTypeError(f"--grid expects NAME=FILE, got {item}")
+        grids[name] = path
+    return grids
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Out-of-core arithmetic and reductions on .grd grids"
+    )
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    # === calc ===
+    p_calc = subparsers.add_parser("calc", help="Element-wise expression over grids")
+    p_calc.add_argument("expression", help="Expression, e.g. 'a - b' or 'a / (a + b)'")
+    p_calc.add_argument(
+        "--grid",
+        action="append",
+        required=True,
+        help="NAME=FILE binding a name in the expression to a .grd file (repeatable)",
+    )
+    p_calc.add_argument("-o", "--output", required=True, help="Output .grd file")
+    p_calc.add_argument(
+        "--fill",
+        type=float,
+        default=None,
+        help="Value for points where the result is NaN or infinite (default: keep them)",
+    )
+
+    # === integrate ===
+    p_int = subparsers.add_parser("integrate", help="Integrate a grid, optionally over a box")
+    p_int.add_argument("file", help=".grd file")
+    p_int.add_argument("--box", default=None, help="Index box x0:x1,y0:y1,z0:z1")
+
+    # === planar ===
+    p_plane = subparsers.add_parser("planar", help="Planar average along a lattice vector")
+    p_plane.add_argument("file", help=".grd file")
+    p_plane.add_argument(
+        "--axis", type=int, choices=[0, 1, 2], default=2, help="Axis (default: %(default)s)"
+    )
+    p_plane.add_argument("-o", "--output", default=None, help="Write the profile to this file")
+
+    # === spherical ===
+    p_sph = subparsers.add_parser("spherical", help="Spherical average around a point")
+    p_sph.add_argument("file", help=".grd file")
+    p_sph.add_argument("--center", required=True, help="Fractional coordinates, e.g. 0,0,0")
+    p_sph.add_argument("--rmax", type=float, required=True, help="Largest radius")
+    p_sph.add_argument(
+        "--nbins", type=int, default=100, help="Number of radial bins (default: %(default)s)"
+    )
+    p_sph.add_argument("-o", "--output", default=None, help="Write the profile to this file")
+
+    # === downsample ===
+    p_down = subparsers.add_parser("downsample", help="Block-average onto a coarser grid")
+    p_down.add_argument("file", help=".grd file")
+    p_down.add_argument("--factor", type=int, default=2, help="Factor (default: %(default)s)")
+    p_down.add_argument("-o", "--output", required=True, help="Output .grd file")
+
+    # === crop ===
+    p_crop = subparsers.add_parser("crop", help="Cut a box of grid indices")
+    p_crop.add_argument("file", help=".grd file")
+    p_crop.add_argument("--box", required=True, help="Index box x0:x1,y0:y1,z0:z1")
+    p_crop.add_argument("-o", "--output", required=True, help="Output .grd file")
+
+    # === atoms ===
+    p_atoms = subparsers.add_parser("atoms", help="Integrate grids per atom and per species")
+    p_atoms.add_argument("files", nargs="+", help=".grd files, e.g. X_veocc.grd X_veunocc.grd")
+    p_atoms.add_argument("--cell", required=True, help="CASTEP .cell file with the positions")
+    p_atoms.add_argument(
+        "--method",
+        choices=["voronoi", "sphere"],
+        default="voronoi",
+        help="Nearest-atom (Voronoi) cells or cutoff spheres (default: %(default)s)",
+    )
+    p_atoms.add_argument(
+        "--radius", type=float, default=None, help="Sphere radius in Angstrom (sphere method)"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.mode == "calc":
+        output = evaluate(args.expression, _parse_named(args.grid), args.output, fill=args.fill)
+        print(f"Wrote {output}")
+
+    elif args.mode == "integrate":
+        print(f"{integrate(args.file, box=_parse_box(args.box)):.8e}")
+
+    elif args.mode == "planar":
+        position, average = planar_average(args.file, axis=args.axis)
+        table = np.column_stack([position, average])
+        if args.output:
+            np.savetxt(args.output, table, header="position average")
+        else:
+            np.savetxt(sys.stdout, table, fmt="%14.6e")
+
+    elif args.mode == "spherical":
+        center = [float(x) for x in args.center.split(",")]
+        r, average, cumulative = spherical_average(args.file, center, args.rmax, args.nbins)
+        table = np.column_stack([r, average, cumulative])
+        if args.output:
+            np.savetxt(args.output, table, header="r average integral")
+        else:
+            np.savetxt(sys.stdout, table, fmt="%14.6e")
+
+    elif args.mode == "downsample":
+        print(f"Wrote {downsample(args.file, args.factor, args.output)}")
+
+    elif args.mode == "crop":
+        print(f"Wrote {crop(args.file, _parse_box(args.box), args.output)}")
+
+    elif args.mode == "atoms":
+        from castepkit.analysis.atoms import atom_contributions
+
+        results = [atom_contributions(f, args.cell, args.method, args.radius) for f in args.files]
+        names = [Path(f).stem for f in args.files]
+        print(f"{'Atom':>6} {'Species':<8}" + "".join(f"{n:>16}" for n in names))
+        for i, symbol in enumerate(results[0].symbols):
+            values = "".join(f"{r.per_atom[i]:16.6e}" for r in results)
+            print(f"{i + 1:>6} {symbol:<8}{values}")
+        print()
+        for symbol in results[0].per_species:
+            values = "".join(f"{r.per_species[symbol]:16.6e}" for r in results)
+            print(f"{'':>6} {symbol:<8}{values}")
+        if args.method == "sphere":
+            print(f"{'':>6} {'(inter)':<8}" + "".join(f"{r.interstitial:16.6e}" for r in results))
+        print(f"{'':>6} {'(total)':<8}" + "".join(f"{r.total:16.6e}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
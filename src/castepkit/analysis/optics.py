@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.cache import parse_size
+from castepkit.io.bands import BOHR_TO_ANGSTROM, HARTREE_TO_EV, Bands, _bin, _kernel
+from castepkit.io.cell import read_cell
+from castepkit.io.fortran import OmeFile
+from castepkit.symmetry import point_group_rotations
+
+__all__ = ["Dielectric", "dielectric", "kramers_kronig"]
+
+# hbar * c in eV cm, for absorption coefficients in 1/cm.
+HBAR_C = 1.973269804e-5
+
+# Upper triangle of the symmetric 3 x 3 tensor.
+_PAIRS = [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]
+
+
+@dataclass
+class Dielectric:
+    """
+    Linear dielectric tensor on an energy grid.
+
+    Attributes
+    ----------
+    energies : np.ndarray
+        Photon energies in eV, evenly spaced from 0.
+    eps2 : np.ndarray
+        Imaginary part, shape (n_energies, 3, 3) in Cartesian components.
+    eps1 : np.ndarray
+        Real part from the Kramers-Kronig transform of ``eps2``, same shape.
+    """
+
+    energies: np.ndarray
+    eps2: np.ndarray
+    eps1: np.ndarray
+
+    @property
+    def average(self) -> np.ndarray:
+        """Orientation average ``eps1 + i eps2`` (a third of the trace), shape (n,)."""
+        return np.trace(self.eps1 + 1j * self.eps2, axis1=1, axis2=2) / 3
+
+    @property
+    def eps_inf(self) -> float:
+        """Average electronic static dielectric constant, ``eps1`` at zero energy."""
+        return float(self.average[0].real)
+
+    @property
+    def refractive_index(self) -> np.ndarray:
+        """Complex refractive index ``n + i kappa`` of the orientation average."""
+        return np.sqrt(self.average)
+
+    @property
+    def absorption(self) -> np.ndarray:
+        """Absorption coefficient ``2 E kappa / (hbar c)`` in 1/cm."""
+        return 2 * self.energies * self.refractive_index.imag / HBAR_C
+
+    def save(self, filename) -> Path:
+        """Write the energies, the averaged ``eps1``/``eps2``, the diagonal of ``eps2`` and
+        the absorption coefficient as text columns."""
+        columns = [self.energies, self.average.real, self.average.imag]
+        columns += [self.eps2[:, i, i] for i in range(3)] + [self.absorption]
+        header = "E(eV) eps1 eps2 eps2_xx eps2_yy eps2_zz alpha(1/cm)"
+        np.savetxt(filename, np.column_stack(columns), fmt="%14.6e", header=header)
+        return Path(filename)
+
+
+def kramers_kronig(energies, eps2, block: int = 512) -> np.ndarray:
+    """
+    Real part of a dielectric function from its imaginary part.
+
+    ``eps1(E) = 1 + 2/pi P int E' eps2(E') / (E'^2 - E^2) dE'``, evaluated with
+    Maclaurin's rule, which sums over the grid points of opposite parity to ``E`` and so
+    never meets the pole. The grid must be evenly spaced from 0 and extend to where
+    ``eps2`` has decayed.
+
+    Parameters
+    ----------
+    energies : array_like
+        Evenly spaced energies starting at 0.
+    eps2 : array_like
+        Imaginary part, shape (n_energies, ...); the trailing axes are transformed
+        independently and the diagonal offset of 1 goes to tensor components
+        ``[..., i, i]`` when the trailing shape is (3, 3).
+    block : int
+        Energies transformed at a time; memory grows as ``block * n_energies``.
+    """
+    energies = np.asarray(energies, dtype=float)
+    eps2 = np.asarray(eps2, dtype=float)
+    n = energies.size
+    step = energies[1] - energies[0]
+    if energies[0] != 0 or not np.allclose(np.diff(energies), step, rtol=1e-6, atol=0):
+        raise ValueError("kramers_kronig() needs evenly spaced energies starting at 0")
+    flat = eps2.reshape(n, -1)
+    eps1 = np.empty_like(flat)
+    index = np.arange(n)
+    for start in range(0, n, block):
+        rows = index[start : start + block, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kernel = 2 * step * energies / (energies**2 - energies[rows] ** 2)
+        kernel[(rows + index) % 2 == 0] = 0.0
+        eps1[start : start + block] = 2 / np.pi * kernel @ flat
+    eps1 = eps1.reshape(eps2.shape)
+    if eps2.shape[1:] == (3, 3):
+        eps1 += np.eye(3)
+    else:
+        eps1 += 1.0
+    return eps1
+
+
+def dielectric(
+    prefix: str,
+    scissors: float = 0.0,
+    sigma: float = 0.1,
+    shape: str = "gaussian",
+    emax: float = None,
+    npoints: int = 2001,
+    max_memory="256MB",
+    ome_file=None,
+    symmetrize: bool = True,
+) -> Dielectric:
+    """
+    Interband dielectric tensor from optical matrix elements and eigenvalues.
+
+    ``eps2_ab(E) = 4 pi^2 / V sum_k w_k sum_vc Re(p^a_vc p^b_cv) delta(E_cv - E) / E_cv^2``
+    with ``E_cv = E_c - E_v``, in atomic units, summed over occupied ``v`` and empty ``c`` of every spin (twice for
+    spin-degenerate calculations). The transitions are processed in chunks of
+    k-points, read from the memory-mapped matrix elements, and every chunk is binned
+    onto the energy grid at once; the histogram is then broadened by convolution, with the
+    anti-resonant term that keeps ``eps2`` odd in energy for the Kramers-Kronig transform.
+
+    The scissors operator shifts every transition up by ``scissors`` while the velocity
+    matrix elements scale with the transition energy, which together amount to a rigid
+    shift of ``eps2``, as with the ``scissors`` of :func:`castepkit.wrappers.shg.run_shg`.
+    Intraband (Drude) terms of metals are not included.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation; reads ``{prefix}.bands`` and ``{prefix}.cst_ome``
+        (or ``{prefix}.ome_bin``).
+    scissors : float
+        Scissors correction in eV.
+    sigma : float
+        Broadening in eV: Gaussian standard deviation or Lorentzian half width.
+    shape : {"gaussian", "lorentzian"}
+        Broadening function.
+    emax : float, optional
+        Highest energy in eV (default: the largest transition plus 5 ``sigma``).
+    npoints : int
+        Number of energies from 0 to ``emax``.
+    max_memory : int or str
+        Bound on the working memory of one chunk of k-points, e.g. ``"1GB"``.
+    ome_file : str or Path, optional
+        Matrix element file to use instead of the default ones.
+    symmetrize : bool
+        Average the tensor over the point group of ``{prefix}.cell``, which is needed
+        when the k-points only cover the irreducible wedge of the Brillouin zone.
+
+    Returns
+    -------
+    Dielectric
+        ``eps2`` and ``eps1`` on the energy grid.
+    """
+    bands = Bands(f"{prefix}.bands")
+    if ome_file is None:
+        candidates = [Path(f"{prefix}.{suffix}") for suffix in ("cst_ome", "ome_bin")]
+        ome_file = next((f for f in candidates if f.is_file()), candidates[0])
+    ome = OmeFile(ome_file, nspins=bands.nspins)
+    if (ome.nkpts, ome.nbands) != (bands.nkpts, bands.nbands):
+        raise ValueError(
+            f"{ome_file} holds {ome.nkpts} k-points x {ome.nbands} bands but "
+            f"{prefix}.bands has {bands.nkpts} x {bands.nbands}"
+        )
+
+    eig = bands.eigenvalues
+    occupied = np.asarray(bands.occupied())
+    # Band windows covering every occupied (v) and empty (c) state at any k-point.
+    nv = int(occupied.sum(-1).max())
+    c0 = int(occupied.sum(-1).min())
+    if emax is None:
+        emax = float((eig[..., c0:].max() - eig[..., :nv].min()) + scissors + 5 * sigma)
+    energies = np.linspace(0.0, emax, npoints)
+    step = energies[1]
+
+    pair_bytes = 8 * (len(_PAIRS) + 8)  # products, transition energies and masks
+    per_kpoint = ome.nspins * (nv * (ome.nbands - c0) * pair_bytes + 48 * ome.nbands**2)
+    chunk = max(1, parse_size(max_memory) // per_kpoint)
+
+    hist = np.zeros((npoints, len(_PAIRS)))
+    elements = ome.elements
+    spin_factor = 2.0 / bands.nspins
+    for k0 in range(0, bands.nkpts, chunk):
+        k1 = min(k0 + chunk, bands.nkpts)
+        # (nk, ns, 3, nv, nc) copied from the memmap; pairs outside the windows are not read.
+        p = np.asarray(elements[k0:k1, :, :, :nv, c0:])
+        e = eig[:, k0:k1].transpose(1, 0, 2)
+        occ = occupied[:, k0:k1].transpose(1, 0, 2)
+        gap = e[..., None, c0:] - e[..., :nv, None]
+        allowed = occ[..., :nv, None] & ~occ[..., None, c0:] & (gap > 1e-6)
+        kweight = np.broadcast_to(bands.weights[k0:k1, None, None, None], gap.shape)[allowed]
+        weight = kweight * spin_factor / gap[allowed] ** 2
+        position = (gap[allowed] + scissors) / step
+        for i, (a, b) in enumerate(_PAIRS):
+            product = (p[:, :, a] * p[:, :, b].conj()).real[allowed]
+            hist[:, i] += _bin(position, weight * product, npoints)
+
+    kernel = _kernel(np.arange(-(npoints - 1), npoints) * step, sigma, shape)
+    shifted = _kernel(np.arange(2 * npoints - 1) * step, sigma, shape)
+    broadened = np.empty_like(hist)
+    for i in range(len(_PAIRS)):
+        resonant = np.convolve(hist[:, i], kernel, mode="valid")
+        # sum_j hist_j kernel(E_i + E_j), with E_i + E_j up to twice the grid.
+        antiresonant = np.correlate(shifted, hist[:, i], "valid")
+        broadened[:, i] = resonant - antiresonant
+
+    volume = abs(np.linalg.det(bands.lattice)) / BOHR_TO_ANGSTROM**3
+    eps2 = np.zeros((npoints, 3, 3))
+    for i, (a, b) in enumerate(_PAIRS):
+        eps2[:, a, b] = eps2[:, b, a] = (
+            4 * np.pi**2 * HARTREE_TO_EV**3 / volume * broadened[:, i]
+        )
+    cell_file = Path(f"{prefix}.cell")
+    if symmetrize and cell_file.is_file():
+        # Fractional positions from the .cell; the Cartesian frame of the .bands lattice.
+        cell = read_cell(cell_file)
+        rotations = point_group_rotations(bands.lattice, cell["positions"], cell["symbols"])
+        eps2 = np.einsum("rai,nij,rbj->nab", rotations, eps2, rotations) / len(rotations)
+    return Dielectric(energies, eps2, kramers_kronig(energies, eps2))
@@ -0,0 +1,455 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from castepkit.config import get_cache_settings, get_exec_path, get_staging_settings
+from castepkit.metrics import record
+from castepkit.utils import ProgramOutput, RunMetrics, arun_program, hash_file, run_program
+
+__all__ = [
+    "parse_size",
+    "cache_key",
+    "run_cached",
+    "arun_cached",
+    "run_steps",
+    "arun_steps",
+    "list_entries",
+    "prune",
+    "clear",
+]
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size) -> int:
+    """Convert a size such as ``20GB``, ``512M`` or ``1024`` to bytes."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    text = str(size).strip().upper().removesuffix("B").removesuffix("I")
+    number = text.rstrip("KMGT")
+    return int(float(number) * _UNITS[text[len(number) :]])
+
+
+# Digests of input files by (path, size, mtime_ns, inode), for this process.
+_DIGESTS = {}
+
+
+def _digest(path, settings) -> str:
+    """
+    SHA-256 of an input file, hashed once per version of the file.
+
+    Multi-GB inputs such as ``.orbitals`` would otherwise be read in full on every
+    lookup. Digests are kept in memory and in ``{cache dir}/digests``, so the child
+    processes of a campaign share them.
+    """
+    st = os.stat(path)
+    ident = [os.path.realpath(path), st.st_size, st.st_mtime_ns, st.st_ino]
+    key = tuple(ident)
+    if key not in _DIGESTS:
+        memo = settings["dir"] / "digests" / hashlib.sha256(json.dumps(ident).encode()).hexdigest()
+        try:
+            digest = memo.read_text().strip()
+        except OSError:
+            digest = ""
+        if len(digest) != 64:
+            digest = hash_file(path)
+            tmp = None
+            try:
+                memo.parent.mkdir(parents=True, exist_ok=True)
+                tmp = _temp_file(memo)
+                tmp.write_text(digest)
+                os.replace(tmp, memo)
+            except OSError:
+                if tmp is not None:
+                    tmp.unlink(missing_ok=True)
+        _DIGESTS[key] = digest
+    return _DIGESTS[key]
+
+
+def cache_key(prog_key, input_str, args, inputs) -> str:
+    """
+    Hash everything that determines the outputs of a wrapper run.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable in the ``[executables]`` config section.
+    input_str : str
+        Text written to the program's stdin.
+    args : list of str
+        Command-line arguments.
+    inputs : list of str or Path
+        Input files; missing files are skipped.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the run.
+    """
+    settings = get_cache_settings()
+    exe = get_exec_path(prog_key)
+    exe_path = shutil.which(exe) or exe
+    # The executables have no version flag, so their size and mtime stand in for it.
+    exe_stat = os.stat(exe_path) if os.path.exists(exe_path) else None
+    record = {
+        "prog": prog_key,
+        "exe": os.path.realpath(exe_path),
+        "exe_version": [exe_stat.st_size, exe_stat.st_mtime_ns] if exe_stat else None,
+        "stdin": input_str,
+        "args": list(args or []),
+        "inputs": {
+            Path(f).name: _digest(f, settings)
+            for f in sorted(map(str, inputs))
+            if Path(f).is_file()
+        },
+    }
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def _snapshot(workdir) -> dict:
+    """Map regular files in ``workdir`` to their (size, mtime) signature."""
+    result = {}
+    for entry in os.scandir(workdir):
+        if entry.is_file(follow_symlinks=False):
+            st = entry.stat(follow_symlinks=False)
+            result[entry.name] = (st.st_size, st.st_mtime_ns)
+    return result
+
+
+def _temp_file(dst) -> Path:
+    """
+    A new empty file next to ``dst`` to be renamed onto it. The name is unique, so threads
+    and processes writing the same ``dst`` at once do not share a temporary file.
+    """
+    dst = Path(dst)
+    fd, name = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".tmp", dir=dst.parent)
+    os.close(fd)
+    return Path(name)
+
+
+def _link_or_copy(src, dst):
+    """Hardlink ``src`` to ``dst``; fall back to a reflink or plain copy across filesystems."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return  # restored by an earlier hit; renaming a link onto itself would be a no-op
+    dst = Path(dst)
+    # os.link needs a free name: link into a private directory, then rename.
+    private = Path(tempfile.mkdtemp(prefix=f".{dst.name}.", suffix=".tmp", dir=dst.parent))
+    tmp = private / dst.name
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            if sys.platform.startswith("linux") and shutil.which("cp"):
+                subprocess.run(["cp", "--reflink=auto", str(src), str(tmp)], check=True)
+            else:
+                shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        shutil.rmtree(private, ignore_errors=True)
+
+
+def _break_links(workdir, keep):
+    """Replace hardlinked files in ``workdir`` by private copies so runs cannot alter the cache."""
+    for entry in os.scandir(workdir):
+        if entry.name in keep or not entry.is_file(follow_symlinks=False):
+            continue
+        if entry.stat(follow_symlinks=False).st_nlink > 1:
+            tmp = _temp_file(entry.path)
+            shutil.copy2(entry.path, tmp)
+            os.replace(tmp, entry.path)
+
+
+def _entry_dir(key, settings=None) -> Path:
+    settings = settings or get_cache_settings()
+    return settings["dir"] / key[:2] / key
+
+
+def _read_meta(entry) -> dict:
+    return json.loads((Path(entry) / "meta.json").read_text())
+
+
+def _write_meta(entry, meta):
+    tmp = _temp_file(Path(entry) / "meta.json")
+    tmp.write_text(json.dumps(meta, indent=2))
+    os.replace(tmp, Path(entry) / "meta.json")
+
+
+def _store(key, prog_key, workdir, files, stdout, stderr, settings):
+    entry = _entry_dir(key, settings)
+    if entry.exists():
+        return
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    # Private to this call: threads of one process may store the same key at once.
+    tmp = Path(tempfile.mkdtemp(prefix=f"{key}.tmp", dir=entry.parent))
+    (tmp / "files").mkdir()
+    for name in files:
+        shutil.copy2(Path(workdir) / name, tmp / "files" / name)
+    now = time.time()
+    meta = {
+        "prog": prog_key,
+        "files": sorted(files),
+        "size": sum((tmp / "files" / name).stat().st_size for name in files),
+        "created": now,
+        "last_used": now,
+        "stdout": stdout,
+        "stderr": stderr,
+    }
+    _write_meta(tmp, meta)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # Another process stored the same result first.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run_cached(
+    prog_key,
+    input_str,
+    args=None,
+    inputs=(),
+    cwd=None,
+    nproc=None,
+    enabled=None,
+    outputs=None,
+    stage=None,
+) -> tuple:
+    """
+    Run an external executable through the on-disk result cache.
+
+    The cache is keyed by :func:`cache_key`. On a hit, the files the cached run created
+    or modified in its working directory are restored into ``cwd`` by hardlink (or
+    reflink/copy across filesystems) and the program is not run. On a miss, the program
+    runs through :func:`castepkit.utils.run_program` and its outputs are stored.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable in the ``[executables]`` config section.
+    input_str : str
+        Text written to the program's stdin.
+    args : list of str, optional
+        Command-line arguments.
+    inputs : list of str or Path
+        Input files (relative to ``cwd``) that determine the result.
+    cwd : str or Path, optional
+        Working directory of the run (default: current directory).
+    nproc : int, optional
+        Number of MPI ranks, overriding the config value.
+    enabled : bool, optional
+        Use the cache; defaults to ``[cache] enabled`` in config (off by default).
+    outputs : list of str, optional
+        Output files the program is expected to write; needed for staging.
+    stage : bool, optional
+        Run in node-local scratch space through :func:`castepkit.staging.run_staged`;
+        defaults to ``[staging] enabled`` in config. Ignored without ``outputs``.
+
+    Returns
+    -------
+    ProgramOutput
+        stdout and stderr of the (possibly cached) run, with its resource usage and input
+        sizes in ``metrics``. The metrics are also appended to the metrics file when
+        enabled (see :func:`castepkit.metrics.record`).
+    """
+    state, hit = _lookup(prog_key, input_str, args, inputs, cwd, enabled)
+    if hit is not None:
+        return hit
+    if stage is None:
+        stage = get_staging_settings()["enabled"]
+    if stage and outputs:
+        from castepkit.staging import run_staged
+
+        output = run_staged(prog_key, input_str, args, inputs, outputs, cwd=cwd, nproc=nproc)
+    else:
+        output = run_program(prog_key, input_str, args, cwd=cwd, nproc=nproc)
+    return _complete(state, output)
+
+
+async def arun_cached(
+    prog_key,
+    input_str,
+    args=None,
+    inputs=(),
+    cwd=None,
+    nproc=None,
+    enabled=None,
+    outputs=None,
+    stage=None,
+):
+    """
+    Async counterpart of :func:`run_cached`, with the same parameters and result.
+
+    The program runs through :func:`castepkit.utils.arun_program`; hashing the inputs and
+    storing or restoring outputs happen in worker threads, off the event loop.
+    """
+    state, hit = await asyncio.to_thread(_lookup, prog_key, input_str, args, inputs, cwd, enabled)
+    if hit is not None:
+        return hit
+    if stage is None:
+        stage = get_staging_settings()["enabled"]
+    if stage and outputs:
+        from castepkit.staging import arun_staged
+
+        output = await arun_staged(prog_key, input_str, args, inputs, outputs, cwd=cwd, nproc=nproc)
+    else:
+        output = await arun_program(prog_key, input_str, args, cwd=cwd, nproc=nproc)
+    return await asyncio.to_thread(_complete, state, output)
+
+
+def run_steps(steps):
+    """
+    Run the programs a wrapper generator asks for, one after another.
+
+    The wrappers are written once as generators that yield :func:`run_cached` keyword
+    arguments and receive the :class:`castepkit.utils.ProgramOutput` back; the value the
+    generator returns is the result. This drives one synchronously, :func:`arun_steps`
+    from an event loop.
+    """
+    with contextlib.closing(steps):
+        call = next(steps)
+        while True:
+            try:
+                call = steps.send(run_cached(**call))
+            except StopIteration as stop:
+                return stop.value
+
+
+async def arun_steps(steps):
+    """Drive a wrapper generator from an event loop, see :func:`run_steps`."""
+    with contextlib.closing(steps):
+        call = next(steps)
+        while True:
+            try:
+                call = steps.send(await arun_cached(**call))
+            except StopIteration as stop:
+                return stop.value
+
+
+def _lookup(prog_key, input_str, args, inputs, cwd, enabled):
+    """
+    First half of :func:`run_cached`: return ``(state, output)``, with the restored output
+    on a cache hit and None when the program has to run.
+    """
+    settings = get_cache_settings()
+    if enabled is None:
+        enabled = settings["enabled"]
+    workdir = Path(cwd or ".")
+    input_bytes = {
+        Path(f).name: (workdir / f).stat().st_size for f in inputs if (workdir / f).is_file()
+    }
+    state = {"enabled": enabled, "input_bytes": input_bytes}
+    if not enabled:
+        return state, None
+
+    start = time.monotonic()
+    key = cache_key(prog_key, input_str, args, [workdir / f for f in inputs])
+    entry = _entry_dir(key, settings)
+    if (entry / "meta.json").is_file():
+        meta = _read_meta(entry)
+        for name in meta["files"]:
+            _link_or_copy(entry / "files" / name, workdir / name)
+        meta["last_used"] = time.time()
+        _write_meta(entry, meta)
+        print(f"♻️  Restored {prog_key} outputs from cache ({key[:12]})")
+        metrics = RunMetrics(
+            prog_key,
+            wall=time.monotonic() - start,
+            params=input_str,
+            input_bytes=input_bytes,
+            cached=True,
+        )
+        record(metrics)
+        return state, ProgramOutput(meta["stdout"], meta["stderr"], metrics)
+
+    input_names = {Path(f).name for f in inputs}
+    _break_links(workdir, input_names)
+    state.update(
+        prog_key=prog_key,
+        key=key,
+        settings=settings,
+        workdir=workdir,
+        input_names=input_names,
+        before=_snapshot(workdir),
+    )
+    return state, None
+
+
+def _complete(state, output):
+    """Second half of :func:`run_cached`: record the metrics and store the outputs."""
+    output.metrics.input_bytes = state["input_bytes"]
+    record(output.metrics)
+    if not state["enabled"]:
+        return output
+    stdout, stderr = output
+    workdir, input_names, before = state["workdir"], state["input_names"], state["before"]
+    after = _snapshot(workdir)
+    outputs = [
+        name
+        for name, sig in after.items()
+        if before.get(name) != sig and name not in input_names and not name.startswith(".")
+    ]
+    # Partial files of a crashed or timed-out run must not be replayed.
+    if outputs and output.metrics.returncode == 0:
+        settings = state["settings"]
+        _store(state["key"], state["prog_key"], workdir, outputs, stdout, stderr, settings)
+        prune(settings["max_size"])
+    return output
+
+
+def list_entries(cache_dir=None) -> list:
+    """Return ``(key, meta)`` pairs of all cache entries, most recently used first."""
+    cache_dir = Path(cache_dir or get_cache_settings()["dir"])
+    entries = []
+    for meta_file in cache_dir.glob("*/*/meta.json"):
+        if ".tmp" in meta_file.parent.name:
+            continue  # an entry still being stored
+        try:
+            entries.append((meta_file.parent.name, json.loads(meta_file.read_text())))
+        except (OSError, ValueError):
+            continue
+    return sorted(entries, key=lambda item: item[1]["last_used"], reverse=True)
+
+
+def prune(max_size=None, older_than=None, cache_dir=None) -> int:
+    """
+    Evict least-recently-used entries.
+
+    Parameters
+    ----------
+    max_size : int or str, optional
+        Keep the total size of the cache below this bound, e.g. ``"20GB"``.
+    older_than : float, optional
+        Also evict entries unused for more than this many days.
+    cache_dir : str or Path, optional
+        Cache directory (default: from config).
+
+    Returns
+    -------
+    int
+        Number of evicted entries.
+    """
+    cache_dir = Path(cache_dir or get_cache_settings()["dir"])
+    limit = parse_size(max_size) if max_size is not None else None
+    cutoff = time.time() - older_than * 86400 if older_than is not None else None
+
+    total, evicted = 0, 0
+    for key, meta in list_entries(cache_dir):
+        total += meta["size"]
+        expired = cutoff is not None and meta["last_used"] < cutoff
+        if expired or (limit is not None and total > limit):
+            shutil.rmtree(cache_dir / key[:2] / key, ignore_errors=True)
+            total -= meta["size"]
+            evicted += 1
+    return evicted
+
+
+def clear(cache_dir=None) -> int:
+    """Remove all cache entries and return how many were removed."""
+    return prune(max_size=0, cache_dir=cache_dir)
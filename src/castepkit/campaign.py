@@ -0,0 +1,366 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import toml
+
+from castepkit.sizing import NCORES_ENV
+
+__all__ = ["Job", "Journal", "load_manifest", "run_campaign", "TASKS"]
+
+# Tasks a campaign job can run, with the wrapper call they stand for.
+TASKS = {
+    "shg": "run_shg(prefix, **params)",
+    "tensor": "run_shg_tensor(prefix, **params)",
+    "dens": "run_shg(prefix, band_resolved=1, ...) + run_weighted_den_batch on veocc/veunocc",
+    "pipeline": "shg_pipeline(prefix, **params).run()",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    task TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    returncode INTEGER,
+    started REAL,
+    finished REAL,
+    elapsed REAL,
+    outputs TEXT,
+    log TEXT
+)
+"""
+
+
+@dataclass
+class Job:
+    """
+    One wrapper call of a campaign.
+
+    Attributes
+    ----------
+    dir : str
+        Absolute path of the directory the job runs in.
+    prefix : str
+        Prefix of the CASTEP calculation.
+    task : str
+        One of :data:`TASKS`.
+    params : dict
+        Keyword arguments of the task.
+    """
+
+    dir: str
+    prefix: str
+    task: str = "shg"
+    params: dict = field(default_factory=dict)
+
+    @property
+    def id(self) -> str:
+        """Stable identifier; editing a job in the manifest makes it a new job."""
+        record = [self.dir, self.prefix, self.task, self.params]
+        return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_manifest(path) -> list:
+    """
+    Read a campaign manifest.
+
+    The manifest is a TOML file with optional ``[defaults]`` shared by all jobs and a list
+    of ``[[jobs]]`` tables::
+
+        [defaults]
+        task = "dens"
+        scissors = 0.8
+
+        [[jobs]]
+        dir = "GaAs"
+        prefix = "GaAs_Optics"
+
+        [[jobs]]
+        dirs = "materials/*"      # one job per matching directory
+        prefix = "{name}_Optics"  # {name} is the directory name
+        direction = "333"
+
+    ``dir``/``dirs`` are relative to the manifest; all other keys are task parameters.
+
+    Returns
+    -------
+    list of Job
+        The expanded jobs, in manifest order.
+    """
+    path = Path(path)
+    data = toml.load(path)
+    defaults = data.get("defaults", {})
+    jobs = []
+    for i, entry in enumerate(data.get("jobs", [])):
+        params = {**defaults, **entry}
+        task = params.pop("task", "shg")
+        if task not in TASKS:
+            raise ValueError(
+                f"Job {i} in {path}: unknown task '{task}', expected one of {list(TASKS)}"
+            )
+        if "prefix" not in params:
+            raise ValueError(f"Job {i} in {path} has no prefix")
+        prefix = params.pop("prefix")
+        pattern = params.pop("dirs", None)
+        single = params.pop("dir", ".")
+        dirs = sorted(glob.glob(str(path.parent / pattern))) if pattern else [path.parent / single]
+        for d in dirs:
+            d = Path(d).resolve()
+            if d.is_dir():
+                jobs.append(Job(str(d), prefix.format(name=d.name), task, params))
+    return jobs
+
+
+class Journal:
+    """
+    SQLite record of the state, timings, exit code and outputs of every campaign job.
+
+    The journal may be updated from the worker threads of a campaign; writes are
+    serialized by a lock.
+
+    Parameters
+    ----------
+    path : str or Path
+        Database file; created when missing.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self.conn:
+            self.conn.execute(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, jobs) -> None:
+        """Record new jobs as pending; jobs already in the journal keep their state."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (id, dir, prefix, task, params) VALUES (?, ?, ?, ?, ?)",
+                [(j.id, j.dir, j.prefix, j.task, json.dumps(j.params)) for j in jobs],
+            )
+            # Jobs left running by an interrupted campaign start over.
+            self.conn.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+
+    def state(self, job_id) -> str:
+        row = self.conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["state"] if row else None
+
+    def start(self, job_id, log) -> None:
+        """Mark a job as running; called when a worker picks it up."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, started = ?, "
+                "finished = NULL, elapsed = NULL, returncode = NULL, log = ? WHERE id = ?",
+                (time.time(), str(log), job_id),
+            )
+
+    def finish(self, job_id, returncode, elapsed, outputs) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, returncode = ?, finished = ?, elapsed = ?, outputs = ? "
+                "WHERE id = ?",
+                (
+                    "done" if returncode == 0 else "failed",
+                    returncode,
+                    time.time(),
+                    elapsed,
+                    json.dumps(outputs),
+                    job_id,
+                ),
+            )
+
+    def rows(self, state=None) -> list:
+        query, args = "SELECT * FROM jobs", ()
+        if state:
+            query, args = query + " WHERE state = ?", (state,)
+        return [dict(row) for row in self.conn.execute(query + " ORDER BY started", args)]
+
+    def summary(self) -> dict:
+        """Job counts per state plus throughput of the finished jobs."""
+        counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        row = self.conn.execute(
+            "SELECT MIN(started), MAX(finished), AVG(elapsed), COUNT(*) FROM jobs "
+            "WHERE state IN ('done', 'failed')"
+        ).fetchone()
+        first, last, mean, nfinished = row
+        span = (last - first) if first is not None and last is not None else 0.0
+        return {
+            "counts": counts,
+            "total": sum(counts.values()),
+            "mean_elapsed": mean,
+            "throughput": nfinished / span * 3600 if span > 0 else None,
+        }
+
+
+def _new_files(directory, since) -> list:
+    """Regular files directly in ``directory`` modified at or after ``since``."""
+    result = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.stat().st_mtime >= since:
+            result.append(entry.path)
+    return sorted(result)
+
+
+def _run_job(job, log, ncores) -> tuple:
+    """Run ``job`` in a child Python process; return (returncode, elapsed, outputs)."""
+    cmd = [sys.executable, "-m", "castepkit.campaign", job.task, job.prefix, json.dumps(job.params)]
+    # Runs sized with nproc = "auto" share the machine with the other jobs.
+    env = {**os.environ, NCORES_ENV: str(ncores)}
+    start = time.time()
+    with open(log, "w") as f:
+        returncode = subprocess.run(
+            cmd,
+            cwd=job.dir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=f,
+            stderr=subprocess.STDOUT,
+        ).returncode
+    elapsed = time.time() - start
+    # Truncate to whole seconds for filesystems with coarse timestamps.
+    outputs = [f for f in _new_files(job.dir, int(start)) if Path(f) != Path(log)]
+    return returncode, elapsed, outputs
+
+
+def run_campaign(manifest, journal=None, max_workers=None, retry_failed=False) -> dict:
+    """
+    Run all jobs of a manifest that have not finished yet.
+
+    Jobs run from a pool of at most ``max_workers`` concurrent child processes, each in
+    its own directory with output in ``castepkit_campaign_<id>.log``. Every state change
+    is written to the journal, so an interrupted campaign resumes with the jobs that did
+    not finish.
+
+    Parameters
+    ----------
+    manifest : str or Path
+        Manifest file, see :func:`load_manifest`.
+    journal : str or Path, optional
+        SQLite journal (default: ``<manifest>.journal.sqlite``).
+    max_workers : int, optional
+        Maximum number of jobs running at the same time (default: number of cores). MPI
+        ranks per job come from the config as usual; with ``nproc = "auto"`` each job is
+        sized for its share of the cores.
+    retry_failed : bool
+        Also re-run jobs that failed before.
+
+    Returns
+    -------
+    dict
+        Number of jobs ``done``, ``failed`` and ``skipped`` (finished before) in this run.
+    """
+    manifest = Path(manifest)
+    journal = Journal(journal or manifest.with_name(manifest.name + ".journal.sqlite"))
+    jobs = load_manifest(manifest)
+    journal.add(jobs)
+    todo_states = ("pending", "failed") if retry_failed else ("pending",)
+    todo = [job for job in jobs if journal.state(job.id) in todo_states]
+    result = {"done": 0, "failed": 0, "skipped": len(jobs) - len(todo)}
+    print(f"Campaign {manifest.name}: {len(jobs)} jobs, {len(todo)} to run")
+
+    running = {}
+    max_workers = max_workers or os.cpu_count() or 1
+    ncores = max(1, (os.cpu_count() or 1) // min(max_workers, max(1, len(todo))))
+
+    def run(job):
+        # Journalled by the worker, so queued jobs stay pending until they start.
+        log = Path(job.dir) / f"castepkit_campaign_{job.id}.log"
+        journal.start(job.id, log)
+        return _run_job(job, log, ncores)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for job in todo:
+                running[pool.submit(run, job)] = job
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    returncode, elapsed, outputs = future.result()
+                    journal.finish(job.id, returncode, elapsed, outputs)
+                    if returncode == 0:
+                        result["done"] += 1
+                        print(f"✅ {job.dir} [{job.task}] done in {elapsed:.1f} s")
+                    else:
+                        result["failed"] += 1
+                        print(f"❌ {job.dir} [{job.task}] failed with exit code {returncode}")
+    finally:
+        journal.close()
+    return result
+
+
+def _check_shg(result):
+    """Exit non-zero when an SHG run failed; its exit code is not raised by ``run_shg``."""
+    returncode = result.metrics.returncode if result.metrics else None
+    if returncode:
+        raise SystemExit(f"❌ SHG {result.direction} exited with code {returncode}")
+    if not result.spectrum_file.is_file():
+        raise SystemExit(f"❌ SHG {result.direction} did not write {result.spectrum_file}")
+
+
+def _task(task, prefix, params):
+    """Run one task in the current directory (the body of a campaign child process)."""
+    if task == "shg":
+        from castepkit.wrappers.shg import run_shg
+
+        _check_shg(run_shg(prefix, **params))
+    elif task == "tensor":
+        from castepkit.wrappers.shg import run_shg_tensor
+
+        run_shg_tensor(prefix, **params)
+    elif task == "dens":
+        from castepkit.wrappers.shg import run_shg
+        from castepkit.wrappers.weighted_dens import run_weighted_den_batch
+
+        batch = {
+            k: params.pop(k) for k in ("output_format", "ncores", "max_workers") if k in params
+        }
+        _check_shg(run_shg(prefix, **{**params, "band_resolved": 1}))
+        weights = {s: f"{prefix}.shg_weight_{s}" for s in ("veocc", "veunocc")}
+        missing = [w for w in weights.values() if not Path(w).is_file()]
+        if missing:
+            raise SystemExit(f"❌ SHG did not write the weight files {missing}")
+        outputs = run_weighted_den_batch(prefix, weights, cache=params.get("cache"), **batch)
+        missing = [str(r.output_file) for r in outputs.values() if not r.output_file.is_file()]
+        if missing:
+            raise SystemExit(f"❌ weighted_den.x did not write {missing}")
+    elif task == "pipeline":
+        from castepkit.pipeline import shg_pipeline
+
+        max_workers = params.pop("max_workers", None)
+        status = shg_pipeline(prefix, **params).run(max_workers=max_workers)
+        if any(s in ("failed", "blocked") for s in status.values()):
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run one campaign task in the current directory (used by run_campaign)"
+    )
+    parser.add_argument("task", choices=list(TASKS), help="Task to run")
+    parser.add_argument("prefix", help="Prefix of the CASTEP calculation")
+    parser.add_argument("params", nargs="?", default="{}", help="Task parameters as JSON")
+    args = parser.parse_args()
+    _task(args.task, args.prefix, json.loads(args.params))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,889 @@
+"""
+Command-line entry point ``castepkit``.
+
+Only the standard library is imported here: every command imports what it needs when it
+runs, and the wrapper commands (``castepkit shg``, ``castepkit dens``, ...) hand their
+arguments to the ``main()`` of a module listed in :data:`WRAPPERS`, which is imported
+only when that command is used. ``castepkit --help`` and simple commands therefore start
+as fast as the interpreter, and ``--batch FILE`` runs many invocations in one process so
+that numpy and the wrappers are imported once.
+"""
+
+import argparse
+import importlib
+import os
+import shlex
+import sys
+import time
+from pathlib import Path
+
+__all__ = ["WRAPPERS", "main", "run", "run_batch"]
+
+# Commands implemented by the wrapper modules: name -> (module, console script, help).
+WRAPPERS = {
+    "shg": (
+        "castepkit.wrappers.shg",
+        "castepkit-shg",
+        "Run NewSHG_ZY-XTIPC.x (single, batch, tensor, sweep)",
+    ),
+    "dens": (
+        "castepkit.wrappers.weighted_dens",
+        "castepkit-dens",
+        "Run weighted_den.x and build weight files",
+    ),
+    "cut": ("castepkit.wrappers.atom_cutting", "castepkit-cut", "Run atom_cutting_impi_XTIPC"),
+    "ome": ("castepkit.wrappers.ome", "castepkit-ome", "Run calculate_ome_impi_XTIPC"),
+    "grid": (
+        "castepkit.analysis.grid",
+        "castepkit-grid",
+        "Arithmetic and reductions on .grd grids",
+    ),
+}
+
+# Leading options shared by every command; the last occurrence wins.
+_GLOBAL_OPTIONS = {
+    "--profile": "profile",
+    "-C": "directory",
+    "--directory": "directory",
+    "--batch": "batch",
+}
+
+
+def _format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def cmd_cache(args):
+    from castepkit.cache import clear, list_entries, parse_size, prune
+    from castepkit.config import get_cache_settings
+
+    settings = get_cache_settings()
+    cache_dir = args.dir or settings["dir"]
+
+    if args.action == "info":
+        entries = list_entries(cache_dir)
+        total = sum(meta["size"] for _, meta in entries)
+        print(f"Cache directory : {cache_dir}")
+        print(f"Enabled         : {settings['enabled']}")
+        print(f"Entries         : {len(entries)}")
+        print(
+            f"Size            : {_format_size(total)} / {_format_size(parse_size(settings['max_size']))}"
+        )
+
+    elif args.action == "list":
+        for key, meta in list_entries(cache_dir):
+            last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta["last_used"]))
+            print(f"{key[:12]}  {meta['prog']:<14} {_format_size(meta['size']):>10}  {last_used}")
+
+    elif args.action == "prune":
+        max_size = args.max_size if args.max_size is not None else settings["max_size"]
+        evicted = prune(max_size=max_size, older_than=args.older_than, cache_dir=cache_dir)
+        print(f"Evicted {evicted} cache entries.")
+
+    elif args.action == "clear":
+        print(f"Removed {clear(cache_dir)} cache entries.")
+
+
+def cmd_config(args):
+    from castepkit import config
+    from castepkit.config import (
+        get_env_vars,
+        get_exec_path,
+        get_nproc,
+        get_profile,
+        get_threads,
+        load_config,
+        use_mpi,
+    )
+
+    load_config()  # raises ValueError if the file does not validate
+    path = config.CONFIG_PATH
+    print(f"Config file : {path} ({'found' if path.is_file() else 'not found'})")
+    print(f"Profile     : {get_profile() or '-'}")
+    for name in args.exe or ["shg", "weighted_den", "ome", "atom_cutting"]:
+        mpi = f"mpirun -n {get_nproc(name)}" if use_mpi(name) else "no MPI"
+        threads = get_threads(name)
+        print(f"[{name}] {get_exec_path(name)} ({mpi}, threads={threads or '-'})")
+        for key, value in get_env_vars(name).items():
+            print(f"    {key}={value}")
+
+
+def cmd_pipeline(args):
+    from castepkit.pipeline import shg_pipeline
+
+    pipe = shg_pipeline(
+        args.prefix,
+        directions=args.directions.split(","),
+        atom_cutting=args.atom_cutting,
+        ome=args.ome,
+        density=not args.no_density,
+        wden_format=args.wden_format,
+        check=args.check,
+        scissors=args.scissors,
+        unit=args.unit,
+        is_metal=args.is_metal,
+        energy_range=args.energy_range,
+    )
+    status = pipe.run(max_workers=args.max_workers, force=args.force, dry_run=args.dry_run)
+    if any(s in ("failed", "blocked") for s in status.values()):
+        raise SystemExit(1)
+
+
+def cmd_campaign(args):
+    from castepkit.campaign import Journal, run_campaign
+
+    if args.action == "run":
+        result = run_campaign(
+            args.manifest,
+            journal=args.journal,
+            max_workers=args.max_workers,
+            retry_failed=args.retry_failed,
+        )
+        print(f"Done: {result['done']}, failed: {result['failed']}, skipped: {result['skipped']}")
+        if result["failed"]:
+            raise SystemExit(1)
+        return
+
+    manifest = Path(args.manifest)
+    path = args.journal or (
+        manifest
+        if manifest.suffix == ".sqlite"
+        else manifest.with_name(manifest.name + ".journal.sqlite")
+    )
+    if not Path(path).is_file():
+        raise SystemExit(f"❌ No campaign journal at {path}")
+    journal = Journal(path)
+    summary = journal.summary()
+    print(f"Journal    : {path}")
+    print(f"Jobs       : {summary['total']}")
+    for state in ("done", "failed", "running", "pending"):
+        print(f"  {state:<9}: {summary['counts'].get(state, 0)}")
+    if summary["mean_elapsed"] is not None:
+        print(f"Mean time  : {summary['mean_elapsed']:.1f} s per job")
+    if summary["throughput"] is not None:
+        print(f"Throughput : {summary['throughput']:.1f} jobs/hour")
+    failed = journal.rows("failed")
+    if failed:
+        print("Failures:")
+        for row in failed:
+            print(f"  {row['dir']} [{row['task']}] exit {row['returncode']}, log: {row['log']}")
+    journal.close()
+
+
+def cmd_stats(args):
+    from castepkit.metrics import load_metrics, summarize
+
+    records = load_metrics(args.file)
+    if args.prog:
+        records = [r for r in records if r["prog"] == args.prog]
+    if not records:
+        print("No metrics recorded (enable them with [metrics] enabled = true).")
+        return
+    by = tuple(args.by.split(","))
+    rows = summarize(records, by=by)
+    # Parameters are the stdin lines of the run, shown joined by '|'.
+    labels = [[str(row[key]).strip().replace("\n", "|") for key in by] for row in rows]
+    widths = [max(len(key), *(len(lab[i]) for lab in labels)) + 2 for i, key in enumerate(by)]
+    header = "".join(f"{key:<{w}}" for key, w in zip(by, widths))
+    print(
+        f"{header}{'runs':>6}{'cached':>8}{'failed':>8}{'wall mean':>12}{'wall max':>12}"
+        f"{'cpu mean':>12}{'peak RSS':>12}{'eff.':>7}"
+    )
+    for row, label in zip(rows, labels):
+        keys = "".join(f"{text:<{w}}" for text, w in zip(label, widths))
+        line = f"{keys}{row['runs']:>6}{row['cached']:>8}{row['failed']:>8}"
+        if row["runs"]:
+            eff = f"{row['efficiency']:.2f}" if row["efficiency"] is not None else "-"
+            line += (
+                f"{row['wall_mean']:>11.1f}s{row['wall_max']:>11.1f}s{row['cpu_mean']:>11.1f}s"
+                f"{_format_size(row['rss_max']):>12}{eff:>7}"
+            )
+        print(line)
+
+
+def cmd_size(args):
+    from castepkit.sizing import plan_ranks, problem_size
+
+    size = problem_size(args.prefix)
+    grid = "x".join(map(str, size["grid"])) if size["grid"] else "unknown"
+    print(
+        f"{args.prefix}: {size['nkpts']} k-points x {size['nspins']} spins, "
+        f"{size['nbands']} bands, {size['natoms'] or '?'} atoms, grid {grid}"
+    )
+    for prog in args.prog:
+        plan = plan_ranks(prog, args.prefix, ncores=args.ncores, concurrent=args.concurrent)
+        predicted = f", ~{plan.predicted_cpu:.0f} CPU s" if plan.predicted_cpu else ""
+        print(
+            f"  {prog:<18} mpirun -n {plan.nproc:<4} OMP_NUM_THREADS={plan.threads:<3} "
+            f"({plan.reason}{predicted})"
+        )
+
+
+def cmd_inspect(args):
+    try:
+        _inspect(Path(args.file), args.records)
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+
+def _inspect(path, nrecords):
+    from castepkit.io.fortran import FortranFile, OrbitalsFile, check_ome, read_ome
+
+    bands = path.with_suffix(".bands")
+    if path.suffix in (".cst_ome", ".ome_bin"):
+        ome = read_ome(path)
+        print(f"{path}: {ome.header}")
+        print(f"  {ome.nkpts} k-points x {ome.nspins} spins x {ome.nbands} bands")
+        if bands.is_file():
+            try:
+                check_ome(path, bands)
+                print(f"✅ Matches {bands}")
+            except ValueError as e:
+                print(f"❌ {e}")
+    elif path.suffix == ".orbitals":
+        orbitals = OrbitalsFile(path)
+        npw = [orbitals.nplanewaves(k) for k in range(orbitals.nkpts)]
+        print(
+            f"{path}: {orbitals.nkpts} k-points x {orbitals.nspins} spins x {orbitals.nbands} bands"
+        )
+        print(f"  {min(npw)}-{max(npw)} plane waves per k-point")
+    else:
+        records = FortranFile(path)
+        lengths = records.index[:, 1]
+        print(f"{path}: {len(records)} records, {_format_size(int(lengths.sum()))} of data")
+        for i, length in enumerate(lengths[:nrecords].tolist()):
+            print(f"  record {i:<6} {length:>12} bytes")
+
+
+def _minutes(seconds) -> str:
+    return f"{seconds / 60:.1f} min" if seconds is not None else "?"
+
+
+def cmd_queue(args):
+    from castepkit import jobqueue
+    from castepkit.config import get_queue_settings
+
+    path = Path(args.socket or get_queue_settings()["socket"])
+    cores = int(args.cores) if args.cores and args.cores.isdigit() else args.cores
+    if args.action == "start" and not args.detach:
+        try:
+            jobqueue.QueueServer(path, cores).run()
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            raise SystemExit(f"❌ {e}")
+        return
+
+    if args.action == "start":
+        import subprocess
+
+        command = [sys.executable, "-m", "castepkit.cli", "queue", "start", "--socket", str(path)]
+        command += ["--cores", args.cores] if args.cores else []
+        log = Path(args.log or path.with_suffix(".log"))
+        with open(log, "a") as f:
+            proc = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=f,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        deadline = time.monotonic() + 10
+        while jobqueue.queue_status(path) is None:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit(f"❌ The queue daemon did not start; see {log}")
+            time.sleep(0.1)
+        print(f"✅ Queue daemon (pid {proc.pid}) listening on {path}, log: {log}")
+        return
+
+    if args.action == "stop":
+        try:
+            stopped = jobqueue.stop_daemon(path)
+        except PermissionError as e:
+            raise SystemExit(f"❌ {e}")
+        if not stopped:
+            raise SystemExit(f"❌ No queue daemon at {path}")
+        print(f"✅ Stopped the queue daemon at {path}")
+        return
+
+    status = jobqueue.queue_status(path)
+    if status is None:
+        raise SystemExit(f"❌ No queue daemon at {path}")
+    now = time.time()
+    up = (now - status["since"]) / 3600
+    print(f"Daemon  : {path} (pid {status['pid']}, up {up:.1f} h)")
+    print(
+        f"Cores   : {len(status['free'])} of {len(status['cores'])} free "
+        f"({jobqueue.format_cores(status['cores'])})"
+    )
+    print(f"Running : {len(status['running'])}")
+    for job in status["running"]:
+        elapsed = _minutes(now - job["started"])
+        print(
+            f"  #{job['id']:<5} {job['user']:<10} {job['prog']:<14} {job['ncores']:>4} cores "
+            f"on {jobqueue.format_cores(job['cores']):<10} {elapsed}, est. "
+            f"{_minutes(job['estimate'])}  {job['cwd']}"
+        )
+    print(f"Queued  : {len(status['queued'])}")
+    for job in status["queued"]:
+        print(
+            f"  {job['position']:>3}. #{job['id']:<5} {job['user']:<10} {job['prog']:<14} "
+            f"{job['ncores']:>4} cores  ETA {_minutes(job['eta'])}  {job['cwd']}"
+        )
+
+
+def cmd_optics(args):
+    import numpy as np
+
+    from castepkit.analysis.optics import dielectric
+
+    result = dielectric(
+        args.prefix,
+        scissors=args.scissors,
+        sigma=args.sigma,
+        shape=args.shape,
+        emax=args.emax,
+        npoints=args.npoints,
+    )
+    eps = result.average
+    peak = int(np.argmax(eps.imag))
+    onset = np.flatnonzero(result.absorption > args.onset)
+    print(f"{args.prefix}: eps_inf = {result.eps_inf:.3f}, n = {np.sqrt(result.eps_inf):.3f}")
+    print(f"  eps2 peak {eps.imag[peak]:.2f} at {result.energies[peak]:.2f} eV")
+    if onset.size:
+        print(f"  absorption above {args.onset:g}/cm from {result.energies[onset[0]]:.2f} eV")
+    output = result.save(args.output or f"{args.prefix}.eps")
+    print(f"✅ Wrote {output}")
+
+
+def cmd_array(args):
+    from castepkit import jobarray
+
+    if args.action == "run":
+        if args.index is None:
+            raise SystemExit("❌ array run needs the array directory and a task index")
+        if jobarray.run_bundle(args.target, args.index):
+            raise SystemExit(1)
+        return
+    if args.action == "collect":
+        summary = jobarray.collect(args.target)
+        if summary["failed"] or summary["missing"]:
+            raise SystemExit(1)
+        return
+
+    sweep = None
+    if args.target.endswith(".toml"):
+        from castepkit.campaign import load_manifest
+
+        jobs = load_manifest(args.target)
+    else:
+        from castepkit.wrappers.shg import SWEEP_PARAMETERS, parse_values
+
+        parameters = {
+            name: parse_values(getattr(args, name), float if name == "scissors" else int)
+            for name in SWEEP_PARAMETERS
+            if getattr(args, name) is not None
+        }
+        if parameters:
+            jobs, sweep = jobarray.sweep_jobs(args.target, parameters, direction=args.direction)
+        else:
+            directions = args.directions.split(",") if args.directions else [args.direction]
+            jobs = jobarray.direction_jobs(args.target, directions)
+    try:
+        submit = jobarray.write_array(
+            jobs,
+            directory=args.dir,
+            scheduler=args.scheduler,
+            node_cores=args.node_cores,
+            task_cores=args.task_cores,
+            name=args.name,
+            directives=args.directive,
+            template=args.template,
+            sweep=sweep,
+        )
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    spec = jobarray.load_array(submit.parent)
+    print(
+        f"✅ Wrote {submit}: {len(jobs)} jobs in {spec['count']} array tasks "
+        f"of {spec['node_cores']} cores, {spec['task_cores']} per job"
+    )
+    if args.submit:
+        import subprocess
+
+        raise SystemExit(subprocess.run(["bash", str(submit)]).returncode)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="castepkit", description="CASTEPKIT command-line tools", allow_abbrev=False
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Named [profiles.<name>] config overrides to use",
+    )
+    parser.add_argument(
+        "-C",
+        "--directory",
+        default=None,
+        help="Run the command in this directory",
+    )
+    parser.add_argument(
+        "--batch",
+        default=None,
+        metavar="FILE",
+        help="Run one command per line of FILE (- for stdin) in this process",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    # === wrappers: parsed by their own modules, see run() ===
+    for name, (_, script, text) in WRAPPERS.items():
+        subparsers.add_parser(name, help=f"{text} (also {script})", add_help=False)
+
+    # === cache ===
+    p_cache = subparsers.add_parser("cache", help="Inspect and prune the result cache")
+    p_cache.add_argument(
+        "action",
+        choices=["info", "list", "prune", "clear"],
+        help="info: summary, list: entries, prune: LRU eviction, clear: remove all",
+    )
+    p_cache.add_argument("--dir", default=None, help="Cache directory (default: from config)")
+    p_cache.add_argument(
+        "--max_size",
+        default=None,
+        help="Size bound for prune, e.g. 5GB (default: [cache] max_size)",
+    )
+    p_cache.add_argument(
+        "--older_than",
+        type=float,
+        default=None,
+        help="For prune: also evict entries unused for this many days",
+    )
+    p_cache.set_defaults(func=cmd_cache)
+
+    # === config ===
+    p_config = subparsers.add_parser("config", help="Validate and show the effective config")
+    p_config.add_argument(
+        "exe",
+        nargs="*",
+        help="Executables to show (default: all wrappers)",
+    )
+    p_config.set_defaults(func=cmd_config)
+
+    # === pipeline ===
+    p_pipe = subparsers.add_parser(
+        "pipeline", help="Run atom_cutting -> ome -> shg -> weighted_den, skipping up-to-date steps"
+    )
+    p_pipe.add_argument("prefix", help="Prefix of the CASTEP calculation")
+    p_pipe.add_argument(
+        "--directions",
+        default="123",
+        help="Comma-separated SHG directions; the first drives the weighted densities "
+        "(default: %(default)s)",
+    )
+    p_pipe.add_argument("--atom_cutting", action="store_true", help="Run atom_cutting first")
+    p_pipe.add_argument("--ome", action="store_true", help="Run ome to produce .cst_ome")
+    p_pipe.add_argument("--no_density", action="store_true", help="Skip the weighted_den.x steps")
+    p_pipe.add_argument(
+        "--scissors",
+        type=float,
+        default=0.0,
+        help="Scissors correction in eV (default: %(default)s)",
+    )
+    p_pipe.add_argument(
+        "--unit",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="Output unit: 0=pm/V, 1=esu (default: %(default)s)",
+    )
+    p_pipe.add_argument(
+        "--is_metal",
+        type=int,
+        choices=[1, 2],
+        default=None,
+        help="Is metallic? 1=yes, 2=no (default: detect from the .bands file)",
+    )
+    p_pipe.add_argument(
+        "--energy_range",
+        type=int,
+        choices=[0, 1, 2],
+        default=0,
+        help="Energy range type: 0/1/2 (default: %(default)s)",
+    )
+    p_pipe.add_argument(
+        "--wden_format",
+        type=int,
+        choices=[1, 2, 3],
+        default=3,
+        help="weighted_den.x output format: 1=.pot, 2=.check, 3=.grd (default: %(default)s)",
+    )
+    p_pipe.add_argument(
+        "--check",
+        choices=["mtime", "hash"],
+        default="mtime",
+        help="How to decide a step is up to date (default: %(default)s)",
+    )
+    p_pipe.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="Maximum number of steps running at the same time",
+    )
+    p_pipe.add_argument("--force", action="store_true", help="Re-run all steps")
+    p_pipe.add_argument("--dry_run", action="store_true", help="Only show what would run")
+    p_pipe.set_defaults(func=cmd_pipeline)
+
+    # === campaign ===
+    p_camp = subparsers.add_parser(
+        "campaign", help="Run a manifest of jobs with a resumable SQLite journal"
+    )
+    p_camp.add_argument(
+        "action",
+        choices=["run", "status"],
+        help="run: run unfinished jobs, status: summarize the journal",
+    )
+    p_camp.add_argument("manifest", help="Campaign manifest (TOML), or the journal for status")
+    p_camp.add_argument(
+        "--journal", default=None, help="SQLite journal (default: <manifest>.journal.sqlite)"
+    )
+    p_camp.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="Maximum number of jobs running at the same time (default: number of cores)",
+    )
+    p_camp.add_argument(
+        "--retry_failed", action="store_true", help="Also re-run jobs that failed before"
+    )
+    p_camp.set_defaults(func=cmd_campaign)
+
+    # === stats ===
+    p_stats = subparsers.add_parser("stats", help="Summarize recorded run metrics")
+    p_stats.add_argument(
+        "--file", default=None, help="Metrics file, JSONL or CSV (default: [metrics] file)"
+    )
+    p_stats.add_argument(
+        "--by",
+        default="prog,params",
+        help="Comma-separated fields to group by: prog, params, nproc (default: %(default)s)",
+    )
+    p_stats.add_argument("--prog", default=None, help="Only show this executable")
+    p_stats.set_defaults(func=cmd_stats)
+
+    # === size ===
+    p_size = subparsers.add_parser(
+        "size", help='Show the MPI ranks nproc = "auto" picks for a calculation'
+    )
+    p_size.add_argument("prefix", help="Prefix of the CASTEP calculation (with .bands)")
+    p_size.add_argument(
+        "--prog",
+        nargs="+",
+        default=["shg", "weighted_den", "ome", "atom_cutting"],
+        help="Executables to size (default: %(default)s)",
+    )
+    p_size.add_argument("--ncores", type=int, default=None, help="Cores available")
+    p_size.add_argument(
+        "--concurrent", type=int, default=1, help="Number of jobs sharing the cores"
+    )
+    p_size.set_defaults(func=cmd_size)
+
+    # === optics ===
+    p_optics = subparsers.add_parser(
+        "optics", help="Linear dielectric function from .cst_ome and .bands, for triage"
+    )
+    p_optics.add_argument("prefix", help="Prefix of the CASTEP calculation")
+    p_optics.add_argument(
+        "--scissors", type=float, default=0.0, help="Scissors correction in eV (default: 0)"
+    )
+    p_optics.add_argument(
+        "--sigma", type=float, default=0.1, help="Broadening in eV (default: %(default)s)"
+    )
+    p_optics.add_argument(
+        "--shape",
+        choices=["gaussian", "lorentzian"],
+        default="gaussian",
+        help="Broadening function (default: %(default)s)",
+    )
+    p_optics.add_argument(
+        "--emax", type=float, default=None, help="Highest energy in eV (default: all transitions)"
+    )
+    p_optics.add_argument(
+        "--npoints", type=int, default=2001, help="Number of energies (default: %(default)s)"
+    )
+    p_optics.add_argument(
+        "--onset",
+        type=float,
+        default=1e4,
+        help="Absorption coefficient in 1/cm that defines the onset (default: %(default)g)",
+    )
+    p_optics.add_argument("--output", default=None, help="Output table (default: {prefix}.eps)")
+    p_optics.set_defaults(func=cmd_optics)
+
+    # === queue ===
+    p_queue = subparsers.add_parser(
+        "queue", help="Local job-queue daemon sharing the cores of a workstation"
+    )
+    p_queue.add_argument(
+        "action",
+        choices=["start", "status", "stop"],
+        help="start: run the daemon, status: running and queued jobs, stop: shut it down",
+    )
+    p_queue.add_argument(
+        "--cores",
+        default=None,
+        help="Core budget of the daemon: a count or ids such as 0-15,32-47 "
+        "(default: [queue] cores, else all cores)",
+    )
+    p_queue.add_argument(
+        "--socket", default=None, help="Socket of the daemon (default: [queue] socket)"
+    )
+    p_queue.add_argument(
+        "--detach", action="store_true", help="For start: run the daemon in the background"
+    )
+    p_queue.add_argument(
+        "--log", default=None, help="Log of a detached daemon (default: <socket>.log)"
+    )
+    p_queue.set_defaults(func=cmd_queue)
+
+    # === array ===
+    p_array = subparsers.add_parser(
+        "array", help="Write Slurm/PBS job-array scripts for many wrapper calls"
+    )
+    p_array.add_argument(
+        "action",
+        choices=["write", "run", "collect"],
+        help="write: write the scripts, run: run one array task, collect: merge the results",
+    )
+    p_array.add_argument(
+        "target",
+        help="For write: a campaign manifest (.toml) or the prefix of a calculation; "
+        "for run and collect: the array directory",
+    )
+    p_array.add_argument("index", nargs="?", type=int, help="For run: the array task index")
+    p_array.add_argument(
+        "--direction", default="123", help="SHG direction of a prefix (default: %(default)s)"
+    )
+    p_array.add_argument(
+        "--directions", default=None, help="One job per direction, e.g. 111,123,333"
+    )
+    p_array.add_argument(
+        "--scissors", default=None, help="Sweep scissors in eV: start:stop:step or a,b,c"
+    )
+    p_array.add_argument("--energy_range", default=None, help="Sweep energy range types")
+    p_array.add_argument("--is_metal", default=None, help="Sweep metallic flags")
+    p_array.add_argument(
+        "--scheduler",
+        choices=["slurm", "pbs"],
+        default="slurm",
+        help="Batch system (default: %(default)s)",
+    )
+    p_array.add_argument(
+        "--node_cores", type=int, default=None, help="Cores per node (default: this machine's)"
+    )
+    p_array.add_argument(
+        "--task_cores",
+        type=int,
+        default=None,
+        help="Cores per job (default: the node's cores shared by all jobs)",
+    )
+    p_array.add_argument(
+        "--dir",
+        default="castepkit_array",
+        help="Directory for scripts, task directories and logs (default: %(default)s)",
+    )
+    p_array.add_argument("--name", default="castepkit", help="Job name (default: %(default)s)")
+    p_array.add_argument(
+        "--directive",
+        action="append",
+        default=[],
+        help="Extra scheduler option in its own syntax, repeatable, e.g. --directive=--time=2:00:00",
+    )
+    p_array.add_argument("--template", default=None, help="Custom array-script template")
+    p_array.add_argument(
+        "--submit", action="store_true", help="Run the generated submit.sh right away"
+    )
+    p_array.set_defaults(func=cmd_array)
+
+    # === inspect ===
+    p_inspect = subparsers.add_parser(
+        "inspect", help="Show the dimensions of a .cst_ome, .ome_bin or .orbitals file"
+    )
+    p_inspect.add_argument("file", help="Fortran unformatted file")
+    p_inspect.add_argument(
+        "--records",
+        type=int,
+        default=10,
+        help="Record lengths to list for other files (default: %(default)s)",
+    )
+    p_inspect.set_defaults(func=cmd_inspect)
+
+    return parser
+
+
+def _split(argv):
+    """Leading global options as a dict, and the command with its arguments."""
+    options = {}
+    i = 0
+    while i < len(argv):
+        token = argv[i]
+        name, eq, value = token.partition("=")
+        if token.startswith("-C") and len(token) > 2:
+            name, eq, value = "-C", "=", token[2:]
+        if name not in _GLOBAL_OPTIONS:
+            break
+        if not eq:
+            if i + 1 == len(argv):
+                break
+            i += 1
+            value = argv[i]
+        options[_GLOBAL_OPTIONS[name]] = value
+        i += 1
+    return options, argv[i:]
+
+
+def run(argv, profile=None) -> None:
+    """
+    Run one ``castepkit`` invocation in this process.
+
+    Parameters
+    ----------
+    argv : list of str
+        Command-line arguments without the program name, e.g. ``["shg", "GaAs_Optics"]``.
+    profile : str, optional
+        Config profile to use unless the arguments select one with ``--profile``.
+
+    Raises
+    ------
+    SystemExit
+        When the command fails or the arguments do not parse, as on the command line.
+    """
+    argv = list(argv)
+    options, rest = _split(argv)
+    if "batch" in options:
+        raise SystemExit("❌ --batch cannot be nested")
+    if rest and rest[0] in WRAPPERS:
+        command = importlib.import_module(WRAPPERS[rest[0]][0]).main
+        prog = f"castepkit {rest[0]}"
+
+        def target():
+            command(rest[1:], prog=prog)
+
+    else:
+        parser = _parser()
+        args = parser.parse_args(argv)
+        if args.batch is not None:
+            parser.error("--batch cannot be combined with a command")
+        if args.command is None:
+            parser.error("a command or --batch FILE is required")
+
+        def target():
+            args.func(args)
+
+    from castepkit.config import get_profile, set_profile
+
+    profile = options.get("profile", profile)
+    cwd = os.getcwd()
+    # Restored whatever the command did: a wrapper's own --profile selects it globally.
+    previous = get_profile()
+    if profile is not None:
+        set_profile(profile)
+    try:
+        if options.get("directory"):
+            os.chdir(options["directory"])
+        target()
+    finally:
+        os.chdir(cwd)
+        set_profile(previous)
+
+
+def run_batch(lines, profile=None, name="batch") -> int:
+    """
+    Run one ``castepkit`` invocation per line, all in this process.
+
+    Lines are split like a shell would; blank lines and ``#`` comments are skipped and a
+    leading ``castepkit`` or console script name (``castepkit-shg``, ...) is accepted, so
+    existing command lists run unchanged. A failing line is reported and the remaining
+    lines still run.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Commands, e.g. the lines of a file.
+    profile : str, optional
+        Config profile for the lines that do not select one with ``--profile``.
+    name : str
+        Source of the lines, used in messages.
+
+    Returns
+    -------
+    int
+        Number of lines that failed.
+    """
+    scripts = {script: command for command, (_, script, _) in WRAPPERS.items()}
+    failed = total = 0
+    for number, line in enumerate(lines, 1):
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError as e:
+            tokens = None
+            error = str(e)
+        else:
+            if not tokens:
+                continue
+            if tokens[0] == "castepkit":
+                tokens = tokens[1:]
+            elif tokens[0] in scripts:
+                tokens[0] = scripts[tokens[0]]
+            error = None
+        total += 1
+        if tokens is not None:
+            try:
+                run(tokens, profile=profile)
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    error = e.code if isinstance(e.code, str) else f"exit status {e.code}"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        if error is not None:
+            failed += 1
+            print(f"❌ {name}:{number}: {line.strip()}: {error}", file=sys.stderr)
+        sys.stdout.flush()
+    if failed:
+        print(f"❌ {failed} of {total} commands failed", file=sys.stderr)
+    else:
+        print(f"✅ {total} commands done")
+    return failed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    options, rest = _split(argv)
+    if "batch" not in options:
+        run(argv)
+        return
+    if rest:
+        _parser().error("--batch cannot be combined with a command")
+    cwd = os.getcwd()
+    if options.get("directory"):
+        os.chdir(options["directory"])
+    try:
+        if options["batch"] == "-":
+            failed = run_batch(sys.stdin, options.get("profile"), name="<stdin>")
+        else:
+            with open(options["batch"]) as f:
+                failed = run_batch(f, options.get("profile"), name=options["batch"])
+    finally:
+        os.chdir(cwd)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
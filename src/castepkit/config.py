@@ -1,39 +1,233 @@
+import copy
 import os
+import tempfile
+import threading
 from pathlib import Path
 
 import toml
-from platformdirs import user_config_dir
+from platformdirs import user_cache_dir, user_config_dir
 
 CONFIG_PATH = Path(user_config_dir("castepkit")) / "config.toml"
+CACHE_DIR = Path(user_cache_dir("castepkit")) / "results"
+METRICS_FILE = Path(user_cache_dir("castepkit")) / "metrics.jsonl"
+# Private to the user unless [queue] socket points a shared daemon elsewhere.
+QUEUE_SOCKET = (
+    Path(os.environ["XDG_RUNTIME_DIR"]) / "castepkit-queue.sock"
+    if os.environ.get("XDG_RUNTIME_DIR")
+    else Path(tempfile.gettempdir()) / f"castepkit-queue-{os.getuid()}.sock"
+)
 
-__all__ = ["load_config", "get_exec_path", "use_mpi", "get_nproc", "get_env_vars"]
+__all__ = [
+    "load_config",
+    "validate_config",
+    "set_profile",
+    "get_profile",
+    "get_exec_path",
+    "use_mpi",
+    "get_nproc",
+    "get_threads",
+    "get_env_vars",
+    "get_cache_settings",
+    "get_run_settings",
+    "get_metrics_settings",
+    "get_staging_settings",
+    "get_queue_settings",
+]
+
+# Allowed keys and value types of the global sections. ``None`` means a free-form table
+# whose values must all be strings.
+_SCHEMA = {
+    "executables": None,
+    "environment": None,
+    "mpirun": {"enabled": bool, "nproc": (int, str)},
+    "cache": {"enabled": bool, "dir": str, "max_size": (int, str)},
+    "run": {"stream": bool, "log_dir": str, "timeout": (int, float), "max_concurrent": int},
+    "metrics": {"enabled": bool, "file": str},
+    "staging": {"enabled": bool, "dir": str, "workers": int, "reserve": (int, str)},
+    "queue": {
+        "enabled": bool,
+        "socket": str,
+        "cores": (int, str),
+        "owner": (int, str),
+        "timeout": (int, float),
+    },
+}
+_SCALARS = {"threads": (int, str)}
+
+# Keys of a per-executable section such as ``[shg]`` or ``[profiles.big.shg]``.
+_TOOL_SCHEMA = {
+    "mpirun": {"enabled": bool, "nproc": (int, str)},
+    "environment": None,
+}
+_TOOL_SCALARS = {"threads": (int, str)}
+
+# Keys that also take "auto" to size each run from its calculation, see castepkit.sizing.
+_AUTO_KEYS = ("nproc", "threads")
+
+_lock = threading.Lock()
+_loaded = {"key": None, "data": {}, "views": {}}
+_profile = {"name": None}
+
+
+def _check_table(table, schema, path):
+    if not isinstance(table, dict):
+        raise ValueError(f"[{path}] must be a table")
+    for key, value in table.items():
+        if schema is None:
+            if not isinstance(value, str):
+                raise ValueError(f"{path}.{key} must be a string")
+            continue
+        if key not in schema:
+            raise ValueError(f"Unknown key '{key}' in [{path}]; expected one of {sorted(schema)}")
+        # bool is a subclass of int, so it must be rejected explicitly for numeric keys.
+        if (
+            not isinstance(value, schema[key])
+            or (isinstance(value, bool) and schema[key] is not bool)
+            or (key in _AUTO_KEYS and isinstance(value, str) and value != "auto")
+        ):
+            raise ValueError(f"{path}.{key} has invalid value {value!r}")
+
+
+def _check_tool(table, path):
+    if not isinstance(table, dict):
+        raise ValueError(f"Unknown setting '{path}'")
+    for key, value in table.items():
+        if key in _TOOL_SCHEMA:
+            _check_table(value, _TOOL_SCHEMA[key], f"{path}.{key}")
+        elif key in _TOOL_SCALARS:
+            _check_table({key: value}, _TOOL_SCALARS, path)
+        else:
+            raise ValueError(
+                f"Unknown key '{key}' in [{path}]; expected one of "
+                f"{sorted(_TOOL_SCHEMA) + sorted(_TOOL_SCALARS)}"
+            )
+
+
+def _check_layer(layer, path=""):
+    for key, value in layer.items():
+        where = f"{path}{key}"
+        if key in _SCHEMA:
+            _check_table(value, _SCHEMA[key], where)
+        elif key in _SCALARS:
+            _check_table({key: value}, _SCALARS, path.rstrip(".") or "root")
+        else:
+            _check_tool(value, where)
+
+
+def validate_config(config: dict) -> None:
+    """
+    Validate a parsed config file, raising ``ValueError`` on the first problem.
+
+    Besides the global sections (``[executables]``, ``[mpirun]``, ``[environment]``,
+    ``[cache]``, ``[run]`` and a top-level ``threads``), every other table is a
+    per-executable section with ``mpirun``, ``environment`` and ``threads`` keys, e.g.
+    ``[shg.mpirun]``. ``[profiles.<name>]`` tables may override any of these.
+    """
+    config = dict(config)
+    profiles = config.pop("profiles", {})
+    _check_layer(config)
+    if not isinstance(profiles, dict):
+        raise ValueError("[profiles] must be a table")
+    for name, profile in profiles.items():
+        if not isinstance(profile, dict):
+            raise ValueError(f"[profiles.{name}] must be a table")
+        _check_layer(profile, f"profiles.{name}.")
 
 
 def load_config():
-    if CONFIG_PATH.is_file():
-        return toml.load(CONFIG_PATH)
-    return {}
+    """
+    Load and validate the config file.
+
+    The parsed file is cached and only re-read when its modification time or size
+    changes, so the lookups below do not hit the filesystem for every call.
+    """
+    try:
+        st = CONFIG_PATH.stat()
+        key = (str(CONFIG_PATH), st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = (str(CONFIG_PATH), None, None)
+    with _lock:
+        if _loaded["key"] != key:
+            data = toml.load(CONFIG_PATH) if key[1] is not None else {}
+            validate_config(data)
+            _loaded.update(key=key, data=data, views={})
+        return _loaded["data"]
+
+
+def set_profile(name) -> None:
+    """Select the named ``[profiles.<name>]`` overrides (None for no profile)."""
+    _profile["name"] = name
+
+
+def get_profile():
+    """Name of the active profile: set with :func:`set_profile` or ``$CASTEPKIT_PROFILE``."""
+    return _profile["name"] or os.environ.get("CASTEPKIT_PROFILE") or None
+
+
+def _merge(base, override):
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = _merge(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def _view(name=None) -> dict:
+    """
+    Effective settings for executable ``name`` under the active profile.
+
+    Layers are applied in the order: global sections, profile global sections, the
+    ``[name]`` section and the ``[profiles.<profile>.name]`` section.
+    """
+    config = load_config()
+    profile = get_profile()
+    key = (profile, name)
+    views = _loaded["views"]
+    if key in views:
+        return views[key]
+
+    profiles = config.get("profiles", {})
+    if profile is not None and profile not in profiles:
+        raise ValueError(f"Unknown profile '{profile}'; available: {sorted(profiles)}")
+    layers = [config] + ([profiles[profile]] if profile else [])
+
+    view = {}
+    for layer in layers:
+        view = _merge(view, {k: v for k, v in layer.items() if k in _SCHEMA or k in _SCALARS})
+    if name is not None:
+        for layer in layers:
+            view = _merge(view, layer.get(name, {}))
+    views[key] = view
+    return view
 
 
 def get_exec_path(name: str) -> str:
     """Get path to external executable."""
-    config = load_config()
-    return config.get("executables", {}).get(name, name)
+    return _view().get("executables", {}).get(name, name)
 
 
-def use_mpi() -> bool:
-    config = load_config()
-    return config.get("mpirun", {}).get("enabled", False)
+def use_mpi(name: str = None) -> bool:
+    return _view(name).get("mpirun", {}).get("enabled", False)
 
 
-def get_nproc() -> int:
-    config = load_config()
-    return config.get("mpirun", {}).get("nproc", 1)
+def get_nproc(name: str = None):
+    """Number of MPI ranks, or ``"auto"`` to size them per run (see :mod:`castepkit.sizing`)."""
+    return _view(name).get("mpirun", {}).get("nproc", 1)
 
 
-def get_env_vars() -> dict:
-    config = load_config()
-    env_section = config.get("environment", {})
+def get_threads(name: str = None):
+    """
+    Number of OpenMP threads per rank, ``"auto"`` to fill the cores left by the MPI ranks,
+    or None to leave ``OMP_NUM_THREADS`` alone.
+    """
+    return _view(name).get("threads")
+
+
+def get_env_vars(name: str = None) -> dict:
+    view = _view(name)
+    env_section = view.get("environment", {})
 
     result = {}
     for key, value in env_section.items():
@@ -42,4 +236,70 @@ def get_env_vars() -> dict:
             current = os.environ.get("LD_LIBRARY_PATH", "")
             value = value + (":" + current if current else "")
         result[key] = value
+    if view.get("threads") not in (None, "auto"):
+        result["OMP_NUM_THREADS"] = str(view["threads"])
     return result
+
+
+def get_cache_settings() -> dict:
+    """Get the ``[cache]`` settings with defaults filled in."""
+    section = _view().get("cache", {})
+    return {
+        "enabled": section.get("enabled", False),
+        "dir": Path(section.get("dir", CACHE_DIR)).expanduser(),
+        "max_size": section.get("max_size", "20GB"),
+    }
+
+
+def get_run_settings() -> dict:
+    """Get the ``[run]`` settings (output streaming, logs, timeout) with defaults filled in."""
+    section = _view().get("run", {})
+    return {
+        "stream": section.get("stream", False),
+        "log_dir": section.get("log_dir", None),
+        "timeout": section.get("timeout", None),
+        "max_concurrent": section.get("max_concurrent", None),
+    }
+
+
+def get_metrics_settings() -> dict:
+    """Get the ``[metrics]`` settings (per-run resource records) with defaults filled in."""
+    section = _view().get("metrics", {})
+    return {
+        "enabled": section.get("enabled", False),
+        "file": Path(section.get("file", METRICS_FILE)).expanduser(),
+    }
+
+
+def _default_scratch() -> str:
+    """``$TMPDIR`` when set, else ``/dev/shm`` when present, else the system temp dir."""
+    if os.environ.get("TMPDIR"):
+        return os.environ["TMPDIR"]
+    if Path("/dev/shm").is_dir():
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def get_staging_settings() -> dict:
+    """Get the ``[staging]`` settings (node-local scratch runs) with defaults filled in."""
+    section = _view().get("staging", {})
+    scratch = os.path.expandvars(section.get("dir", "")) or _default_scratch()
+    return {
+        "enabled": section.get("enabled", False),
+        "dir": Path(scratch).expanduser(),
+        "workers": section.get("workers", 4),
+        "reserve": section.get("reserve", "1GB"),
+    }
+
+
+def get_queue_settings() -> dict:
+    """Get the ``[queue]`` settings (local job-queue daemon) with defaults filled in."""
+    section = _view().get("queue", {})
+    socket = os.path.expandvars(section.get("socket", "")) or QUEUE_SOCKET
+    return {
+        "enabled": section.get("enabled", False),
+        "socket": Path(socket).expanduser(),
+        "cores": section.get("cores", None),
+        "owner": section.get("owner", None),
+        "timeout": section.get("timeout", None),
+    }
@@ -0,0 +1,396 @@
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.sidecar import is_fresh, save_sidecar, source_stamp
+
+__all__ = ["read_bands_header", "read_bands", "Bands", "BandGap"]
+
+BOHR_TO_ANGSTROM = 0.529177210903
+HARTREE_TO_EV = 27.211386245988
+
+_HEADER_KEYS = {
+    "number of k-points": ("nkpts", int),
+    "number of spin components": ("nspins", int),
+    "number of electrons": ("nelectrons", float),
+    "number of eigenvalues": ("nbands", int),
+    "fermi energy (in atomic units)": ("efermi", float),
+    "fermi energies (in atomic units)": ("efermi", float),
+}
+
+
+def read_bands_header(filename) -> dict:
+    """
+    Read the header of a CASTEP ``.bands`` file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the ``.bands`` file.
+
+    Returns
+    -------
+    dict
+        ``nkpts``, ``nspins``, ``nelectrons`` (array, per spin channel when the file
+        lists them separately), ``nbands`` (eigenvalues per
+        k-point and spin), ``efermi`` (Hartree, array with one value per spin channel),
+        ``lattice`` (3, 3) in Angstrom with vectors as rows, and ``offset``, the position
+        of the first k-point block.
+    """
+    header = {}
+    offset = 0
+    # Binary mode, so that ``offset`` counts bytes whatever the line endings.
+    with Path(filename).open("rb") as f:
+        for raw in iter(f.readline, b""):
+            offset += len(raw)
+            line = raw.decode()
+            lower = line.lower()
+            if lower.startswith("unit cell vectors"):
+                rows = [f.readline() for _ in range(3)]
+                offset += sum(len(row) for row in rows)
+                header["lattice"] = (
+                    np.array([row.split()[:3] for row in rows], dtype=float) * BOHR_TO_ANGSTROM
+                )
+                break
+            for text, (key, kind) in _HEADER_KEYS.items():
+                if lower.startswith(text):
+                    header[key] = [kind(x) for x in line[len(text) :].split()]
+    missing = [key for key, _ in _HEADER_KEYS.values() if key not in header]
+    if missing or "lattice" not in header:
+        raise ValueError(f"Malformed .bands header in {filename}: missing {missing or 'lattice'}")
+    nspins = header["nspins"][0]
+    if len(set(header["nbands"])) != 1:
+        raise ValueError(f"Different numbers of bands per spin in {filename} are not supported")
+    return {
+        "nkpts": header["nkpts"][0],
+        "nspins": nspins,
+        "nelectrons": np.array(header["nelectrons"]),
+        "nbands": header["nbands"][0],
+        "efermi": np.resize(header["efermi"], nspins),
+        "lattice": header["lattice"],
+        "offset": offset,
+    }
+
+
+# Columns of a parsed table before the values: k-point index, position of the block in
+# the file, kx, ky, kz and weight.
+_LEADING = 6
+
+
+def _parse(text, header, filename, scale=HARTREE_TO_EV) -> np.ndarray:
+    """
+    Parse the k-point blocks into one row per k-point, sorted by k-point index: the
+    index, the 0-based position of the block in the file, ``kx, ky, kz, weight``, then
+    the values of every spin channel times ``scale`` (eigenvalues in eV by default).
+    """
+    nk, ns, nb = header["nkpts"], header["nspins"], header["nbands"]
+    # Blanking the labels leaves a flat list of numbers: per k-point its index,
+    # coordinates and weight, then per spin the spin index and the eigenvalues.
+    body = text.replace("K-point", " ").replace("Spin component", " ")
+    with warnings.catch_warnings():
+        # Older numpy warns and stops at a non-numeric token, newer numpy raises.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(body, sep=" ")
+        except ValueError:
+            values = np.empty(0)
+    width = 5 + ns * (1 + nb)
+    if values.size != nk * width:
+        raise ValueError(
+            f"Malformed file {filename}: expected {nk} k-points with {ns} x {nb} "
+            f"eigenvalues ({nk * width} numbers), found {values.size} numbers"
+        )
+    rows = values.reshape(nk, width)
+    order = np.argsort(rows[:, 0], kind="stable")
+    rows = rows[order]
+    table = np.empty((nk, _LEADING + ns * nb))
+    table[:, 0] = rows[:, 0]
+    table[:, 1] = order
+    table[:, 2:_LEADING] = rows[:, 1:5]
+    eig = rows[:, 5:].reshape(nk, ns, 1 + nb)[:, :, 1:]
+    table[:, _LEADING:] = eig.reshape(nk, ns * nb) * scale
+    return table
+
+
+def _sidecar(filename) -> Path:
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".npy")
+
+
+@dataclass
+class BandGap:
+    """
+    Band edges and gaps; energies in eV.
+
+    Attributes
+    ----------
+    is_metal : bool
+        Some band is partly occupied.
+    gap : float
+        Fundamental gap ``cbm - vbm`` (0 for metals).
+    direct_gap : float
+        Smallest gap at a single k-point and spin (0 for metals).
+    vbm, cbm : float
+        Highest occupied and lowest unoccupied eigenvalue.
+    k_vbm, k_cbm : int
+        Indices (0-based, in k-point order) of the k-points of the band edges.
+    k_direct : int
+        Index of the k-point of the direct gap.
+    """
+
+    is_metal: bool
+    gap: float
+    direct_gap: float
+    vbm: float
+    cbm: float
+    k_vbm: int
+    k_cbm: int
+    k_direct: int
+
+
+class Bands:
+    """
+    Eigenvalues of a CASTEP ``.bands`` file.
+
+    The header is read on construction; the k-point blocks are parsed on first access
+    and stored as one table in a binary ``{filename}.npy`` sidecar, so later loads are a
+    memory-mapped read. The sidecar is rebuilt when the text file is not the exact file
+    it was built from (size, mtime or inode differ).
+    Energies are converted to eV, k-points are sorted by their index in the file;
+    :attr:`file_order` recovers the order of the blocks in the file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the ``.bands`` file.
+    cache : bool
+        Read and write the binary sidecar.
+    """
+
+    def __init__(self, filename, cache: bool = True):
+        self.path = Path(filename)
+        self.cache = cache
+        self.header = read_bands_header(self.path)
+        self._table = None
+
+    nkpts = property(lambda self: self.header["nkpts"])
+    nspins = property(lambda self: self.header["nspins"])
+    nbands = property(lambda self: self.header["nbands"])
+    nelectrons = property(lambda self: float(np.sum(self.header["nelectrons"])))
+    lattice = property(lambda self: self.header["lattice"])
+
+    @property
+    def efermi(self) -> float:
+        """Fermi energy in eV (the highest one of spin-polarized calculations)."""
+        return float(self.header["efermi"].max() * HARTREE_TO_EV)
+
+    @property
+    def table(self) -> np.ndarray:
+        """
+        Rows ``index, position, kx, ky, kz, weight, eigenvalues...`` sorted by k-point
+        index, of shape (nkpts, 6 + nspins * nbands); ``position`` is the 0-based order of
+        the k-point block in the file.
+        """
+        if self._table is None:
+            self._table = self._load()
+        return self._table
+
+    def _load(self) -> np.ndarray:
+        side = _sidecar(self.path)
+        if self.cache and is_fresh(side, self.path):
+            try:
+                table = np.load(side, mmap_mode="r")
+                if table.shape == (self.nkpts, _LEADING + self.nspins * self.nbands):
+                    return table
+            except ValueError:
+                pass
+        stamp = source_stamp(self.path)
+        with self.path.open("rb") as f:
+            f.seek(self.header["offset"])
+            table = _parse(f.read().decode(), self.header, self.path)
+        if self.cache:
+            save_sidecar(side, table, stamp)
+        return table
+
+    @property
+    def kpoints(self) -> np.ndarray:
+        """Fractional k-point coordinates, shape (nkpts, 3)."""
+        return self.table[:, 2:5]
+
+    @property
+    def kpoint_indices(self) -> np.ndarray:
+        """k-point indices as listed in the file, in ascending order."""
+        return self.table[:, 0].astype(int)
+
+    @property
+    def file_order(self) -> np.ndarray:
+        """Rows of :attr:`table` in the order their blocks appear in the file."""
+        return np.argsort(self.table[:, 1], kind="stable")
+
+    @property
+    def weights(self) -> np.ndarray:
+        """k-point weights, summing to 1."""
+        return self.table[:, 5]
+
+    @property
+    def eigenvalues(self) -> np.ndarray:
+        """Eigenvalues in eV, shape (nspins, nkpts, nbands)."""
+        return (
+            self.table[:, _LEADING:]
+            .reshape(self.nkpts, self.nspins, self.nbands)
+            .transpose(1, 0, 2)
+        )
+
+    @property
+    def nocc(self):
+        """
+        Occupied bands per spin channel from the electron count, or None when the count
+        is fractional (partially filled bands).
+        """
+        counts = np.asarray(self.header["nelectrons"], dtype=float)
+        if self.nspins == 1:
+            counts = counts.sum(keepdims=True) / 2
+        elif counts.size == 1:
+            return None
+        if not np.allclose(counts, np.round(counts), atol=1e-6):
+            return None
+        return np.round(counts).astype(int)
+
+    def occupied(self) -> np.ndarray:
+        """
+        Boolean mask of the occupied states, shape (nspins, nkpts, nbands).
+
+        States are filled band by band with the electrons of each spin channel; when the
+        electron count is fractional, the states at or below the Fermi energy count.
+        """
+        nocc = self.nocc
+        if nocc is None:
+            return self.eigenvalues <= self.efermi
+        return np.broadcast_to(
+            np.arange(self.nbands)[None, None, :] < nocc[:, None, None], self.eigenvalues.shape
+        )
+
+    def band_gap(self) -> BandGap:
+        """
+        Find the band edges and gaps from the occupations (see :meth:`occupied`).
+
+        The system is metallic when the electron count leaves a band partially filled,
+        or when the highest occupied state lies above the lowest unoccupied one.
+
+        Returns
+        -------
+        BandGap
+            Band edges, gaps and whether the system is metallic.
+        """
+        eig = self.eigenvalues
+        occ = self.occupied()
+        below = np.where(occ, eig, -np.inf)
+        above = np.where(occ, np.inf, eig)
+        top, bottom = below.max(axis=2), above.min(axis=2)  # (nspins, nkpts)
+        vbm, cbm = top.max(), bottom.min()
+        k_vbm = int(np.unravel_index(top.argmax(), top.shape)[1])
+        k_cbm = int(np.unravel_index(bottom.argmin(), bottom.shape)[1])
+        direct = bottom - top
+        k_direct = int(np.unravel_index(direct.argmin(), direct.shape)[1])
+        is_metal = self.nocc is None or not cbm > vbm
+        return BandGap(
+            is_metal=bool(is_metal),
+            gap=0.0 if is_metal else float(cbm - vbm),
+            direct_gap=0.0 if is_metal else float(direct.min()),
+            vbm=float(vbm),
+            cbm=float(cbm),
+            k_vbm=k_vbm,
+            k_cbm=k_cbm,
+            k_direct=k_direct,
+        )
+
+    @property
+    def is_metal(self) -> bool:
+        return self.band_gap().is_metal
+
+    def dos(
+        self,
+        energies=None,
+        sigma: float = 0.1,
+        shape: str = "gaussian",
+        npoints: int = 2001,
+    ) -> tuple:
+        """
+        Broadened density of states.
+
+        The k-weighted eigenvalues are first binned onto the energy grid (shared linearly
+        between the two nearest points) and the histogram is then convolved with the
+        broadening kernel, so the cost grows with the number of eigenvalues plus the
+        square of the grid size rather than their product.
+
+        Parameters
+        ----------
+        energies : array_like, optional
+            Evenly spaced energies in eV (default: ``npoints`` points spanning all
+            eigenvalues plus 5 ``sigma``).
+        sigma : float
+            Standard deviation of the Gaussian, or half width at half maximum of the
+            Lorentzian, in eV.
+        shape : {"gaussian", "lorentzian"}
+            Broadening function.
+        npoints : int
+            Number of energies when ``energies`` is not given.
+
+        Returns
+        -------
+        energies : np.ndarray
+            The energy grid in eV.
+        dos : np.ndarray
+            States per eV and spin channel, shape (nspins, n_energies). Spin-degenerate
+            calculations count two states per band, so ``dos.sum(0)`` integrates to the
+            total number of electron states.
+        """
+        eig = self.eigenvalues
+        if energies is None:
+            energies = np.linspace(eig.min() - 5 * sigma, eig.max() + 5 * sigma, npoints)
+        energies = np.asarray(energies, dtype=float)
+        step = energies[1] - energies[0]
+        if not np.allclose(np.diff(energies), step, rtol=1e-6, atol=0):
+            raise ValueError("dos() needs evenly spaced energies")
+        n = energies.size
+
+        weights = np.broadcast_to(self.weights[None, :, None], eig.shape) * (2.0 / self.nspins)
+        position = (eig - energies[0]) / step
+        hist = np.array([_bin(position[s], weights[s], n) for s in range(self.nspins)])
+        kernel = _kernel(np.arange(-(n - 1), n) * step, sigma, shape)
+        dos = np.array([np.convolve(h, kernel, mode="valid") for h in hist])
+        return energies, dos
+
+    def __repr__(self):
+        return (
+            f"Bands('{self.path}', nkpts={self.nkpts}, nspins={self.nspins}, "
+            f"nbands={self.nbands})"
+        )
+
+
+def _bin(position, weights, n) -> np.ndarray:
+    """Histogram of ``weights`` at fractional grid ``position``, shared linearly between the
+    two nearest of ``n`` points; positions outside the grid are dropped."""
+    lower = np.floor(position).astype(np.int64)
+    frac = position - lower
+    hist = np.zeros(n)
+    for index, share in ((lower, 1 - frac), (lower + 1, frac)):
+        inside = (index >= 0) & (index < n)
+        hist += np.bincount(index[inside], (weights * share)[inside], minlength=n)
+    return hist
+
+
+def _kernel(offsets, sigma, shape) -> np.ndarray:
+    """Normalized Gaussian (standard deviation ``sigma``) or Lorentzian (HWHM ``sigma``)."""
+    if shape == "gaussian":
+        return np.exp(-0.5 * (offsets / sigma) ** 2) / (sigma * np.sqrt(2 * np.pi))
+    if shape == "lorentzian":
+        return sigma / np.pi / (offsets**2 + sigma**2)
+    raise ValueError(f"Unknown broadening '{shape}', expected gaussian or lorentzian")
+
+
+def read_bands(filename, cache: bool = True) -> Bands:
+    """Open a ``.bands`` file, see :class:`Bands`."""
+    return Bands(filename, cache=cache)
@@ -0,0 +1,84 @@
+import re
+from pathlib import Path
+
+import numpy as np
+
+__all__ = ["read_cell", "lattice_from_abc"]
+
+BOHR_TO_ANGSTROM = 0.529177210903
+
+_UNITS = {"ang": 1.0, "angstrom": 1.0, "bohr": BOHR_TO_ANGSTROM, "a0": BOHR_TO_ANGSTROM}
+
+
+def _read_blocks(text):
+    """Return a dict mapping lower-case block names to their non-empty lines."""
+    blocks = {}
+    pattern = re.compile(r"^\s*%block\s+(\w+)\s*$(.*?)^\s*%endblock\s+\1\s*$", re.I | re.M | re.S)
+    for match in pattern.finditer(text):
+        lines = [line.split("!")[0].split("#")[0].strip() for line in match.group(2).splitlines()]
+        blocks[match.group(1).lower()] = [line for line in lines if line]
+    return blocks
+
+
+def _pop_unit(lines):
+    """Strip an optional unit line from a block and return the conversion factor."""
+    if lines and lines[0].split()[0].lower() in _UNITS:
+        return _UNITS[lines[0].split()[0].lower()], lines[1:]
+    return 1.0, lines
+
+
+def lattice_from_abc(a, b, c, alpha, beta, gamma):
+    """Lattice vectors (as rows) from cell lengths and angles in degrees, a along x."""
+    alpha, beta, gamma = np.radians([alpha, beta, gamma])
+    cx = np.cos(beta)
+    cy = (np.cos(alpha) - np.cos(beta) * np.cos(gamma)) / np.sin(gamma)
+    return np.array(
+        [
+            [a, 0.0, 0.0],
+            [b * np.cos(gamma), b * np.sin(gamma), 0.0],
+            [c * cx, c * cy, c * np.sqrt(1.0 - cx**2 - cy**2)],
+        ]
+    )
+
+
+def read_cell(filename) -> dict:
+    """
+    Read the lattice and atomic positions from a CASTEP ``.cell`` file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the ``.cell`` file.
+
+    Returns
+    -------
+    dict
+        ``lattice`` : (3, 3) array of lattice vectors as rows, in Angstrom.
+        ``symbols`` : list of species labels.
+        ``positions`` : (N, 3) array of fractional coordinates.
+    """
+    blocks = _read_blocks(Path(filename).read_text())
+
+    if "lattice_cart" in blocks:
+        factor, lines = _pop_unit(blocks["lattice_cart"])
+        lattice = factor * np.array([line.split()[:3] for line in lines[:3]], dtype=float)
+    elif "lattice_abc" in blocks:
+        factor, lines = _pop_unit(blocks["lattice_abc"])
+        lengths = factor * np.array(lines[0].split()[:3], dtype=float)
+        angles = np.array(lines[1].split()[:3], dtype=float)
+        lattice = lattice_from_abc(*lengths, *angles)
+    else:
+        raise ValueError(f"No LATTICE_CART or LATTICE_ABC block in {filename}")
+
+    if "positions_frac" in blocks:
+        lines = blocks["positions_frac"]
+        positions = np.array([line.split()[1:4] for line in lines], dtype=float)
+    elif "positions_abs" in blocks:
+        factor, lines = _pop_unit(blocks["positions_abs"])
+        cart = factor * np.array([line.split()[1:4] for line in lines], dtype=float)
+        positions = np.linalg.solve(lattice.T, cart.T).T
+    else:
+        raise ValueError(f"No POSITIONS_FRAC or POSITIONS_ABS block in {filename}")
+    symbols = [line.split()[0] for line in lines]
+
+    return {"lattice": lattice, "symbols": symbols, "positions": positions}
@@ -0,0 +1,183 @@
+import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.sidecar import is_fresh, save_sidecar, source_stamp
+
+__all__ = ["read_chi", "Spectrum", "load_spectra"]
+
+# Spectrum files: {prefix}.chi{ijk} and {prefix}.chi_all.
+CHI_PATTERN = re.compile(r"\.chi(\d{3}|_all)$")
+
+
+def _is_number(token) -> bool:
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_slow(text, filename) -> np.ndarray:
+    rows = []
+    for line in text.splitlines():
+        fields = line.split()
+        if fields and all(_is_number(x) for x in fields):
+            rows.append([float(x) for x in fields])
+    if not rows:
+        raise ValueError(f"No numeric data found in {filename}")
+    ncols = min(len(row) for row in rows)
+    return np.array([row[:ncols] for row in rows])
+
+
+def _parse(text, filename) -> np.ndarray:
+    """Parse the numeric table of a spectrum file, skipping the header."""
+    start = 0
+    for line in text.splitlines(keepends=True):
+        fields = line.split()
+        if fields and all(_is_number(x) for x in fields):
+            break
+        start += len(line)
+    else:
+        raise ValueError(f"No numeric data found in {filename}")
+    body = text[start:]
+    ncols = len(body.split("\n", 1)[0].split())
+    # One C-level pass over the whole table; fall back to line-by-line parsing when the
+    # table has comment lines or ragged rows.
+    with warnings.catch_warnings():
+        # Older numpy warns and stops at a non-numeric token, newer numpy raises.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(body, sep=" ")
+        except ValueError:
+            values = None
+    if values is not None and values.size == len(body.split()) and values.size % ncols == 0:
+        return values.reshape(-1, ncols)
+    return _parse_slow(body, filename)
+
+
+def _sidecar(filename) -> Path:
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".npy")
+
+
+def read_chi(filename, cache: bool = True) -> np.ndarray:
+    """
+    Read an SHG spectrum written by NewSHG_ZY-XTIPC.x (``{prefix}.chi{direction}``).
+
+    Header and comment lines are skipped; the numeric columns are returned as-is. The
+    parsed table is stored column by column in a binary ``{filename}.npy`` sidecar, so
+    reading the same spectrum again is a single memory-mapped load. The sidecar is
+    rebuilt when the text file is not the exact file it was built from (size, mtime or
+    inode differ, as for outputs restored from the result cache).
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the spectrum file.
+    cache : bool
+        Read and write the binary sidecar.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n_energies, n_columns). The first column is the photon energy,
+        followed by the real and imaginary parts of chi(2).
+    """
+    filename = Path(filename)
+    side = _sidecar(filename)
+    if cache and is_fresh(side, filename):
+        try:
+            return np.load(side, mmap_mode="r").T
+        except ValueError:
+            pass
+    stamp = source_stamp(filename)
+    data = _parse(filename.read_text(), filename)
+    if cache:
+        save_sidecar(side, np.ascontiguousarray(data.T), stamp)
+    return data
+
+
+class Spectrum:
+    """
+    SHG spectrum file parsed on first access.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to a ``{prefix}.chi{direction}`` or ``{prefix}.chi_all`` file.
+    cache : bool
+        Use the binary sidecar, see :func:`read_chi`.
+    """
+
+    def __init__(self, filename, cache: bool = True):
+        self.path = Path(filename)
+        self.cache = cache
+        self._data = None
+
+    @property
+    def direction(self) -> str:
+        match = CHI_PATTERN.search(self.path.name)
+        return match.group(1) if match else None
+
+    @property
+    def data(self) -> np.ndarray:
+        """All numeric columns, shape (n_energies, n_columns)."""
+        if self._data is None:
+            self._data = read_chi(self.path, cache=self.cache)
+        return self._data
+
+    @property
+    def energy(self) -> np.ndarray:
+        return self.data[:, 0]
+
+    @property
+    def real(self) -> np.ndarray:
+        return self.data[:, 1]
+
+    @property
+    def imag(self) -> np.ndarray:
+        return self.data[:, 2]
+
+    @property
+    def abs(self) -> np.ndarray:
+        """|chi(2)|, from the fourth column when present."""
+        if self.data.shape[1] > 3:
+            return self.data[:, 3]
+        return np.hypot(self.real, self.imag)
+
+    @property
+    def chi(self) -> np.ndarray:
+        """Complex chi(2)."""
+        return self.real + 1j * self.imag
+
+    def __repr__(self):
+        return f"Spectrum({str(self.path)!r})"
+
+
+def load_spectra(root=".", max_workers: int = None, cache: bool = True) -> dict:
+    """
+    Load all SHG spectra below a directory in parallel.
+
+    Parameters
+    ----------
+    root : str or Path
+        Directory searched recursively for ``*.chi{ijk}`` and ``*.chi_all`` files.
+    max_workers : int, optional
+        Number of reader threads (default: chosen by ``ThreadPoolExecutor``).
+    cache : bool
+        Use the binary sidecars, see :func:`read_chi`.
+
+    Returns
+    -------
+    dict
+        Mapping from path to a loaded :class:`Spectrum`, sorted by path.
+    """
+    paths = sorted(p for p in Path(root).rglob("*.chi*") if CHI_PATTERN.search(p.name))
+    spectra = {p: Spectrum(p, cache=cache) for p in paths}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda s: s.data, spectra.values()))
+    return spectra
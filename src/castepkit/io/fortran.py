@@ -0,0 +1,370 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.bands import read_bands_header
+
+__all__ = ["FortranFile", "OmeFile", "OrbitalsFile", "read_ome", "check_ome"]
+
+# Record markers larger than this are not plausible and mean the byte order is wrong.
+_MAX_RECORD = 2**31 - 1
+
+
+class FortranFile:
+    """
+    Fortran unformatted sequential file, with every record available as a memmap view.
+
+    A sequential record is its payload between two 4-byte length markers. The markers
+    are scanned once, seeking over the payloads, and the resulting index of payload
+    offsets and lengths is persisted in a ``{filename}.idx.npy`` sidecar. The sidecar is
+    rebuilt when the file is newer than it or has changed size. The byte order is
+    detected from the first record.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the file.
+    cache : bool
+        Read and write the index sidecar.
+    """
+
+    def __init__(self, filename, cache=True):
+        self.path = Path(filename)
+        self.cache = cache
+        self._index = None
+        self._endian = None
+        self._map = None
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".idx.npy")
+
+    @property
+    def endian(self) -> str:
+        """``">"`` (big-endian, as CASTEP writes by default) or ``"<"``."""
+        if self._endian is None:
+            self._load_index()
+        return self._endian
+
+    @property
+    def index(self) -> np.ndarray:
+        """(nrecords, 2) int64 array of payload offsets and lengths in bytes."""
+        if self._index is None:
+            self._load_index()
+        return self._index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _load_index(self):
+        size = self.path.stat().st_size
+        side = self.sidecar_path
+        if self.cache and side.is_file() and side.stat().st_mtime >= self.path.stat().st_mtime:
+            try:
+                stored = np.load(side)
+            except ValueError:
+                stored = None
+            # The first row holds the file size and the byte order (1 for big-endian).
+            if stored is not None and stored.ndim == 2 and stored[0, 0] == size:
+                self._endian = ">" if stored[0, 1] else "<"
+                self._index = stored[1:]
+                return
+        self._endian, self._index = self._scan(size)
+        if self.cache:
+            stored = np.vstack([[size, self._endian == ">"], self._index])
+            tmp = side.with_name(f".{side.name}.tmp{os.getpid()}")
+            try:
+                with open(tmp, "wb") as f:
+                    np.save(f, stored)
+                os.replace(tmp, side)
+            except OSError:
+                pass
+
+    def _scan(self, size):
+        """Walk the record markers; returns the byte order and the index."""
+        with open(self.path, "rb") as f:
+            head = f.read(4)
+        if len(head) < 4:
+            raise ValueError(f"{self.path} is not a Fortran unformatted file: too short")
+        for endian in (">", "<"):
+            length = int.from_bytes(head, "big" if endian == ">" else "little", signed=True)
+            if 0 <= length <= min(size - 8, _MAX_RECORD):
+                try:
+                    return endian, self._walk(size, endian)
+                except ValueError:
+                    continue
+        raise ValueError(f"{self.path} is not a Fortran unformatted sequential file")
+
+    def _walk(self, size, endian):
+        order = "big" if endian == ">" else "little"
+        records = []
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            pos = 0
+            while pos < size:
+                length = int.from_bytes(os.pread(fd, 4, pos), order, signed=True)
+                end = pos + 4 + length
+                if length < 0:
+                    raise ValueError(
+                        f"Record {len(records)} of {self.path} is split into subrecords "
+                        "(over 2 GB), which is not supported"
+                    )
+                if end + 4 > size or os.pread(fd, 4, end) != os.pread(fd, 4, pos):
+                    raise ValueError(f"Bad record marker at byte {pos} of {self.path}")
+                records.append((pos + 4, length))
+                pos = end + 4
+        finally:
+            os.close(fd)
+        return np.array(records, dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def _buffer(self) -> np.memmap:
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        return self._map
+
+    def _dtype(self, dtype) -> np.dtype:
+        dtype = np.dtype(dtype)
+        return dtype if dtype.byteorder == "|" else dtype.newbyteorder(self.endian)
+
+    def record(self, i, dtype=np.float64, shape=None) -> np.ndarray:
+        """
+        Payload of record ``i`` as a read-only view into the file.
+
+        Parameters
+        ----------
+        i : int
+            Record number, from 0; negative numbers count from the end.
+        dtype : numpy dtype
+            Element type, in the byte order of the file.
+        shape : tuple, optional
+            Shape in C order (default: flat).
+        """
+        offset, length = self.index[i]
+        dtype = self._dtype(dtype)
+        if length % dtype.itemsize:
+            raise ValueError(f"Record {i} of {self.path} ({length} bytes) is not {dtype}")
+        array = np.ndarray(length // dtype.itemsize, dtype, self._buffer, offset)
+        return array if shape is None else array.reshape(shape)
+
+    def string(self, i) -> str:
+        """Record ``i`` as text, trailing blanks removed."""
+        return self.record(i, "S1").tobytes().decode(errors="replace").rstrip()
+
+    def records(self, start, count, dtype=np.float64, shape=None) -> np.ndarray:
+        """
+        ``count`` consecutive records of equal length as one (count, ...) view.
+
+        The records are evenly spaced in the file, so the view needs no copy however
+        large the file is; only the pages actually indexed are read from disk.
+        """
+        rows = self.index[start : start + count]
+        if len(rows) != count or np.any(rows[:, 1] != rows[0, 1]):
+            raise ValueError(f"Records {start}-{start + count - 1} of {self.path} differ in size")
+        dtype = self._dtype(dtype)
+        n = int(rows[0, 1]) // dtype.itemsize
+        stride = int(rows[1, 0] - rows[0, 0]) if count > 1 else n * dtype.itemsize
+        array = np.ndarray(
+            (count, n), dtype, self._buffer, int(rows[0, 0]), (stride, dtype.itemsize)
+        )
+        return array if shape is None else array.reshape((count, *shape))
+
+    def __repr__(self):
+        return f"FortranFile({str(self.path)!r}, records={len(self)})"
+
+
+class OmeFile(FortranFile):
+    """
+    Optical matrix elements written by CASTEP (``.ome_bin``) or calculate_ome
+    (``.cst_ome``).
+
+    The file holds a version record, an 80-character header and one record per
+    k-point and spin of ``ome(nbands, nbands, 3)`` complex values. ``elements`` exposes
+    them all as a single zero-copy view.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the file.
+    nspins : int, optional
+        Number of spin channels (default: from the ``.bands`` file with the same prefix,
+        else 1).
+    cache : bool
+        Read and write the record index sidecar.
+    """
+
+    def __init__(self, filename, nspins=None, cache=True):
+        super().__init__(filename, cache)
+        if nspins is None:
+            bands = self.path.with_suffix(".bands")
+            if bands.is_file():
+                nspins = read_bands_header(bands)["nspins"]
+        self.nspins = nspins or 1
+
+    @property
+    def version(self) -> float:
+        return float(self.record(0)[0])
+
+    @property
+    def header(self) -> str:
+        return self.string(1)
+
+    @property
+    def nbands(self) -> int:
+        nb = int(round((self.index[2, 1] / 48) ** 0.5))
+        if 48 * nb * nb != self.index[2, 1]:
+            raise ValueError(f"{self.path}: record of {self.index[2, 1]} bytes is not 3 x nb x nb")
+        return nb
+
+    @property
+    def nkpts(self) -> int:
+        nrec = len(self) - 2
+        if nrec % self.nspins:
+            raise ValueError(f"{self.path}: {nrec} records do not divide into {self.nspins} spins")
+        return nrec // self.nspins
+
+    @property
+    def elements(self) -> np.ndarray:
+        """
+        Matrix elements as a read-only view of shape (nkpts, nspins, 3, nbands, nbands),
+        indexed ``[k, s, direction, m, n]`` for ``<m|p_direction|n>``.
+        """
+        nb, nk, ns = self.nbands, self.nkpts, self.nspins
+        array = self.records(2, nk * ns, np.complex128, (3, nb, nb))
+        # Fortran ome(m, n, d) sits at C index [d, n, m]; swapping is a free view.
+        return array.reshape(nk, ns, 3, nb, nb).swapaxes(-1, -2)
+
+    def __repr__(self):
+        return f"OmeFile({str(self.path)!r}, nkpts={self.nkpts}, nbands={self.nbands})"
+
+
+class OrbitalsFile(FortranFile):
+    """
+    Plane-wave coefficients of a CASTEP wavefunction file (``.orbitals``).
+
+    Each k-point block is one or more header records (k-point coordinates, numbers and
+    indices of plane waves) followed by the coefficients, one record per band and spin
+    or one per spin with all bands. Those coefficient runs are located from the record
+    index alone, so nothing but the headers is read from disk. The coefficients of a
+    k-point are then a zero-copy view of shape (nspins, nbands, nplanewaves).
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the file.
+    nbands, nspins : int, optional
+        Bands and spins per k-point (default: from the ``.bands`` file with the same
+        prefix).
+    cache : bool
+        Read and write the record index sidecar.
+    """
+
+    def __init__(self, filename, nbands=None, nspins=None, cache=True):
+        super().__init__(filename, cache)
+        self._expected_nkpts = None
+        if nbands is None or nspins is None:
+            header = read_bands_header(self.path.with_suffix(".bands"))
+            nbands = nbands or header["nbands"]
+            nspins = nspins or header["nspins"]
+            self._expected_nkpts = header["nkpts"]
+        self.nbands = nbands
+        self.nspins = nspins
+        self._blocks = None
+
+    @property
+    def blocks(self) -> list:
+        """(first record, records, per-band) of the coefficients of every k-point."""
+        if self._blocks is None:
+            self._blocks = self._find_blocks()
+        return self._blocks
+
+    def _find_blocks(self):
+        lengths = self.index[:, 1]
+        # Start of every run of equal-length records.
+        starts = np.flatnonzero(np.r_[True, lengths[1:] != lengths[:-1]])
+        runs = np.diff(np.r_[starts, len(lengths)])
+        nb, ns = self.nbands, self.nspins
+        runs = list(zip(starts.tolist(), runs.tolist(), lengths[starts].tolist()))
+        # One record per band is the unambiguous layout; only without any such run are
+        # single records holding all bands of a spin taken as coefficients.
+        blocks = [(i, n, True) for i, n, length in runs if n == nb * ns and length % 16 == 0]
+        if not blocks:
+            blocks = [
+                (i, n, False)
+                for i, n, length in runs
+                if n == ns and length % (16 * nb) == 0 and length // 16 > nb
+            ]
+        if not blocks:
+            raise ValueError(f"No coefficients for {ns} spin(s) x {nb} bands in {self.path}")
+        if self._expected_nkpts not in (None, len(blocks)):
+            raise ValueError(
+                f"Found coefficients of {len(blocks)} k-points in {self.path}, "
+                f"expected {self._expected_nkpts}"
+            )
+        return blocks
+
+    @property
+    def nkpts(self) -> int:
+        return len(self.blocks)
+
+    def nplanewaves(self, k) -> int:
+        start, _, per_band = self.blocks[k]
+        npw = int(self.index[start, 1]) // 16
+        return npw if per_band else npw // self.nbands
+
+    def kpoint(self, k) -> np.ndarray:
+        """Fractional coordinates of k-point ``k``: the last 3-double header record."""
+        start, _, _ = self.blocks[k]
+        first = self.blocks[k - 1][0] + self.blocks[k - 1][1] if k else 0
+        for i in range(start - 1, first - 1, -1):
+            if self.index[i, 1] == 24:
+                return self.record(i, np.float64)
+        raise ValueError(f"No k-point coordinates before the coefficients of k-point {k}")
+
+    def coefficients(self, k, spin=None, bands=None) -> np.ndarray:
+        """
+        Coefficients of k-point ``k`` (from 0), a view of shape (nspins, nbands, npw).
+
+        ``spin`` and ``bands`` (indices or slices, from 0) narrow the view; nothing is
+        read until its values are used.
+        """
+        start, run, per_band = self.blocks[k]
+        npw = self.nplanewaves(k)
+        if per_band:
+            coeffs = self.records(start, run, np.complex128).reshape(self.nspins, self.nbands, npw)
+        else:
+            coeffs = self.records(start, run, np.complex128, (self.nbands, npw))
+        if spin is not None:
+            coeffs = coeffs[spin]
+        if bands is not None:
+            coeffs = coeffs[..., bands, :]
+        return coeffs
+
+    def __repr__(self):
+        return f"OrbitalsFile({str(self.path)!r}, nkpts={self.nkpts}, nbands={self.nbands})"
+
+
+def read_ome(filename, nspins=None, cache=True) -> OmeFile:
+    """Open a ``.cst_ome`` or ``.ome_bin`` file; see :class:`OmeFile`."""
+    return OmeFile(filename, nspins=nspins, cache=cache)
+
+
+def check_ome(ome_file, bands_file):
+    """
+    Check that an optical matrix element file matches a ``.bands`` file.
+
+    Raises
+    ------
+    ValueError
+        When the file is unreadable or holds different numbers of k-points, spins or bands.
+    """
+    header = read_bands_header(bands_file)
+    ome = OmeFile(ome_file, nspins=header["nspins"])
+    found = (ome.nkpts, ome.nbands)
+    expected = (header["nkpts"], header["nbands"])
+    if found != expected:
+        raise ValueError(
+            f"{ome_file} holds {found[0]} k-points x {found[1]} bands but {bands_file} "
+            f"has {expected[0]} x {expected[1]}"
+        )
@@ -0,0 +1,263 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.cell import lattice_from_abc
+from castepkit.io.sidecar import clear_stamp, is_fresh, source_stamp, write_stamp
+
+__all__ = ["Grid", "read_grd", "read_grd_header", "write_grd"]
+
+# Bytes of text parsed at a time when converting a grid.
+CHUNK_SIZE = 1 << 24
+
+
+def read_grd_header(filename) -> dict:
+    """
+    Read the header of a ``.grd`` volumetric file (Materials Studio grid format).
+
+    The header is five lines: a title, the Fortran format of the values, the cell
+    parameters ``a b c alpha beta gamma``, the number of grid intervals along each axis,
+    and the fastest-varying axis followed by the start/end index along x, y and z. The
+    values follow, x fastest.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the ``.grd`` file.
+
+    Returns
+    -------
+    dict
+        ``title``, ``cell`` (6,), ``lattice`` (3, 3) with vectors as rows,
+        ``intervals`` (3,), ``shape`` (number of points along x, y, z) and
+        ``data_offset`` (byte offset of the first value).
+    """
+    with open(filename, "rb") as f:
+        lines = [f.readline().decode() for _ in range(5)]
+        offset = f.tell()
+    try:
+        cell = np.array(lines[2].split()[:6], dtype=float)
+        intervals = tuple(int(x) for x in lines[3].split()[:3])
+        ranges = [int(x) for x in lines[4].split()[:7]]
+    except (ValueError, IndexError):
+        raise ValueError(f"Malformed .grd header in {filename}") from None
+    if len(cell) != 6 or len(intervals) != 3 or len(ranges) != 7:
+        raise ValueError(f"Malformed .grd header in {filename}")
+    if ranges[0] != 1:
+        raise ValueError(f"Only grids with x as fastest axis are supported ({filename})")
+    shape = tuple(ranges[2 * i + 2] - ranges[2 * i + 1] + 1 for i in range(3))
+    return {
+        "title": lines[0].strip(),
+        "cell": cell,
+        "lattice": lattice_from_abc(*cell),
+        "intervals": intervals,
+        "shape": shape,
+        "data_offset": offset,
+    }
+
+
+def _iter_values(filename, offset, chunk_size=None):
+    """Yield the values of a text grid as 1D arrays, parsing ``chunk_size`` bytes at a time."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        leftover = b""
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = leftover + block
+            # Only parse up to the last separator; the tail may be a truncated number.
+            cut = max(block.rfind(b"\n"), block.rfind(b" "))
+            if cut < 0:
+                leftover = block
+                continue
+            leftover = block[cut:]
+            values = np.fromstring(block[:cut].decode(), sep=" ")
+            if values.size:
+                yield values
+        if leftover.strip():
+            yield np.fromstring(leftover.decode(), sep=" ")
+
+
+class Grid:
+    """
+    Lazily loaded ``.grd`` volumetric grid.
+
+    Only the header is read on construction. The values are converted once into a
+    binary ``{filename}.npy`` sidecar next to the text file and then memory-mapped, so
+    later loads of the same grid cost milliseconds. The sidecar is rebuilt when the text
+    file is not the exact file it was built from (size, mtime or inode differ).
+
+    Parameters
+    ----------
+    filename : str or Path
+        Path to the ``.grd`` file.
+    dtype : numpy dtype
+        Storage type of the sidecar; float32 holds the 6 significant digits of the
+        ``(1p,e12.5)`` text losslessly at half the size of float64.
+    sidecar : bool
+        Keep the binary sidecar on disk. Without it, ``data`` is parsed into memory.
+    """
+
+    def __init__(self, filename, dtype=np.float32, sidecar=True):
+        self.path = Path(filename)
+        self.dtype = np.dtype(dtype)
+        self.sidecar = sidecar
+        header = read_grd_header(self.path)
+        self.title = header["title"]
+        self.cell = header["cell"]
+        self.lattice = header["lattice"]
+        self.intervals = header["intervals"]
+        self.shape = header["shape"]
+        self._offset = header["data_offset"]
+        self._data = None
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".npy")
+
+    @property
+    def npoints(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def voxel_volume(self) -> float:
+        """
+        Volume per grid point, in the units of the cell lengths cubed.
+
+        Taken from the grid intervals of the header rather than the number of stored
+        points, which is one larger along axes that include the periodic endpoint.
+        """
+        return abs(np.linalg.det(self.lattice)) / int(np.prod(self.intervals))
+
+    def _sidecar_valid(self) -> bool:
+        side = self.sidecar_path
+        if not is_fresh(side, self.path):
+            return False
+        try:
+            array = np.load(side, mmap_mode="r")
+        except ValueError:
+            return False
+        nx, ny, nz = self.shape
+        return array.shape == (nz, ny, nx) and array.dtype == self.dtype
+
+    def _convert(self, out):
+        """Parse the text values into ``out``, a flat array in file order."""
+        pos = 0
+        for values in _iter_values(self.path, self._offset):
+            end = min(pos + values.size, out.size)
+            out[pos:end] = values[: end - pos]
+            pos = end
+        if pos != out.size:
+            raise ValueError(f"{self.path} holds {pos} values, expected {out.size}")
+
+    def _load(self) -> np.ndarray:
+        nx, ny, nz = self.shape
+        if not self.sidecar:
+            flat = np.empty(self.npoints, dtype=self.dtype)
+            self._convert(flat)
+            return flat.reshape(nz, ny, nx)
+        side = self.sidecar_path
+        if not self._sidecar_valid():
+            stamp = source_stamp(self.path)
+            clear_stamp(side)
+            tmp = side.with_name(f".{side.name}.tmp{os.getpid()}")
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(nz, ny, nx))
+            try:
+                self._convert(out.reshape(-1))
+                out.flush()
+                del out
+                os.replace(tmp, side)
+                write_stamp(side, stamp)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+        return np.load(side, mmap_mode="r")
+
+    @property
+    def data(self) -> np.ndarray:
+        """Values indexed as ``data[ix, iy, iz]``; a read-only memmap view when cached."""
+        if self._data is None:
+            # Stored in file order (z slowest); the transpose is a zero-copy view.
+            self._data = self._load().transpose(2, 1, 0)
+        return self._data
+
+    def iter_z_slabs(self, size=1):
+        """
+        Iterate over the grid in slabs of ``size`` z-planes.
+
+        Without a converted sidecar the text file is streamed, so only one slab is held
+        in memory at a time.
+
+        Yields
+        ------
+        tuple
+            Index of the first plane and the slab of shape (nx, ny, n_planes).
+        """
+        nx, ny, nz = self.shape
+        if self._data is not None or (self.sidecar and self._sidecar_valid()):
+            for z0 in range(0, nz, size):
+                yield z0, self.data[:, :, z0 : z0 + size]
+            return
+
+        plane = nx * ny
+        buffer = np.empty(plane * min(size, nz), dtype=self.dtype)
+        filled, z0 = 0, 0
+        for values in _iter_values(self.path, self._offset):
+            while values.size:
+                take = min(values.size, buffer.size - filled)
+                buffer[filled : filled + take] = values[:take]
+                filled += take
+                values = values[take:]
+                if filled == buffer.size:
+                    yield z0, buffer.reshape(-1, ny, nx).transpose(2, 1, 0).copy()
+                    z0 += buffer.size // plane
+                    if z0 >= nz:
+                        return
+                    buffer = np.empty(plane * min(size, nz - z0), dtype=self.dtype)
+                    filled = 0
+        raise ValueError(f"{self.path} ends in the middle of z-plane {z0}")
+
+    def __repr__(self):
+        return f"Grid({str(self.path)!r}, shape={self.shape})"
+
+
+def read_grd(filename, dtype=np.float32, sidecar=True) -> Grid:
+    """Open a ``.grd`` file; see :class:`Grid`."""
+    return Grid(filename, dtype=dtype, sidecar=sidecar)
+
+
+def write_grd(filename, data, cell, title="castepkit grid", slabs=None):
+    """
+    Write a ``.grd`` file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Output path.
+    data : array_like or None
+        Values indexed ``[ix, iy, iz]``. Ignored when ``slabs`` is given.
+    cell : array_like
+        Cell parameters ``a b c alpha beta gamma``.
+    title : str
+        Title line.
+    slabs : iterable, optional
+        ``(shape, iterator)`` with the full (nx, ny, nz) shape and an iterator of
+        (nx, ny, k) slabs in z order, to write grids that do not fit in memory.
+    """
+    if slabs is None:
+        data = np.asarray(data)
+        shape = data.shape
+        chunks = (data[:, :, z : z + 1] for z in range(shape[2]))
+    else:
+        shape, chunks = slabs
+    nx, ny, nz = shape
+    with open(filename, "w") as f:
+        f.write(f"{title}\n(1p,e12.5)\n")
+        f.write(" ".join(f"{x:10.4f}" for x in cell) + "\n")
+        f.write(f"{nx:6d}{ny:6d}{nz:6d}\n")
+        f.write(f"{1:6d}{0:6d}{nx - 1:6d}{0:6d}{ny - 1:6d}{0:6d}{nz - 1:6d}\n")
+        for slab in chunks:
+            np.savetxt(f, np.asarray(slab).transpose(2, 1, 0).reshape(-1), fmt="%12.5E")
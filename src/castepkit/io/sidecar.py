@@ -0,0 +1,68 @@
+"""
+Binary ``.npy`` sidecars of parsed text files.
+
+A sidecar is only used for the exact file it was built from: next to it, a
+``{sidecar}.stamp`` file records the size, the modification time in nanoseconds and the
+inode of the source. Comparing mtimes alone is not enough, because outputs restored from
+the result cache are hardlinks and copies made with ``cp -p`` or ``rsync`` keep their
+old modification times.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+__all__ = ["source_stamp", "is_fresh", "save_sidecar", "write_stamp", "clear_stamp"]
+
+
+def source_stamp(source) -> str:
+    """Size, mtime in nanoseconds and inode of ``source``."""
+    st = os.stat(source)
+    return f"{st.st_size} {st.st_mtime_ns} {st.st_ino}"
+
+
+def _stamp_path(side) -> Path:
+    side = Path(side)
+    return side.with_name(side.name + ".stamp")
+
+
+def is_fresh(side, source) -> bool:
+    """Whether the sidecar ``side`` was built from the current ``source``."""
+    try:
+        return Path(side).is_file() and _stamp_path(side).read_text() == source_stamp(source)
+    except OSError:
+        return False
+
+
+def clear_stamp(side) -> None:
+    """Invalidate ``side`` before it is rewritten."""
+    _stamp_path(side).unlink(missing_ok=True)
+
+
+def write_stamp(side, stamp) -> None:
+    """Mark ``side`` as built from the source whose :func:`source_stamp` was ``stamp``."""
+    stamp_file = _stamp_path(side)
+    tmp = stamp_file.with_name(f".{stamp_file.name}.tmp{os.getpid()}")
+    tmp.write_text(stamp)
+    os.replace(tmp, stamp_file)
+
+
+def save_sidecar(side, array, stamp) -> None:
+    """
+    Atomically write ``array`` to ``side`` and stamp it.
+
+    Take ``stamp`` before parsing the source, so a source changed in the meantime leaves
+    a stale stamp rather than a sidecar trusted for data it does not hold. Errors of
+    read-only directories are ignored; the caller still has the parsed data.
+    """
+    side = Path(side)
+    tmp = side.with_name(f".{side.name}.tmp{os.getpid()}")
+    try:
+        clear_stamp(side)
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, side)
+        write_stamp(side, stamp)
+    except OSError:
+        tmp.unlink(missing_ok=True)
@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.bands import _LEADING, _parse
+
+__all__ = ["read_weights", "write_weights"]
+
+_HEADER = (
+    "Number of k-points {nkpts:8d}\n"
+    "Number of spin components {nspins:d}\n"
+    "Number of eigenvalues {nbands:8d}\n"
+)
+
+
+def write_weights(filename, bands, weights) -> Path:
+    """
+    Write per-state weights for weighted_den.x.
+
+    The file has the k-point/spin blocks of the ``.bands`` file it was derived from, in
+    the same order and with the same k-point indices, with one weight per band where the
+    ``.bands`` file has the eigenvalue::
+
+        Number of k-points       28
+        Number of spin components 1
+        Number of eigenvalues       26
+        K-point        1  0.41666667  0.41666667  0.41666667  0.00925926
+        Spin component 1
+            1.00000000
+            ...
+
+    Parameters
+    ----------
+    filename : str or Path
+        Output file, e.g. ``{prefix}.vbm_window``.
+    bands : castepkit.io.bands.Bands
+        Band structure the weights refer to.
+    weights : array_like
+        Weights of shape (nspins, nkpts, nbands), in the k-point order of ``bands``.
+
+    Returns
+    -------
+    Path
+        The written file.
+    """
+    filename = Path(filename)
+    ns, nk, nb = bands.nspins, bands.nkpts, bands.nbands
+    weights = np.asarray(weights, dtype=float)
+    if weights.shape != (ns, nk, nb):
+        raise ValueError(f"weights have shape {weights.shape}, expected {(ns, nk, nb)}")
+    spin = "".join(f"Spin component {s + 1}\n" + "{:14.8f}\n" * nb for s in range(ns))
+    block = "K-point {:8d} {:11.8f} {:11.8f} {:11.8f} {:11.8f}\n" + spin
+    rows = np.column_stack(
+        [bands.kpoints, bands.weights, weights.transpose(1, 0, 2).reshape(nk, -1)]
+    )
+    order = bands.file_order
+    tmp = filename.with_name(f".{filename.name}.tmp{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(_HEADER.format(nkpts=nk, nspins=ns, nbands=nb))
+        for k, row in zip(bands.kpoint_indices[order].tolist(), rows[order].tolist()):
+            f.write(block.format(k, *row))
+    os.replace(tmp, filename)
+    return filename
+
+
+def read_weights(filename) -> np.ndarray:
+    """
+    Read a file written by :func:`write_weights`; returns (nspins, nkpts, nbands) with the
+    k-points sorted by index, as in :class:`~castepkit.io.bands.Bands`.
+    """
+    text = Path(filename).read_text()
+    lines = text.split("\n", 3)
+    header = {
+        "nkpts": int(lines[0].split()[-1]),
+        "nspins": int(lines[1].split()[-1]),
+        "nbands": int(lines[2].split()[-1]),
+    }
+    table = _parse(lines[3], header, filename, scale=1.0)
+    return table[:, _LEADING:].reshape(header["nkpts"], header["nspins"], -1).transpose(1, 0, 2)
@@ -0,0 +1,454 @@
+import fnmatch
+import glob
+import itertools
+import json
+import math
+import os
+import shlex
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from castepkit.campaign import TASKS, Job, _run_job
+from castepkit.config import get_profile
+from castepkit.utils import link_inputs, move_outputs, split_cores
+
+__all__ = [
+    "SCHEDULERS",
+    "direction_jobs",
+    "sweep_jobs",
+    "write_array",
+    "load_array",
+    "run_bundle",
+    "collect",
+]
+
+# Files of a calculation linked into every task directory. Outputs of a task must not be
+# in this list: programs would write through the links into the calculation directory.
+ARRAY_INPUT_SUFFIXES = [
+    "bands",
+    "cell",
+    "param",
+    "ome_bin",
+    "cst_ome",
+    "check",
+    "orbitals",
+    "castep_bin",
+    "charge",
+    "switch",
+    "cutatom_check",
+]
+
+# Result files of each task that the collector brings back, as patterns on the output
+# names with {prefix} filled in. Anything else a task writes, such as the {prefix}.castep
+# log, stays in its task directory.
+ARRAY_RESULTS = {
+    "shg": ["{prefix}.chi*"],
+    "tensor": ["{prefix}.chi*"],
+    "dens": [
+        "{prefix}.chi*",
+        "{prefix}.shg_weight_*",
+        "{prefix}_*.grd",
+        "{prefix}_*.pot",
+        "{prefix}_*.check",
+    ],
+    "pipeline": [
+        "{prefix}.chi*",
+        "{prefix}.shg_weight_*",
+        "{prefix}_*.grd",
+        "{prefix}_*.pot",
+        "{prefix}_*.check",
+        "{prefix}.cst_ome",
+        "{prefix}.cutatom_check",
+    ],
+}
+
+SPEC_NAME = "array.json"
+LOG_NAME = "castepkit_array.log"
+STATUS_NAME = "castepkit_array.json"
+
+# Script templates, filled in with str.format. Custom templates get the same fields:
+# name, last (highest array index), count (number of array tasks), cores (per task),
+# directives, command, directory, logs and, for PBS, array (the -J line).
+SLURM_ARRAY = """#!/bin/bash
+#SBATCH --job-name={name}
+#SBATCH --array=0-{last}
+#SBATCH --nodes=1
+#SBATCH --ntasks={cores}
+#SBATCH --output={logs}/{name}_%A_%a.out
+{directives}
+{command} run {directory} "$SLURM_ARRAY_TASK_ID"
+"""
+
+SLURM_COLLECT = """#!/bin/bash
+#SBATCH --job-name={name}-collect
+#SBATCH --nodes=1
+#SBATCH --ntasks=1
+#SBATCH --output={logs}/{name}_collect_%j.out
+{directives}
+{command} collect {directory}
+"""
+
+SLURM_SUBMIT = """#!/bin/bash
+set -e
+array=$(sbatch --parsable {array_script})
+collect=$(sbatch --parsable --dependency=afterany:${{array%%;*}} {collect_script})
+echo "Submitted array job $array ({count} tasks) and collector $collect"
+"""
+
+PBS_ARRAY = """#!/bin/bash
+#PBS -N {name}
+{array}
+#PBS -l select=1:ncpus={cores}
+#PBS -j oe
+#PBS -o {logs}/
+{directives}
+{command} run {directory} "${{PBS_ARRAY_INDEX:-0}}"
+"""
+
+PBS_COLLECT = """#!/bin/bash
+#PBS -N {name}-collect
+#PBS -l select=1:ncpus=1
+#PBS -j oe
+#PBS -o {logs}/
+{directives}
+{command} collect {directory}
+"""
+
+PBS_SUBMIT = """#!/bin/bash
+set -e
+array=$(qsub {array_script})
+collect=$(qsub -W depend=afterany:$array {collect_script})
+echo "Submitted array job $array ({count} tasks) and collector $collect"
+"""
+
+# Templates and directive prefix of each scheduler.
+SCHEDULERS = {
+    "slurm": {
+        "array": SLURM_ARRAY,
+        "collect": SLURM_COLLECT,
+        "submit": SLURM_SUBMIT,
+        "directive": "#SBATCH",
+        "suffix": "sbatch",
+    },
+    "pbs": {
+        "array": PBS_ARRAY,
+        "collect": PBS_COLLECT,
+        "submit": PBS_SUBMIT,
+        "directive": "#PBS",
+        "suffix": "pbs",
+    },
+}
+
+
+def direction_jobs(prefix, directions, directory=".", **params) -> list:
+    """One ``shg`` job per SHG direction of ``{directory}/{prefix}``."""
+    directory = str(Path(directory).resolve())
+    return [Job(directory, prefix, "shg", {**params, "direction": d}) for d in directions]
+
+
+def sweep_jobs(prefix, parameters, direction="123", directory=".", **params) -> tuple:
+    """
+    One ``shg`` job per point of a parameter sweep, see
+    :func:`castepkit.wrappers.shg.run_shg_sweep`.
+
+    Returns
+    -------
+    tuple
+        The jobs in ``itertools.product`` order, and the ``sweep`` description that
+        :func:`write_array` needs to have the collector stack their spectra.
+    """
+    if not parameters:
+        raise ValueError("Nothing to sweep: no parameter values given")
+    directory = str(Path(directory).resolve())
+    names = list(parameters)
+    values = [list(parameters[name]) for name in names]
+    params = {"band_resolved": 0, **params, "direction": direction}
+    jobs = [
+        Job(directory, prefix, "shg", {**params, **dict(zip(names, point))})
+        for point in itertools.product(*values)
+    ]
+    sweep = {"dir": directory, "prefix": prefix, "direction": direction}
+    return jobs, {**sweep, "names": names, "values": values}
+
+
+def _sized(task, params, cores) -> dict:
+    """Task parameters with the core count of an array task filled in."""
+    key = {"shg": "nproc", "tensor": "ncores", "dens": "ncores"}.get(task)
+    return {key: cores, **params} if key else dict(params)
+
+
+def write_array(
+    jobs,
+    directory="castepkit_array",
+    scheduler="slurm",
+    node_cores=None,
+    task_cores=None,
+    name="castepkit",
+    directives=(),
+    template=None,
+    sweep=None,
+) -> Path:
+    """
+    Write scheduler job-array scripts that run ``jobs`` packed onto whole nodes.
+
+    Every array task gets one node and runs ``node_cores // task_cores`` jobs at once,
+    each in its own directory ``{directory}/tasks/NNNN`` with the calculation's input
+    files linked in. A collector job, submitted to start once the array has finished,
+    moves the outputs of every successful job back into its calculation directory, or
+    stacks the spectra of a sweep into ``{prefix}.sweep_{direction}.npz``. Run the
+    generated ``submit.sh`` to submit both.
+
+    Parameters
+    ----------
+    jobs : list of castepkit.campaign.Job
+        Wrapper calls, e.g. from :func:`castepkit.campaign.load_manifest`,
+        :func:`direction_jobs` or :func:`sweep_jobs`.
+    directory : str or Path
+        Directory for the scripts, the task directories and the logs; it must be on a
+        filesystem the compute nodes share.
+    scheduler : {"slurm", "pbs"}
+        Batch system to write scripts for.
+    node_cores : int, optional
+        Cores per node (default: the cores of this machine).
+    task_cores : int, optional
+        Cores per job: MPI ranks for ``shg``, the core budget for ``tensor`` and ``dens``
+        (default: the node's cores shared by all jobs, at least one each).
+    name : str
+        Job name.
+    directives : list of str
+        Extra scheduler options, e.g. ``["--time=02:00:00", "--partition=short"]``.
+    template : str or Path, optional
+        File with a custom array-script template (see :data:`SCHEDULERS`).
+    sweep : dict, optional
+        Sweep description from :func:`sweep_jobs`, whose jobs must come first in
+        ``jobs``.
+
+    Returns
+    -------
+    Path
+        The ``submit.sh`` script.
+    """
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{scheduler}', expected one of {list(SCHEDULERS)}")
+    if not jobs:
+        raise ValueError("No jobs to write an array for")
+    for job in jobs:
+        if job.task not in TASKS:
+            raise ValueError(f"Unknown task '{job.task}', expected one of {list(TASKS)}")
+    if sweep is not None and math.prod(map(len, sweep["values"])) > len(jobs):
+        raise ValueError("Fewer jobs than points of the sweep")
+    node_cores = max(1, node_cores or os.cpu_count() or 1)
+    task_cores = min(task_cores or split_cores(node_cores, len(jobs))[1], node_cores)
+    per_node = max(1, node_cores // task_cores)
+    count = -(-len(jobs) // per_node)
+
+    directory = Path(directory).resolve()
+    (directory / "logs").mkdir(parents=True, exist_ok=True)
+    tasks = [
+        {
+            "index": i,
+            "bundle": i // per_node,
+            "dir": job.dir,
+            "prefix": job.prefix,
+            "task": job.task,
+            "params": _sized(job.task, job.params, task_cores),
+        }
+        for i, job in enumerate(jobs)
+    ]
+    spec = {
+        "scheduler": scheduler,
+        "node_cores": node_cores,
+        "task_cores": task_cores,
+        "count": count,
+        "tasks": tasks,
+        "sweep": sweep,
+    }
+    (directory / SPEC_NAME).write_text(json.dumps(spec, indent=1))
+
+    kind = SCHEDULERS[scheduler]
+    profile = get_profile()
+    command = f"{shlex.quote(sys.executable)} -m castepkit.cli"
+    command += f" --profile {shlex.quote(profile)}" if profile else ""
+    fields = {
+        "name": name,
+        "last": count - 1,
+        "count": count,
+        "cores": task_cores * min(per_node, len(jobs)),
+        "directives": "\n".join(f"{kind['directive']} {d}" for d in directives),
+        "command": command + " array",
+        "directory": shlex.quote(str(directory)),
+        "logs": directory / "logs",
+        "array": f"#PBS -J 0-{count - 1}" if count > 1 else "",
+    }
+    array_text = Path(template).read_text() if template else kind["array"]
+    scripts = {
+        "array": directory / f"array.{kind['suffix']}",
+        "collect": directory / f"collect.{kind['suffix']}",
+    }
+    scripts["array"].write_text(array_text.format(**fields))
+    scripts["collect"].write_text(kind["collect"].format(**fields))
+    submit = directory / "submit.sh"
+    submit.write_text(
+        kind["submit"].format(
+            array_script=shlex.quote(str(scripts["array"])),
+            collect_script=shlex.quote(str(scripts["collect"])),
+            count=count,
+        )
+    )
+    for path in (*scripts.values(), submit):
+        path.chmod(0o755)
+    return submit
+
+
+def load_array(directory) -> dict:
+    """The plan written by :func:`write_array` to ``{directory}/array.json``."""
+    return json.loads((Path(directory) / SPEC_NAME).read_text())
+
+
+def _workdir(directory, task) -> Path:
+    return Path(directory) / "tasks" / f"{task['index']:04d}"
+
+
+def _input_files(task) -> list:
+    source = Path(task["dir"])
+    suffixes = set(ARRAY_INPUT_SUFFIXES)
+    # Steps of a pipeline write these themselves.
+    if task["task"] == "pipeline" and task["params"].get("ome"):
+        suffixes.discard("cst_ome")
+    if task["task"] == "pipeline" and task["params"].get("atom_cutting"):
+        suffixes.difference_update(["cutatom_check", "castep_bin"])
+    files = [source / f"{task['prefix']}.{s}" for s in ARRAY_INPUT_SUFFIXES if s in suffixes]
+    return files + sorted(source.glob("*.recpot"))
+
+
+def _run_task(directory, task, cores) -> int:
+    workdir = _workdir(directory, task)
+    link_inputs(_input_files(task), workdir)
+    job = Job(str(workdir), task["prefix"], task["task"], task["params"])
+    returncode, elapsed, outputs = _run_job(job, workdir / LOG_NAME, cores)
+    outputs = [
+        Path(f).name
+        for f in outputs
+        if not Path(f).is_symlink() and Path(f).name not in (LOG_NAME, STATUS_NAME)
+    ]
+    status = {
+        "returncode": returncode,
+        "elapsed": elapsed,
+        "outputs": outputs,
+        "host": socket.gethostname(),
+    }
+    (workdir / STATUS_NAME).write_text(json.dumps(status, indent=1))
+    label = f"Task {task['index']} ({task['prefix']} [{task['task']}])"
+    if returncode == 0:
+        print(f"✅ {label} done in {elapsed:.1f} s", flush=True)
+    else:
+        print(f"❌ {label} failed with exit code {returncode}, log: {workdir / LOG_NAME}")
+    return returncode
+
+
+def run_bundle(directory, index) -> int:
+    """
+    Run the jobs of one array task concurrently; the body of the array script.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory written by :func:`write_array`.
+    index : int
+        Array task index.
+
+    Returns
+    -------
+    int
+        Number of failed jobs.
+    """
+    spec = load_array(directory)
+    tasks = [task for task in spec["tasks"] if task["bundle"] == int(index)]
+    if not tasks:
+        raise ValueError(f"Array task {index} of {directory} has no jobs")
+    cores = spec["task_cores"]
+    print(f"Array task {index} on {socket.gethostname()}: {len(tasks)} jobs x {cores} cores")
+    with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+        returncodes = list(pool.map(lambda task: _run_task(directory, task, cores), tasks))
+    return sum(1 for code in returncodes if code != 0)
+
+
+def _succeeded(directory, task) -> bool:
+    status = _workdir(directory, task) / STATUS_NAME
+    return status.is_file() and json.loads(status.read_text())["returncode"] == 0
+
+
+def _results(task, outputs) -> list:
+    """The outputs of ``task`` that are results, see :data:`ARRAY_RESULTS`."""
+    prefix = glob.escape(task["prefix"])
+    patterns = [p.format(prefix=prefix) for p in ARRAY_RESULTS[task["task"]]]
+    return [f for f in outputs if any(fnmatch.fnmatchcase(f, p) for p in patterns)]
+
+
+def collect(directory) -> dict:
+    """
+    Merge the results of a finished array; the body of the collector script.
+
+    The result files of every successful job (see :data:`ARRAY_RESULTS`) are moved from
+    its task directory into its calculation directory. Files that already exist there
+    are never replaced: the new copy stays in the task directory. Other outputs, such as
+    the ``.castep`` log the programs write, are left in the task directory. The spectra of a sweep are instead stacked into
+    ``{prefix}.sweep_{direction}.npz`` in the calculation directory, once every point
+    has succeeded. A summary is written to ``{directory}/collect.json``.
+
+    Returns
+    -------
+    dict
+        Number of jobs ``done``, ``failed`` and ``missing`` (never ran), and the
+        ``outputs`` collected.
+    """
+    directory = Path(directory)
+    spec = load_array(directory)
+    summary = {"done": 0, "failed": 0, "missing": 0, "outputs": []}
+    sweep = spec["sweep"]
+    points = math.prod(map(len, sweep["values"])) if sweep else 0
+    for task in spec["tasks"]:
+        workdir = _workdir(directory, task)
+        label = f"Task {task['index']} ({task['prefix']} [{task['task']}])"
+        if not (workdir / STATUS_NAME).is_file():
+            summary["missing"] += 1
+            print(f"❌ {label} did not run")
+            continue
+        status = json.loads((workdir / STATUS_NAME).read_text())
+        if status["returncode"] != 0:
+            summary["failed"] += 1
+            print(
+                f"❌ {label} failed with exit code {status['returncode']}, log: {workdir / LOG_NAME}"
+            )
+            continue
+        summary["done"] += 1
+        if task["index"] >= points:
+            results = []
+            for name in _results(task, status["outputs"]):
+                if (Path(task["dir"]) / name).exists():
+                    print(f"❌ {name} exists in {task['dir']}; kept {label}'s in {workdir}")
+                else:
+                    results.append(name)
+            moved = move_outputs(results, workdir, task["dir"])
+            summary["outputs"] += [str(f) for f in moved]
+
+    sweep_tasks = spec["tasks"][:points]
+    if sweep is not None and all(_succeeded(directory, task) for task in sweep_tasks):
+        from castepkit.io.chi import Spectrum
+        from castepkit.wrappers.shg import spectrum_name, stack_sweep
+
+        name = spectrum_name(sweep["prefix"], sweep["direction"])
+        spectra = [Spectrum(_workdir(directory, task) / name) for task in sweep_tasks]
+        output = Path(sweep["dir"]) / f"{sweep['prefix']}.sweep_{sweep['direction']}.npz"
+        stack_sweep(output, sweep["names"], sweep["values"], spectra)
+        summary["outputs"].append(str(output))
+        print(f"✅ Stacked {len(spectra)} spectra into {output}")
+
+    (directory / "collect.json").write_text(json.dumps(summary, indent=1))
+    print(
+        f"Collected {directory}: {summary['done']} done, {summary['failed']} failed, "
+        f"{summary['missing']} did not run"
+    )
+    return summary
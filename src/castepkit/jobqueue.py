@@ -0,0 +1,608 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import json
+import math
+import os
+import pwd
+import socket
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from castepkit.config import get_queue_settings
+
+__all__ = [
+    "Job",
+    "QueueServer",
+    "lease",
+    "alease",
+    "pinned",
+    "queue_status",
+    "stop_daemon",
+    "parse_cores",
+    "format_cores",
+]
+
+# Seconds a daemon has to accept and acknowledge a request; a real one answers at once.
+ACK_TIMEOUT = 10.0
+
+
+def parse_cores(spec=None) -> list:
+    """
+    Core ids from a ``[queue] cores`` value.
+
+    ``None`` gives every core this process may run on, an int the first that many of
+    them, and a string an explicit list such as ``"0-15,32-47"``.
+    """
+    if isinstance(spec, str):
+        cores = set()
+        for part in spec.replace(" ", "").split(","):
+            first, _, last = part.partition("-")
+            cores.update(range(int(first), int(last or first) + 1))
+        return sorted(cores)
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    return available if spec is None else available[: max(1, spec)]
+
+
+def format_cores(cores) -> str:
+    """Compact form of core ids, e.g. ``"0-7,16"``; the inverse of :func:`parse_cores`."""
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+@contextlib.contextmanager
+def pinned(cores):
+    """
+    Restrict the calling thread, and so the processes it starts, to ``cores``.
+
+    Child processes inherit the affinity of the thread that forks them, and ``mpirun``
+    places its ranks inside the inherited set. Without affinity support, or when the
+    cores are outside the cpuset of this process, nothing is pinned.
+    """
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, cores)
+    except OSError:
+        yield
+        return
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+@dataclass
+class Job:
+    """
+    A run waiting for or holding cores of the daemon.
+
+    Attributes
+    ----------
+    id : int
+        Sequence number given by the daemon.
+    user : str
+        Owner, from the credentials of the connection where available.
+    prog : str
+        Key of the executable.
+    ncores : int
+        Cores requested: MPI ranks times threads, at most the whole budget.
+    cwd : str
+        Working directory of the run, for status listings.
+    estimate : float or None
+        Expected wall time in seconds, if the client knows it.
+    submitted, started : float
+        Unix times of the request and of the grant.
+    cores : list of int
+        Core ids granted.
+    """
+
+    id: int
+    user: str
+    prog: str
+    ncores: int
+    cwd: str = ""
+    estimate: float = None
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    cores: list = None
+    writer: object = field(default=None, repr=False)
+
+    def info(self) -> dict:
+        fields = ("id", "user", "prog", "ncores", "cwd", "submitted", "started", "cores")
+        return {name: getattr(self, name) for name in fields}
+
+
+def _write(writer, message) -> None:
+    """Queue a JSON line on a client connection that may already be gone."""
+    if writer is not None and not writer.is_closing():
+        writer.write(json.dumps(message).encode() + b"\n")
+
+
+def _peer_uid(sock):
+    """User id of the process at the other end of a Unix socket, or None."""
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return None
+    size = struct.calcsize("3i")
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size))
+    return uid
+
+
+def _peer(writer):
+    """User id and name of the process at the other end of a Unix socket, or None."""
+    uid = _peer_uid(writer.get_extra_info("socket"))
+    if uid is None:
+        return None, None
+    try:
+        return uid, pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return uid, str(uid)
+
+
+class QueueServer:
+    """
+    Local job-queue daemon that shares a core budget between the users of a machine.
+
+    Clients connect to a Unix socket and ask for cores; the daemon answers with their
+    queue position and ETA until it grants a set of core ids, which the client holds
+    until it closes the connection (normally when its program exits). Programs still
+    run as the submitting user, in their own environment; the daemon only decides who
+    runs when and where.
+
+    Jobs are granted in fair-share order: the next job is the oldest one of the user
+    with the fewest cores in use. The order is strict, so a large job at the head is not
+    overtaken by smaller ones and never starves. Granted core sets are disjoint, and
+    contiguous where possible. ETAs come from the expected run times, which are the
+    client's estimate or the mean core-seconds of the finished jobs of the same program.
+
+    Parameters
+    ----------
+    socket_path : str or Path, optional
+        Socket to listen on (default: ``[queue] socket``).
+    cores : int or str, optional
+        Core budget, see :func:`parse_cores` (default: ``[queue] cores``, else every core).
+    """
+
+    def __init__(self, socket_path=None, cores=None):
+        settings = get_queue_settings()
+        self.socket_path = Path(socket_path or settings["socket"])
+        self.cores = parse_cores(cores if cores is not None else settings["cores"])
+        self.free = set(self.cores)
+        self.queued = []
+        self.running = {}
+        self.history = {}  # prog -> (finished runs, core-seconds)
+        self.since = time.time()
+        self._ids = itertools.count(1)
+        self._stop = None
+
+    def run(self) -> None:
+        """Serve until a client sends ``stop``."""
+        asyncio.run(self.serve())
+
+    async def serve(self, ready=None) -> None:
+        """Coroutine of :meth:`run`; ``ready()`` is called once connections are accepted."""
+        self._stop = asyncio.Event()
+        if self.socket_path.exists():
+            if queue_status(self.socket_path) is not None:
+                raise RuntimeError(f"A queue daemon already listens on {self.socket_path}")
+            self.socket_path.unlink()  # left behind by a daemon that was killed
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+        os.chmod(self.socket_path, 0o666)  # every user of the machine submits here
+        self._log(f"listening on {self.socket_path} with cores {format_cores(self.cores)}")
+        if ready is not None:
+            ready()
+        try:
+            async with server:
+                await self._stop.wait()
+                # Clients holding or waiting for cores see the connection close.
+                for job in [*self.running.values(), *self.queued]:
+                    if job.writer is not None:
+                        job.writer.close()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                self.socket_path.unlink()
+            self._log("stopped")
+
+    async def _handle(self, reader, writer):
+        job = None
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            op = request.get("op")
+            uid, user = _peer(writer)
+            if op == "submit":
+                job = Job(
+                    next(self._ids),
+                    user or str(request.get("user", "?")),
+                    str(request.get("prog", "?")),
+                    int(request.get("cores", 1)),
+                    str(request.get("cwd", "")),
+                    request.get("estimate"),
+                    writer=writer,
+                )
+                self.submit(job)
+                # The next line ("done") or EOF ends the job, also when the client is
+                # killed or gives up while still queued.
+                await reader.readline()
+            elif op == "status":
+                _write(writer, self.status())
+            elif op == "stop":
+                if uid not in (None, 0, os.getuid()):
+                    _write(writer, {"error": "only the owner of the daemon can stop it"})
+                else:
+                    _write(writer, {"state": "stopping"})
+                    self._stop.set()
+            else:
+                _write(writer, {"error": f"unknown request {op!r}"})
+            await writer.drain()
+        except (ConnectionError, AttributeError, TypeError, ValueError):
+            pass
+        finally:
+            if job is not None:
+                self.finish(job)
+            writer.close()
+
+    def submit(self, job: Job) -> None:
+        """Queue ``job``, asking for at most the whole budget, and grant whatever fits."""
+        job.ncores = min(max(1, job.ncores), len(self.cores))
+        self.queued.append(job)
+        self._log(f"#{job.id} {job.user} {job.prog}: queued for {job.ncores} cores")
+        self.schedule()
+
+    def finish(self, job: Job) -> None:
+        """Release the cores of ``job``, or withdraw it from the queue, and grant the next."""
+        if job in self.queued:
+            self.queued.remove(job)
+            self._log(f"#{job.id} {job.user} {job.prog}: withdrawn")
+        elif self.running.pop(job.id, None) is not None:
+            self.free.update(job.cores)
+            wall = time.time() - job.started
+            runs, core_seconds = self.history.get(job.prog, (0, 0.0))
+            self.history[job.prog] = (runs + 1, core_seconds + wall * job.ncores)
+            self._log(f"#{job.id} {job.user} {job.prog}: finished after {wall:.1f} s")
+        self.schedule()
+
+    def schedule(self) -> None:
+        """Grant cores to queued jobs in fair-share order, then tell the rest where they are."""
+        while True:
+            job = self._next(self.queued, self._usage())
+            if job is None or job.ncores > len(self.free):
+                break
+            self.queued.remove(job)
+            job.cores = self._take(job.ncores)
+            job.started = time.time()
+            self.running[job.id] = job
+            wait = job.started - job.submitted
+            _write(job.writer, {"state": "granted", "cores": job.cores, "wait": wait})
+            self._log(
+                f"#{job.id} {job.user} {job.prog}: running on cores "
+                f"{format_cores(job.cores)} after {wait:.1f} s"
+            )
+        for position, (job, eta) in enumerate(self.forecast(), 1):
+            _write(job.writer, {"state": "queued", "position": position, "eta": eta})
+
+    def forecast(self) -> list:
+        """
+        Queued jobs in the order they will run, with the seconds until each starts.
+
+        The schedule is replayed with the expected end of every run; the ETA is None once
+        a run without any estimate has to finish first.
+        """
+        now = time.time()
+        usage = self._usage()
+        ends = []
+        for job in self.running.values():
+            estimate = self._estimate(job)
+            end = job.started + estimate if estimate is not None else math.inf
+            heapq.heappush(ends, (end, job.id, job))
+        free, t, order = len(self.free), now, []
+        queued = list(self.queued)
+        while queued:
+            job = self._next(queued, usage)
+            queued.remove(job)
+            while free < job.ncores:
+                end, _, done = heapq.heappop(ends)
+                t = max(t, end)
+                free += done.ncores
+                usage[done.user] -= done.ncores
+            order.append((job, t - now if t < math.inf else None))
+            free -= job.ncores
+            usage[job.user] = usage.get(job.user, 0) + job.ncores
+            estimate = self._estimate(job)
+            heapq.heappush(ends, (t + estimate if estimate is not None else math.inf, job.id, job))
+        return order
+
+    def status(self) -> dict:
+        """Budget, running jobs and queued jobs (with ``position`` and ``eta``) as a dict."""
+        return {
+            "pid": os.getpid(),
+            "since": self.since,
+            "cores": self.cores,
+            "free": sorted(self.free),
+            "running": [
+                {**job.info(), "estimate": self._estimate(job)} for job in self.running.values()
+            ],
+            "queued": [
+                {**job.info(), "position": position, "eta": eta}
+                for position, (job, eta) in enumerate(self.forecast(), 1)
+            ],
+        }
+
+    @staticmethod
+    def _next(queued, usage):
+        """Oldest job of the user with the fewest cores in use."""
+        heads = {}
+        for job in queued:
+            heads.setdefault(job.user, job)
+        if not heads:
+            return None
+        return min(heads.values(), key=lambda job: (usage.get(job.user, 0), job.submitted, job.id))
+
+    def _usage(self) -> dict:
+        usage = {}
+        for job in self.running.values():
+            usage[job.user] = usage.get(job.user, 0) + job.ncores
+        return usage
+
+    def _take(self, n) -> list:
+        """``n`` free cores, the first contiguous block if there is one."""
+        free = sorted(self.free)
+        for i in range(len(free) - n + 1):
+            if free[i + n - 1] - free[i] == n - 1:
+                cores = free[i : i + n]
+                break
+        else:
+            cores = free[:n]
+        self.free.difference_update(cores)
+        return cores
+
+    def _estimate(self, job):
+        if job.estimate is not None:
+            return float(job.estimate)
+        if job.prog in self.history:
+            runs, core_seconds = self.history[job.prog]
+            return core_seconds / runs / job.ncores
+        return None
+
+    def _log(self, message) -> None:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+
+def _socket_path(socket_path=None) -> Path:
+    return Path(socket_path or get_queue_settings()["socket"])
+
+
+def _request(socket_path, message):
+    """Send one request and return the answer, or None when no daemon is listening."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(_socket_path(socket_path)))
+        except OSError:
+            return None
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps(message).encode() + b"\n")
+            f.flush()
+            line = f.readline()
+    return json.loads(line) if line else None
+
+
+def queue_status(socket_path=None):
+    """State of the daemon as returned by :meth:`QueueServer.status`, or None if none runs."""
+    return _request(socket_path, {"op": "status"})
+
+
+def stop_daemon(socket_path=None) -> bool:
+    """Ask the daemon to stop; False when none is running."""
+    answer = _request(socket_path, {"op": "stop"})
+    if answer is not None and "error" in answer:
+        raise PermissionError(answer["error"])
+    return answer is not None
+
+
+class _Progress:
+    """Reports queue updates of one request; returns the granted cores."""
+
+    def __init__(self, prog_key, ncores):
+        self.label = f"{prog_key} ({ncores} cores)"
+        self.position = None
+
+    def __call__(self, message):
+        if message.get("state") == "granted":
+            if self.position is not None:
+                print(
+                    f"✅ {self.label} starts on cores {format_cores(message['cores'])} "
+                    f"after {message['wait']:.0f} s in the queue",
+                    flush=True,
+                )
+            return message["cores"]
+        if message.get("position") != self.position:
+            self.position = message.get("position")
+            eta = message.get("eta")
+            eta = f"ETA {eta / 60:.1f} min" if eta is not None else "ETA unknown"
+            print(f"⏳ {self.label} queued at position {self.position}, {eta}", flush=True)
+        return None
+
+
+def _submit(prog_key, ncores, cwd, estimate) -> bytes:
+    message = {
+        "op": "submit",
+        "prog": prog_key,
+        "cores": ncores,
+        "cwd": str(Path(cwd or ".").resolve()),
+        "estimate": estimate,
+        "user": os.environ.get("USER", ""),
+    }
+    return json.dumps(message).encode() + b"\n"
+
+
+def _trusted(uid, path, owner) -> bool:
+    """Whether a daemon running as ``uid`` may schedule the runs of this user."""
+    if uid is None:
+        # Without peer credentials, the owner of the socket file stands in.
+        with contextlib.suppress(OSError):
+            uid = os.stat(path).st_uid
+    trusted = {0, os.getuid()}
+    if owner is not None:
+        with contextlib.suppress(KeyError):
+            trusted.add(int(owner) if str(owner).isdigit() else pwd.getpwnam(owner).pw_uid)
+    return uid in trusted
+
+
+def _check_grant(cores):
+    """Why a grant cannot be used, or None: cores must be distinct ids this process may use."""
+    if (
+        not isinstance(cores, list)
+        or not cores
+        or not all(type(c) is int for c in cores)
+        or len(set(cores)) != len(cores)
+    ):
+        return f"invalid core list {cores!r}"
+    if hasattr(os, "sched_getaffinity") and not set(cores) <= os.sched_getaffinity(0):
+        return f"cores {format_cores(cores)} outside the affinity of this process"
+    return None
+
+
+def _wait_time(first, deadline):
+    """Seconds to wait for the next message: a daemon acknowledges a request at once."""
+    remaining = deadline - time.monotonic() if deadline is not None else None
+    if first:
+        return ACK_TIMEOUT if remaining is None else min(ACK_TIMEOUT, remaining)
+    return remaining
+
+
+@contextlib.contextmanager
+def lease(prog_key, ncores, cwd=None, estimate=None):
+    """
+    Hold ``ncores`` cores of the local queue daemon for the duration of the block.
+
+    Waits, reporting the queue position and ETA, until the daemon grants the cores, and
+    releases them on exit. The block runs at once and gets None when the queue is
+    disabled in the config (the default), no daemon is listening on ``[queue] socket``,
+    the daemon runs as a user other than this one, root or ``[queue] owner``, it does
+    not acknowledge the request within :data:`ACK_TIMEOUT` seconds, no cores are granted
+    within ``[queue] timeout`` seconds, or the granted cores are outside the affinity of
+    this process.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable, shown in the queue.
+    ncores : int
+        Cores needed: MPI ranks times OpenMP threads.
+    cwd : str or Path, optional
+        Working directory of the run, shown in the queue.
+    estimate : float, optional
+        Expected wall time in seconds, for the ETAs of the jobs behind this one.
+
+    Yields
+    ------
+    list of int or None
+        Granted core ids, to be passed to :func:`pinned`.
+    """
+    settings = get_queue_settings()
+    if not settings["enabled"]:
+        yield None
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(ACK_TIMEOUT)
+        sock.connect(str(settings["socket"]))
+    except OSError:
+        sock.close()
+        yield None
+        return
+
+    problem = None
+    with sock, sock.makefile("rwb") as f:
+        if not _trusted(_peer_uid(sock), settings["socket"], settings["owner"]):
+            problem = f"the queue daemon at {settings['socket']} runs as another user"
+        else:
+            progress = _Progress(prog_key, ncores)
+            deadline = time.monotonic() + settings["timeout"] if settings["timeout"] else None
+            cores = None
+            try:
+                f.write(_submit(prog_key, ncores, cwd, estimate))
+                f.flush()
+                while cores is None:
+                    sock.settimeout(_wait_time(progress.position is None, deadline))
+                    line = f.readline()
+                    if not line:
+                        break
+                    cores = progress(json.loads(line))
+                problem = _check_grant(cores) if cores is not None else "the queue daemon went away"
+            except (OSError, ValueError) as e:
+                problem = f"no grant from the queue daemon ({e or 'timed out'})"
+            if problem is None:
+                try:
+                    yield cores
+                finally:
+                    with contextlib.suppress(OSError):
+                        sock.settimeout(ACK_TIMEOUT)
+                        f.write(b'{"op": "done"}\n')
+                        f.flush()
+                return
+    # The connection is closed, so the daemon has withdrawn the request.
+    print(f"❌ Running {prog_key} directly: {problem}", flush=True)
+    yield None
+
+
+@contextlib.asynccontextmanager
+async def alease(prog_key, ncores, cwd=None, estimate=None):
+    """Async counterpart of :func:`lease`; cancelling the wait withdraws the request."""
+    settings = get_queue_settings()
+    connection = None
+    if settings["enabled"]:
+        with contextlib.suppress(OSError, asyncio.TimeoutError):
+            connection = await asyncio.wait_for(
+                asyncio.open_unix_connection(str(settings["socket"])), ACK_TIMEOUT
+            )
+    if connection is None:
+        yield None
+        return
+
+    reader, writer = connection
+    problem = None
+    try:
+        uid = _peer_uid(writer.get_extra_info("socket"))
+        if not _trusted(uid, settings["socket"], settings["owner"]):
+            problem = f"the queue daemon at {settings['socket']} runs as another user"
+        else:
+            progress = _Progress(prog_key, ncores)
+            deadline = time.monotonic() + settings["timeout"] if settings["timeout"] else None
+            cores = None
+            try:
+                writer.write(_submit(prog_key, ncores, cwd, estimate))
+                await writer.drain()
+                while cores is None:
+                    wait = _wait_time(progress.position is None, deadline)
+                    line = await asyncio.wait_for(reader.readline(), wait)
+                    if not line:
+                        break
+                    cores = progress(json.loads(line))
+                problem = _check_grant(cores) if cores is not None else "the queue daemon went away"
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                problem = f"no grant from the queue daemon ({e or 'timed out'})"
+            if problem is None:
+                try:
+                    yield cores
+                finally:
+                    with contextlib.suppress(OSError):
+                        writer.write(b'{"op": "done"}\n')
+                return
+    finally:
+        writer.close()
+    print(f"❌ Running {prog_key} directly: {problem}", flush=True)
+    yield None
@@ -0,0 +1,124 @@
+import csv
+import json
+import threading
+from dataclasses import asdict
+from pathlib import Path
+
+from castepkit.config import get_metrics_settings
+
+__all__ = ["record", "load_metrics", "summarize"]
+
+# Columns of the CSV format; ``input_bytes`` is stored as JSON.
+FIELDS = [
+    "time",
+    "prog",
+    "params",
+    "nproc",
+    "wall",
+    "user",
+    "system",
+    "max_rss",
+    "returncode",
+    "cached",
+    "input_bytes",
+]
+
+_lock = threading.Lock()
+
+
+def record(metrics, file=None) -> None:
+    """
+    Append a :class:`castepkit.utils.RunMetrics` to the metrics file.
+
+    Nothing is written unless ``file`` is given or ``[metrics] enabled`` is set in the
+    config. Files ending in ``.csv`` get CSV rows, all others one JSON object per line.
+    """
+    if file is None:
+        settings = get_metrics_settings()
+        if not settings["enabled"]:
+            return
+        file = settings["file"]
+    file = Path(file)
+    row = asdict(metrics)
+    with _lock:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        if file.suffix == ".csv":
+            new = not file.is_file() or file.stat().st_size == 0
+            with open(file, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                if new:
+                    writer.writeheader()
+                writer.writerow({**row, "input_bytes": json.dumps(row["input_bytes"])})
+        else:
+            with open(file, "a") as f:
+                f.write(json.dumps(row) + "\n")
+
+
+def load_metrics(file=None) -> list:
+    """Read all records of a JSONL or CSV metrics file as dicts."""
+    file = Path(file or get_metrics_settings()["file"])
+    if not file.is_file():
+        return []
+    if file.suffix != ".csv":
+        with open(file) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    records = []
+    with open(file, newline="") as f:
+        for row in csv.DictReader(f):
+            for key in ("time", "wall", "user", "system"):
+                row[key] = float(row[key])
+            row["nproc"], row["max_rss"] = int(row["nproc"]), int(row["max_rss"])
+            row["returncode"] = int(row["returncode"]) if row["returncode"] else None
+            row["cached"] = row["cached"] == "True"
+            row["input_bytes"] = json.loads(row["input_bytes"])
+            records.append(row)
+    return records
+
+
+def summarize(records, by=("prog", "params")) -> list:
+    """
+    Aggregate metrics records per group.
+
+    Runs restored from the cache are counted but left out of the timings.
+
+    Parameters
+    ----------
+    records : list of dict
+        Records as returned by :func:`load_metrics`.
+    by : tuple of str
+        Record fields defining a group, e.g. ``("prog",)`` or ``("prog", "params", "nproc")``.
+
+    Returns
+    -------
+    list of dict
+        One row per group with the group fields, ``runs``, ``cached``, ``failed``,
+        ``wall_mean``, ``wall_max``, ``cpu_mean`` (CPU seconds), ``rss_max`` (bytes),
+        ``input_bytes`` (mean total size) and ``efficiency`` (CPU time over wall time
+        times ranks; near 1 when every rank is busy).
+    """
+    groups = {}
+    for rec in records:
+        groups.setdefault(tuple(rec[key] for key in by), []).append(rec)
+    rows = []
+    for key, recs in groups.items():
+        runs = [r for r in recs if not r["cached"]]
+        row = dict(zip(by, key))
+        row.update(
+            runs=len(runs),
+            cached=len(recs) - len(runs),
+            failed=sum(1 for r in runs if r["returncode"]),
+        )
+        if runs:
+            n = len(runs)
+            walls = [r["wall"] for r in runs]
+            busy = sum(r["wall"] * r["nproc"] for r in runs)
+            row.update(
+                wall_mean=sum(walls) / n,
+                wall_max=max(walls),
+                cpu_mean=sum(r["user"] + r["system"] for r in runs) / n,
+                rss_max=max(r["max_rss"] for r in runs),
+                input_bytes=sum(sum(r["input_bytes"].values()) for r in runs) / n,
+                efficiency=sum(r["user"] + r["system"] for r in runs) / busy if busy else None,
+            )
+        rows.append(row)
+    return rows
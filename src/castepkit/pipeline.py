@@ -0,0 +1,329 @@
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from castepkit.utils import hash_file
+
+__all__ = ["Node", "Pipeline", "shg_pipeline"]
+
+
+@dataclass
+class Node:
+    """
+    One step of a :class:`Pipeline`.
+
+    Attributes
+    ----------
+    name : str
+        Unique name of the step.
+    func : callable
+        Called as ``func(**kwargs)`` to produce the outputs.
+    inputs : list of str
+        Files read by the step. A step depends on every step that declares one of its
+        inputs as an output.
+    outputs : list of str
+        Files the step must produce.
+    kwargs : dict
+        Keyword arguments for ``func``; part of the up-to-date check in ``hash`` mode.
+    after : list of str
+        Names of extra steps that must finish first.
+    locks : list of str
+        Named resources; steps sharing a lock never run at the same time.
+    """
+
+    name: str
+    func: callable
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    kwargs: dict = field(default_factory=dict)
+    after: list = field(default_factory=list)
+    locks: list = field(default_factory=list)
+
+
+class Pipeline:
+    """
+    Make-style runner for a DAG of wrapper calls.
+
+    Steps whose outputs are up to date are skipped, independent branches run
+    concurrently and, after a failure, only the failed step and its dependents are
+    re-run on the next invocation.
+
+    Parameters
+    ----------
+    state_file : str or Path
+        JSON file recording the last successful run of every step.
+    check : str
+        ``"mtime"``: a step is up to date when all its outputs exist and are newer than
+        its inputs. ``"hash"``: when all outputs exist and the hashes of its inputs and
+        its keyword arguments match the last successful run.
+    """
+
+    def __init__(self, state_file=".castepkit_pipeline.json", check="mtime"):
+        if check not in ("mtime", "hash"):
+            raise ValueError(f"Unknown check mode: {check}")
+        self.state_file = Path(state_file)
+        self.check = check
+        self.nodes = {}
+
+    def add(self, name, func, inputs=(), outputs=(), after=(), locks=(), **kwargs) -> Node:
+        """Add a step; see :class:`Node` for the arguments."""
+        if name in self.nodes:
+            raise ValueError(f"Duplicate pipeline step: {name}")
+        node = Node(name, func, list(inputs), list(outputs), kwargs, list(after), list(locks))
+        self.nodes[name] = node
+        return node
+
+    def dependencies(self) -> dict:
+        """Map every step name to the set of step names it depends on."""
+        producers = {}
+        for node in self.nodes.values():
+            for out in node.outputs:
+                if out in producers:
+                    raise ValueError(f"{out} is produced by both {producers[out]} and {node.name}")
+                producers[out] = node.name
+        deps = {}
+        for node in self.nodes.values():
+            unknown = [name for name in node.after if name not in self.nodes]
+            if unknown:
+                raise ValueError(f"Step {node.name} runs after unknown steps {unknown}")
+            upstream = {producers[f] for f in node.inputs if f in producers}
+            deps[node.name] = upstream | set(node.after)
+        return deps
+
+    def order(self) -> list:
+        """Step names in a topological order; raises ``ValueError`` on cycles."""
+        deps = self.dependencies()
+        done, result = set(), []
+        while len(result) < len(deps):
+            ready = [name for name in deps if name not in done and deps[name] <= done]
+            if not ready:
+                raise ValueError(f"Cycle between steps {sorted(set(deps) - done)}")
+            result.extend(ready)
+            done.update(ready)
+        return result
+
+    def _load_state(self) -> dict:
+        if self.state_file.is_file():
+            return json.loads(self.state_file.read_text())
+        return {}
+
+    def _save_state(self, state):
+        tmp = self.state_file.with_name(f".{self.state_file.name}.tmp")
+        tmp.write_text(json.dumps(state, indent=2))
+        os.replace(tmp, self.state_file)
+
+    def _fingerprint(self, node) -> dict:
+        return {
+            "inputs": {f: hash_file(f) for f in node.inputs if Path(f).is_file()},
+            "kwargs": repr(sorted(node.kwargs.items())),
+        }
+
+    def is_up_to_date(self, node, state=None) -> bool:
+        """Whether ``node`` can be skipped (steps without outputs always run)."""
+        outputs = [Path(f) for f in node.outputs]
+        if not outputs or not all(f.is_file() for f in outputs):
+            return False
+        if self.check == "hash":
+            record = (state or {}).get(node.name, {})
+            if record.get("status") != "done":
+                return False
+            return record.get("fingerprint") == self._fingerprint(node)
+        inputs = [Path(f) for f in node.inputs if Path(f).is_file()]
+        if not inputs:
+            return True
+        return min(f.stat().st_mtime for f in outputs) >= max(f.stat().st_mtime for f in inputs)
+
+    def _run_node(self, node):
+        start = time.time()
+        node.func(**node.kwargs)
+        missing = [f for f in node.outputs if not Path(f).is_file()]
+        if missing:
+            raise FileNotFoundError(f"Step {node.name} did not produce {missing}")
+        return time.time() - start
+
+    def run(self, max_workers=None, force=False, dry_run=False) -> dict:
+        """
+        Run all steps that are not up to date.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            Maximum number of steps running at the same time (default: unbounded).
+        force : bool
+            Re-run every step.
+        dry_run : bool
+            Only report what would run.
+
+        Returns
+        -------
+        dict
+            Mapping from step name to ``"done"``, ``"skipped"`` (up to date),
+            ``"failed"`` or ``"blocked"`` (an upstream step failed).
+        """
+        deps = self.dependencies()
+        order = self.order()
+        state = self._load_state()
+        status = {}
+
+        def _skippable(name):
+            # Up to date, and no upstream step is about to produce new inputs.
+            return (
+                not force
+                and all(status.get(dep) == "skipped" for dep in deps[name])
+                and self.is_up_to_date(self.nodes[name], state)
+            )
+
+        if dry_run:
+            for name in order:
+                status[name] = "skipped" if _skippable(name) else "pending"
+                print(f"  {status[name]:<8} {name}")
+            return status
+
+        pending = list(order)
+        running = {}
+        held_locks = set()
+        with ThreadPoolExecutor(max_workers=max_workers or max(1, len(order))) as pool:
+            while pending or running:
+                for name in list(pending):
+                    node = self.nodes[name]
+                    if any(status.get(dep) in ("failed", "blocked") for dep in deps[name]):
+                        status[name] = "blocked"
+                        pending.remove(name)
+                        print(f"⏭️  {name}: blocked by a failed upstream step")
+                    elif all(status.get(dep) in ("done", "skipped") for dep in deps[name]):
+                        if _skippable(name):
+                            status[name] = "skipped"
+                            pending.remove(name)
+                            print(f"✅ {name}: up to date")
+                        elif not held_locks.intersection(node.locks):
+                            held_locks.update(node.locks)
+                            pending.remove(name)
+                            print(f"▶️  {name}: running")
+                            running[pool.submit(self._run_node, node)] = name
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Pipeline stalled with pending steps {pending}")
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    held_locks.difference_update(self.nodes[name].locks)
+                    try:
+                        elapsed = future.result()
+                    except Exception:
+                        status[name] = "failed"
+                        state[name] = {"status": "failed", "time": time.time()}
+                        print(f"❌ {name}: failed")
+                        traceback.print_exc()
+                    else:
+                        status[name] = "done"
+                        state[name] = {
+                            "status": "done",
+                            "time": time.time(),
+                            "elapsed": elapsed,
+                            "fingerprint": self._fingerprint(self.nodes[name]),
+                        }
+                        print(f"✅ {name}: done in {elapsed:.1f} s")
+                    self._save_state(state)
+        return status
+
+
+def shg_pipeline(
+    prefix: str,
+    directions=("123",),
+    atom_cutting: bool = False,
+    ome: bool = False,
+    density: bool = True,
+    wden_format: int = 3,
+    check: str = "mtime",
+    **shg_kwargs,
+) -> Pipeline:
+    """
+    Build the standard atom_cutting -> ome -> shg -> weighted_den pipeline.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    directions : list of str
+        SHG directions. Each runs in its own directory (see ``run_shg_isolated``); the
+        first one is band-resolved when ``density`` is on.
+    atom_cutting : bool
+        Start with ``run_atom_cutting`` to produce ``{prefix}.cutatom_check``.
+    ome : bool
+        Run ``run_ome`` to produce ``{prefix}.cst_ome`` before SHG.
+    density : bool
+        Run ``run_weighted_den`` on the veocc/veunocc weights of the first direction.
+    wden_format : int
+        weighted_den.x output format: 1=.pot, 2=.check, 3=.grd.
+    check : str
+        Up-to-date check of the pipeline, ``"mtime"`` or ``"hash"``.
+    **shg_kwargs
+        Further keyword arguments for ``run_shg`` (scissors, unit, ...).
+
+    Returns
+    -------
+    Pipeline
+        The pipeline, with its state in ``{prefix}.pipeline.json``.
+    """
+    # Imported here so that building the generic engine does not need the wrappers.
+    from castepkit.wrappers.atom_cutting import run_atom_cutting
+    from castepkit.wrappers.ome import run_ome
+    from castepkit.wrappers.shg import run_shg_isolated
+    from castepkit.wrappers.weighted_dens import run_weighted_den
+
+    pipe = Pipeline(state_file=f"{prefix}.pipeline.json", check=check)
+    castep = [f"{prefix}.cell", f"{prefix}.param"]
+
+    if atom_cutting:
+        pipe.add(
+            "atom_cutting",
+            run_atom_cutting,
+            inputs=castep + [f"{prefix}.switch", f"{prefix}.bands", f"{prefix}.orbitals"],
+            outputs=[f"{prefix}.cutatom_check"],
+            prefix=prefix,
+        )
+    if ome:
+        pipe.add(
+            "ome",
+            run_ome,
+            inputs=castep + [f"{prefix}.cutatom_check"],
+            outputs=[f"{prefix}.cst_ome"],
+            prefix=prefix,
+        )
+
+    shg_inputs = [f"{prefix}.bands", f"{prefix}.cell"] + ([f"{prefix}.cst_ome"] if ome else [])
+    ext = {1: "pot", 2: "check", 3: "grd"}.get(wden_format, "grd")
+    for i, direction in enumerate(directions):
+        outputs = [f"{prefix}.chi{direction}"]
+        band_resolved = int(density and i == 0)
+        if band_resolved:
+            outputs += [f"{prefix}.shg_weight_veocc", f"{prefix}.shg_weight_veunocc"]
+        pipe.add(
+            f"shg_{direction}",
+            run_shg_isolated,
+            inputs=shg_inputs,
+            outputs=outputs,
+            prefix=prefix,
+            direction=direction,
+            collect=outputs,
+            **{**shg_kwargs, "band_resolved": band_resolved},
+        )
+        if band_resolved:
+            for suffix in ("veocc", "veunocc"):
+                weight_file = f"{prefix}.shg_weight_{suffix}"
+                pipe.add(
+                    f"weighted_den_{suffix}",
+                    run_weighted_den,
+                    inputs=[weight_file],
+                    outputs=[f"{prefix}_{suffix}.{ext}"],
+                    prefix=prefix,
+                    weight_file=weight_file,
+                    suffix=suffix,
+                    output_format=wden_format,
+                )
+    return pipe
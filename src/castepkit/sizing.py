@@ -0,0 +1,171 @@
+import math
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from castepkit.io.bands import BOHR_TO_ANGSTROM, read_bands_header
+from castepkit.io.cell import read_cell
+from castepkit.metrics import load_metrics
+
+__all__ = ["RankPlan", "problem_size", "plan_ranks"]
+
+# Cores available to one run when not given; set by run_campaign for its child processes.
+NCORES_ENV = "CASTEPKIT_NCORES"
+
+# Below this many CPU seconds per rank, MPI start-up and communication dominate.
+MIN_SECONDS_PER_RANK = 60.0
+
+HARTREE_TO_EV = 27.211386245988
+
+# "key : value [unit]" on one line; comment lines start with "!" or "#" and do not match.
+_PARAM_LINE = re.compile(r"^[ \t]*(\w+)(?:[ \t]*[:=][ \t]*|[ \t]+)([-+.\w]+)(?:[ \t]+(\w+))?", re.M)
+
+
+def _read_param(filename) -> dict:
+    """Keyword/value pairs of a CASTEP ``.param`` file, keys lower-case; comments skipped."""
+    values = {}
+    for key, value, unit in _PARAM_LINE.findall(Path(filename).read_text()):
+        values[key.lower()] = (value, unit.lower())
+    return values
+
+
+def _grid_points(lattice, param_file):
+    """Estimate of the standard FFT grid from the cutoff energy and grid scale."""
+    if not Path(param_file).is_file():
+        return None
+    param = _read_param(param_file)
+    if "cut_off_energy" not in param:
+        return None
+    value, unit = param["cut_off_energy"]
+    cutoff = float(value) / (1.0 if unit == "ha" else HARTREE_TO_EV)
+    scale = float(param.get("grid_scale", ("1.75", ""))[0])
+    gmax = math.sqrt(2.0 * cutoff)  # bohr^-1
+    lengths = np.linalg.norm(lattice, axis=1) / BOHR_TO_ANGSTROM
+    return tuple(int(math.ceil(2 * scale * gmax * a / (2 * math.pi))) for a in lengths)
+
+
+def problem_size(prefix) -> dict:
+    """
+    Size of a calculation from its ``.bands``, ``.cell`` and ``.param`` files.
+
+    Returns
+    -------
+    dict
+        ``nkpts``, ``nspins``, ``nbands``, ``natoms`` (None without a ``.cell``),
+        ``grid`` (estimated standard FFT grid, None without a cutoff in the ``.param``),
+        ``bands_bytes`` (size of the ``.bands`` file) and ``units``, the number of
+        independent k-point/spin work items the programs distribute over ranks.
+    """
+    bands = Path(f"{prefix}.bands")
+    header = read_bands_header(bands)
+    cell = Path(f"{prefix}.cell")
+    natoms = len(read_cell(cell)["symbols"]) if cell.is_file() else None
+    return {
+        "nkpts": header["nkpts"],
+        "nspins": header["nspins"],
+        "nbands": header["nbands"],
+        "natoms": natoms,
+        "grid": _grid_points(header["lattice"], f"{prefix}.param"),
+        "bands_bytes": bands.stat().st_size,
+        "units": header["nkpts"] * header["nspins"],
+    }
+
+
+def _cpu_per_byte(prog_key, records=None):
+    """Median CPU seconds per byte of ``.bands`` input over successful recorded runs."""
+    rates = []
+    for rec in load_metrics() if records is None else records:
+        if rec["prog"] != prog_key or rec["cached"] or rec["returncode"]:
+            continue
+        size = sum(v for k, v in rec["input_bytes"].items() if k.endswith(".bands"))
+        cpu = rec["user"] + rec["system"]
+        if size and cpu > 0:
+            rates.append(cpu / size)
+    return float(np.median(rates)) if rates else None
+
+
+@dataclass
+class RankPlan:
+    """
+    MPI ranks and OpenMP threads chosen for one run.
+
+    Attributes
+    ----------
+    nproc : int
+        Number of MPI ranks.
+    threads : int
+        OpenMP threads per rank, filling the remaining cores of the budget.
+    budget : int
+        Cores available to the run.
+    units : int or None
+        Independent k-point/spin work items (None when the size is unknown).
+    predicted_cpu : float or None
+        CPU seconds expected from the timing history.
+    reason : str
+        What limited ``nproc``.
+    """
+
+    nproc: int
+    threads: int
+    budget: int
+    units: int = None
+    predicted_cpu: float = None
+    reason: str = ""
+
+
+def plan_ranks(
+    prog_key: str,
+    prefix=None,
+    ncores: int = None,
+    concurrent: int = 1,
+    records=None,
+    min_seconds: float = MIN_SECONDS_PER_RANK,
+) -> RankPlan:
+    """
+    Choose the number of MPI ranks for running ``prog_key`` on ``prefix``.
+
+    The programs distribute k-points and spins over ranks, so the rank count never
+    exceeds the number of work items and is chosen to divide them as evenly as possible:
+    the fewest ranks that need the same number of rounds. When the metrics history has
+    successful runs of the same program, the CPU time is predicted from the size of the
+    ``.bands`` file and small jobs get fewer ranks, each with at least ``min_seconds``
+    of work.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable.
+    prefix : str or Path, optional
+        Prefix of the calculation (with directory); without it the whole budget is used.
+    ncores : int, optional
+        Cores available (default: ``$CASTEPKIT_NCORES``, else ``os.cpu_count()``).
+    concurrent : int
+        Number of jobs sharing ``ncores``.
+    records : list of dict, optional
+        Metrics records to calibrate with (default: the configured metrics file).
+    min_seconds : float
+        Minimum predicted CPU seconds per rank.
+
+    Returns
+    -------
+    RankPlan
+        The chosen ranks and threads.
+    """
+    ncores = ncores or int(os.environ.get(NCORES_ENV, 0)) or os.cpu_count() or 1
+    budget = max(1, ncores // max(1, concurrent))
+    if prefix is None or not Path(f"{prefix}.bands").is_file():
+        return RankPlan(budget, 1, budget, reason="problem size unknown; whole budget")
+
+    size = problem_size(prefix)
+    units = size["units"]
+    cap, reason = min(budget, units), "core budget" if budget < units else "k-point/spin count"
+    rate = _cpu_per_byte(prog_key, records)
+    predicted = rate * size["bands_bytes"] if rate is not None else None
+    if predicted is not None and predicted / min_seconds < cap:
+        cap, reason = max(1, int(predicted // min_seconds)), "timing history"
+    rounds = math.ceil(units / cap)
+    nproc = math.ceil(units / rounds)
+    return RankPlan(nproc, max(1, budget // nproc), budget, units, predicted, reason)
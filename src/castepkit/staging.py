@@ -0,0 +1,187 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from castepkit.cache import parse_size
+from castepkit.config import get_staging_settings
+from castepkit.utils import arun_program, run_program
+
+__all__ = ["stage_files", "run_staged", "arun_staged"]
+
+
+def _place(src, dst, link) -> bool:
+    """Hardlink (when allowed and on the same filesystem) or copy ``src`` to ``dst``."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if link:
+        try:
+            os.link(src, dst)
+            return True
+        except OSError:
+            pass
+    # Copy under a temporary name so a reader never sees a partial file.
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return False
+
+
+def stage_files(pairs, workers=4, link=True) -> int:
+    """
+    Copy or hardlink files in parallel.
+
+    Parameters
+    ----------
+    pairs : list of (Path, Path)
+        Source and destination of every file.
+    workers : int
+        Number of concurrent copies.
+    link : bool
+        Hardlink instead of copying where source and destination share a filesystem.
+
+    Returns
+    -------
+    int
+        Number of bytes copied (hardlinked files do not count).
+    """
+    pairs = list(pairs)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs) or 1))) as pool:
+        linked = list(pool.map(lambda p: _place(p[0], p[1], link), pairs))
+    return sum(src.stat().st_size for (src, _), was_linked in zip(pairs, linked) if not was_linked)
+
+
+def _relative(f) -> Path:
+    """Path of a file inside the stage: as given, or just its name if it leaves ``cwd``."""
+    f = Path(f)
+    return Path(f.name) if f.is_absolute() or ".." in f.parts else f
+
+
+def _same_filesystem(a, b) -> bool:
+    return os.stat(a).st_dev == os.stat(b).st_dev
+
+
+def run_staged(
+    prog_key, input_str, args=None, inputs=(), outputs=(), cwd=None, nproc=None, scratch=None
+):
+    """
+    Run an external executable in node-local scratch space.
+
+    The ``inputs`` are hardlinked (same filesystem) or copied in parallel to a fresh
+    directory under the ``[staging] dir`` (``$TMPDIR`` or ``/dev/shm`` by default), keeping
+    their paths relative to ``cwd``. Declared ``outputs`` that already exist in ``cwd``,
+    such as the ``.castep`` log the programs append to, are copied in as well, never
+    linked, so the original is only replaced once the run is over. The program runs there
+    through :func:`castepkit.utils.run_program`; afterwards the declared ``outputs`` that
+    exist are copied back to ``cwd`` and the scratch directory is removed, also when the
+    run fails.
+    When the scratch filesystem lacks room for the inputs plus ``[staging] reserve``, the
+    program runs in ``cwd`` instead.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable in the ``[executables]`` config section.
+    input_str : str
+        Text written to the program's stdin.
+    args : list of str, optional
+        Command-line arguments.
+    inputs : list of str or Path
+        Input files relative to ``cwd``; missing files are skipped.
+    outputs : list of str or Path
+        Output files relative to ``cwd`` to bring back; existing ones are staged in first.
+    cwd : str or Path, optional
+        Directory holding the inputs (default: current directory).
+    nproc : int, optional
+        Number of MPI ranks, overriding the config value.
+    scratch : str or Path, optional
+        Scratch root, overriding ``[staging] dir``.
+
+    Returns
+    -------
+    ProgramOutput
+        stdout, stderr and metrics of the run.
+    """
+    stage = _stage_in(prog_key, inputs, outputs, cwd, scratch)
+    if stage is None:
+        return run_program(prog_key, input_str, args, cwd=cwd, nproc=nproc)
+    try:
+        return run_program(prog_key, input_str, args, cwd=stage, nproc=nproc)
+    finally:
+        _stage_out(stage, outputs, cwd)
+
+
+async def arun_staged(
+    prog_key, input_str, args=None, inputs=(), outputs=(), cwd=None, nproc=None, scratch=None
+):
+    """
+    Async counterpart of :func:`run_staged`; the copies run in worker threads.
+    """
+    stage = await asyncio.to_thread(_stage_in, prog_key, inputs, outputs, cwd, scratch)
+    if stage is None:
+        return await arun_program(prog_key, input_str, args, cwd=cwd, nproc=nproc)
+    try:
+        return await arun_program(prog_key, input_str, args, cwd=stage, nproc=nproc)
+    finally:
+        # Shielded so a cancelled run still brings back its partial outputs.
+        await asyncio.shield(asyncio.to_thread(_stage_out, stage, outputs, cwd))
+
+
+def _stage_in(prog_key, inputs, outputs, cwd, scratch):
+    """
+    Create the stage and fill it with the inputs and the existing outputs; None to run in
+    ``cwd`` instead.
+    """
+    settings = get_staging_settings()
+    root = Path(scratch or settings["dir"])
+    workdir = Path(cwd or ".")
+    files = [(workdir / f, _relative(f)) for f in inputs if (workdir / f).is_file()]
+    staged = {rel for _, rel in files}
+    # Outputs the program appends to or rewrites: copies, so the originals stay intact.
+    previous = [
+        (workdir / f, _relative(f))
+        for f in outputs
+        if (workdir / f).is_file() and _relative(f) not in staged
+    ]
+    if not root.is_dir():
+        print(f"❌ Scratch directory {root} does not exist; running in {workdir}")
+        return None
+
+    link = _same_filesystem(workdir, root)
+    need = sum(f.stat().st_size for f, _ in previous)
+    need += 0 if link else sum(f.stat().st_size for f, _ in files)
+    free = shutil.disk_usage(root).free
+    if need + parse_size(settings["reserve"]) > free:
+        print(
+            f"❌ Not enough space in {root} to stage {prog_key} inputs "
+            f"({need / 1024**3:.2f} GB needed, {free / 1024**3:.2f} GB free); running in {workdir}"
+        )
+        return None
+
+    stage = Path(tempfile.mkdtemp(prefix=f"castepkit-{prog_key}-", dir=root))
+    try:
+        start = time.monotonic()
+        pairs = [(f, stage / rel) for f, rel in files]
+        copied = stage_files(pairs, settings["workers"], link)
+        copied += stage_files([(f, stage / rel) for f, rel in previous], settings["workers"], False)
+    except BaseException:
+        shutil.rmtree(stage, ignore_errors=True)
+        raise
+    print(
+        f"📦 Staged {len(pairs) + len(previous)} {prog_key} inputs ({copied / 1024**2:.1f} MB copied) "
+        f"to {stage} in {time.monotonic() - start:.1f} s"
+    )
+    return stage
+
+
+def _stage_out(stage, outputs, cwd):
+    """Copy back whatever outputs were produced, even by a failed run, and remove the stage."""
+    workdir = Path(cwd or ".")
+    try:
+        back = [(stage / _relative(f), workdir / f) for f in outputs]
+        back = [(src, dst) for src, dst in back if src.is_file()]
+        stage_files(back, get_staging_settings()["workers"], link=False)
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
@@ -0,0 +1,178 @@
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+
+from castepkit.io.cell import read_cell
+
+__all__ = ["point_group_rotations", "ShgTensorPlan", "plan_shg_tensor"]
+
+# All 27 index strings in the order used by NewSHG_ZY-XTIPC.x, e.g. '123' = xyz.
+DIRECTIONS = ["".join(ijk) for ijk in itertools.product("123", repeat=3)]
+
+
+def _lattice_rotations(metric, tol) -> np.ndarray:
+    """
+    Integer matrices W acting on fractional coordinates with ``W^T G W = G``.
+
+    Column j of W holds the fractional coordinates of the image of lattice vector j, a
+    lattice vector of the same length. Its entries are bounded by
+    ``|n_i| <= sqrt(G_jj (G^-1)_ii)``, which holds in any setting of the cell, so skewed
+    (non-reduced) cells need no reduction first.
+    """
+    inverse = np.linalg.inv(metric)
+    columns = []
+    for j in range(3):
+        bound = np.floor(np.sqrt(metric[j, j] * np.diag(inverse)) + 1e-6).astype(int)
+        box = np.array(list(itertools.product(*(range(-b, b + 1) for b in bound))))
+        lengths = np.einsum("ni,ij,nj->n", box, metric, box)
+        columns.append(box[np.abs(lengths - metric[j, j]) < tol])
+
+    candidates = []
+    for c0, c1 in itertools.product(columns[0], columns[1]):
+        if abs(c0 @ metric @ c1 - metric[0, 1]) < tol:
+            candidates.extend(np.column_stack([c0, c1, c2]) for c2 in columns[2])
+    candidates = np.array(candidates, dtype=int).reshape(-1, 3, 3)
+    rotated_metric = np.einsum("nji,jk,nkl->nil", candidates, metric, candidates)
+    keep = np.all(np.abs(rotated_metric - metric) < tol, axis=(1, 2))
+    return candidates[keep]
+
+
+def point_group_rotations(lattice, positions, symbols, symprec=1e-4) -> np.ndarray:
+    """
+    Find the point-group rotations of a crystal.
+
+    Candidate operations are the integer matrices acting on fractional coordinates that
+    preserve the metric, with entries bounded by the metric so that cells of any shape
+    are handled; an operation is kept if some translation maps every atom onto an atom
+    of the same species.
+
+    Parameters
+    ----------
+    lattice : array_like
+        (3, 3) lattice vectors as rows.
+    positions : array_like
+        (N, 3) fractional coordinates.
+    symbols : list of str
+        Species label of every atom.
+    symprec : float
+        Tolerance on fractional coordinates and on the metric.
+
+    Returns
+    -------
+    np.ndarray
+        (n_ops, 3, 3) rotation matrices in Cartesian coordinates.
+    """
+    lattice = np.asarray(lattice, dtype=float)
+    positions = np.asarray(positions, dtype=float) % 1.0
+    symbols = np.asarray(symbols)
+
+    metric = lattice @ lattice.T
+    candidates = _lattice_rotations(metric, symprec * np.abs(metric).max())
+
+    rotations = []
+    for w in candidates:
+        new = positions @ w.T
+        for j in np.flatnonzero(symbols == symbols[0]):
+            shift = positions[j] - new[0]
+            diff = (new + shift)[:, None, :] - positions[None, :, :]
+            diff -= np.round(diff)
+            match = np.all(np.abs(diff) < symprec, axis=2) & (symbols[:, None] == symbols)
+            if match.any(axis=1).all():
+                # x' = W x in fractional coordinates is R = L^T W L^-T in Cartesian ones.
+                rotations.append(lattice.T @ w @ np.linalg.inv(lattice.T))
+                break
+    return np.array(rotations)
+
+
+@dataclass
+class ShgTensorPlan:
+    """
+    Independent components of the SHG tensor chi(2)_ijk for a given point group.
+
+    Attributes
+    ----------
+    rotations : np.ndarray
+        (n_ops, 3, 3) Cartesian point-group rotations.
+    basis : np.ndarray
+        (27, r) orthonormal basis of the symmetry-allowed tensors, rows in the
+        order of ``DIRECTIONS``.
+    directions : list of str
+        Minimal set of ``r`` direction strings to compute with ``run_shg``.
+    """
+
+    rotations: np.ndarray
+    basis: np.ndarray
+    directions: list
+
+    @property
+    def zero_directions(self) -> list:
+        """Direction strings that vanish by symmetry."""
+        norms = np.linalg.norm(self.basis, axis=1)
+        return [d for d, n in zip(DIRECTIONS, norms) if n < 1e-8]
+
+    def rebuild(self, values: dict) -> np.ndarray:
+        """
+        Rebuild the full tensor from the independent components.
+
+        Parameters
+        ----------
+        values : dict
+            Mapping from every direction in ``self.directions`` to a scalar or array
+            (e.g. a complex spectrum). All values must have the same shape.
+
+        Returns
+        -------
+        np.ndarray
+            Tensor of shape (3, 3, 3) + value shape.
+        """
+        stacked = np.array([values[d] for d in self.directions])
+        rows = [DIRECTIONS.index(d) for d in self.directions]
+        if not rows:
+            return np.zeros((3, 3, 3))
+        flat = stacked.reshape(len(rows), -1)
+        coeffs = np.linalg.solve(self.basis[rows], flat)
+        return (self.basis @ coeffs).reshape((3, 3, 3) + stacked.shape[1:])
+
+
+def plan_shg_tensor(cell_file, symprec=1e-4) -> ShgTensorPlan:
+    """
+    Work out which SHG tensor components have to be computed for a crystal.
+
+    The symmetry-allowed tensors are the range of the projector averaging
+    ``R (x) R (x) R`` over the point group, combined with the intrinsic permutation
+    symmetry chi_ijk = chi_ikj. Components are then picked greedily in the order of
+    ``DIRECTIONS`` until they span that space.
+
+    Parameters
+    ----------
+    cell_file : str or Path
+        CASTEP ``.cell`` file, e.g. ``f"{prefix}.cell"``.
+    symprec : float
+        Tolerance passed to :func:`point_group_rotations`.
+
+    Returns
+    -------
+    ShgTensorPlan
+        The plan with the directions to pass to ``run_shg``.
+    """
+    cell = read_cell(cell_file)
+    rotations = point_group_rotations(cell["lattice"], cell["positions"], cell["symbols"], symprec)
+
+    projector = np.mean([np.einsum("il,jm,kn->ijklmn", r, r, r) for r in rotations], axis=0)
+    swap = np.einsum("il,jn,km->ijklmn", *3 * [np.eye(3)])
+    projector = (projector + np.einsum("ijkabc,abclmn->ijklmn", swap, projector)) / 2
+    projector = projector.reshape(27, 27)
+
+    u, s, _ = np.linalg.svd(projector)
+    basis = u[:, s > 0.5]
+    basis[np.abs(basis) < 1e-10] = 0.0
+
+    directions, rows = [], []
+    for index, direction in enumerate(DIRECTIONS):
+        if np.linalg.matrix_rank(basis[rows + [index]], tol=1e-8) > len(rows):
+            directions.append(direction)
+            rows.append(index)
+        if len(rows) == basis.shape[1]:
+            break
+    return ShgTensorPlan(rotations=rotations, basis=basis, directions=directions)
@@ -0,0 +1,440 @@
+"""
+Stand-in executables for the wrapped Fortran programs.
+
+The fakes speak the same stdin/argument protocol as NewSHG_ZY-XTIPC.x, weighted_den.x,
+calculate_ome and atom_cutting, check the input files the real programs need, spend a
+configurable amount of wall time, CPU time and memory, and write outputs of a given size
+in the real file formats. :func:`install_fakes` writes them as executables together with
+a ``config.toml`` whose ``[executables]`` point at them, so the whole wrapper layer
+(caching, staging, batches, pipelines) runs without the real binaries::
+
+    config = install_fakes(tmp_path, sleep=0.1, output_size="10MB")
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+
+The fakes only use the standard library, so their start-up cost stays close to that of
+the Python interpreter.
+
+:func:`install_scheduler_stub` does the same for Slurm: its ``sbatch`` runs the tasks of
+a job array on a local pool of processes, so generated job-array scripts can be tested on
+a workstation.
+"""
+
+import json
+import math
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+__all__ = [
+    "FakeSpec",
+    "FAKE_PROGRAMS",
+    "install_fakes",
+    "fake_main",
+    "install_scheduler_stub",
+    "sbatch_main",
+]
+
+# Units accepted by size strings, as in ``[cache] max_size``.
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+@dataclass
+class FakeSpec:
+    """
+    Behaviour of a fake program.
+
+    Attributes
+    ----------
+    sleep : float
+        Seconds spent idle, like a rank waiting on I/O or communication.
+    cpu : float
+        Seconds of CPU time burnt in a busy loop.
+    memory : int or str
+        Bytes allocated and touched before the work, e.g. ``"200MB"``.
+    output_size : int or str
+        Approximate size of every main output file.
+    returncode : int
+        Exit code; non-zero exits fail before any output is written.
+    """
+
+    sleep: float = 0.0
+    cpu: float = 0.0
+    memory: object = 0
+    output_size: object = "64KB"
+    returncode: int = 0
+
+
+def _size(value) -> int:
+    """Bytes in an int or a size string such as ``"1.5GB"``."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = value.strip().upper().removesuffix("B").removesuffix("I")
+    number = text.rstrip("KMGT")
+    return int(float(number) * _UNITS[text[len(number) :]])
+
+
+def _fail(message, code=2):
+    print(message, file=sys.stderr)
+    sys.exit(code)
+
+
+def _require(*files):
+    missing = [f for f in files if not Path(f).is_file()]
+    if missing:
+        _fail(f"ERROR: missing input files: {' '.join(missing)}")
+
+
+def _work(spec: FakeSpec):
+    """Allocate, burn CPU and sleep as configured."""
+    memory = _size(spec.memory)
+    block = bytearray(memory)
+    for i in range(0, memory, 4096):  # touch every page so it counts in the RSS
+        block[i] = 1
+    end = time.process_time() + spec.cpu
+    x = 0
+    while time.process_time() < end:
+        for i in range(10000):
+            x += i * i
+    time.sleep(spec.sleep)
+    del block
+
+
+def _write_binary(filename, size):
+    """Fortran-unformatted-looking file: records of zeros between 4-byte length markers."""
+    record = min(size, 1024**2)
+    marker = record.to_bytes(4, "little")
+    with open(filename, "wb") as f:
+        for _ in range(max(1, size // (record + 8))):
+            f.write(marker + bytes(record) + marker)
+
+
+def _write_grd(filename, size, title):
+    """A ``.grd`` grid with about ``size`` bytes of values (13 bytes each)."""
+    n = max(2, round((size / 13) ** (1 / 3)))
+    values = [f"{math.sin(0.1 * i) ** 2:12.5E}\n" for i in range(n * n)]
+    with open(filename, "w") as f:
+        f.write(f"{title}\n(1p,e12.5)\n")
+        f.write(" ".join(f"{x:10.4f}" for x in (5.65, 5.65, 5.65, 60.0, 60.0, 60.0)) + "\n")
+        f.write(f"{n:6d}{n:6d}{n:6d}\n")
+        f.write(f"{1:6d}{0:6d}{n - 1:6d}{0:6d}{n - 1:6d}{0:6d}{n - 1:6d}\n")
+        for _ in range(n):
+            f.writelines(values)
+
+
+def _write_chi(filename, size):
+    """An SHG spectrum: energy and the real and imaginary parts of chi(2)."""
+    npoints = max(2, size // 48)
+    with open(filename, "w") as f:
+        f.write("# Energy (eV)    Re chi(2) (pm/V)    Im chi(2) (pm/V)\n")
+        for i in range(npoints):
+            e = 10.0 * i / (npoints - 1)
+            f.write(f"{e:16.8f}{math.cos(e) * 50:16.8f}{math.sin(e) * 50:16.8f}\n")
+
+
+def _bands_header(bands_file) -> dict:
+    """``Number of ...`` lines of a ``.bands`` file, e.g. ``{"k-points": 28.0, ...}``."""
+    header = {}
+    with open(bands_file) as f:
+        for line in f:
+            if line.startswith("K-point"):
+                break
+            if line.startswith("Number of"):
+                words = line.split()[2:]
+                n = next(i for i, w in enumerate(words) if w[0].isdigit() or w[0] in "-.")
+                header[" ".join(words[:n])] = float(words[n])
+    return header
+
+
+def _write_shg_weights(bands_file, filename, occupied):
+    """Weights 1 on the occupied (or empty) states, in the blocks of the ``.bands`` file."""
+    header = _bands_header(bands_file)
+    lines = Path(bands_file).read_text().splitlines()
+    first = next(i for i, line in enumerate(lines) if line.startswith("K-point"))
+    nspins = int(header.get("spin components", 1))
+    nbands = int(header["eigenvalues"])
+    nocc = round(header.get("electrons", 0) / (3 - nspins))
+    with open(filename, "w") as f:
+        f.write(f"Number of k-points {int(header['k-points']):8d}\n")
+        f.write(f"Number of spin components {nspins}\n")
+        f.write(f"Number of eigenvalues {nbands:8d}\n")
+        band = 0
+        for line in lines[first:]:
+            if line.startswith(("K-point", "Spin component")):
+                f.write(line + "\n")
+                band = 0
+            elif line.strip():
+                band += 1
+                f.write(f"{float((band <= nocc) == occupied):14.8f}\n")
+
+
+def _shg(prefix, stdin, spec):
+    # scissors, direction, band_resolved, rank_number, unit, output_level, is_metal, ...
+    scissors, direction, band_resolved, is_metal = stdin[0], stdin[1], stdin[2], stdin[6]
+    _require(f"{prefix}.bands", f"{prefix}.cell")
+    _work(spec)
+    name = f"{prefix}.chi_all" if direction == "all" else f"{prefix}.chi{direction}"
+    _write_chi(name, _size(spec.output_size))
+    if band_resolved.strip() == "1":
+        _write_shg_weights(f"{prefix}.bands", f"{prefix}.shg_weight_veocc", True)
+        _write_shg_weights(f"{prefix}.bands", f"{prefix}.shg_weight_veunocc", False)
+    Path(f"{prefix}.castep").write_text(f" SHG direction {direction}\n")
+    print(f" SHG direction {direction}, scissors {float(scissors):.3f} eV, metal {is_metal}")
+    print(f" Spectrum written to {name}")
+
+
+def _weighted_den(prefix, stdin, spec):
+    output_format = int(stdin[0])
+    _require(f"{prefix}.wden_in")
+    weight_file = Path(f"{prefix}.wden_in").read_text().strip()
+    _require(weight_file, f"{prefix}.bands")
+    _work(spec)
+    ext = {1: "pot", 2: "check", 3: "grd"}.get(output_format, "grd")
+    output = f"{prefix}_wden.{ext}"
+    if ext == "grd":
+        _write_grd(output, _size(spec.output_size), f"weighted density of {weight_file}")
+    else:
+        _write_binary(output, _size(spec.output_size))
+    print(f" Weighted density from {weight_file} written to {output}")
+
+
+def _write_ome(filename, bands_file, size):
+    """
+    Optical matrix elements in the CASTEP layout: version, header and one big-endian
+    record of 3 x nbands x nbands complex values per k-point and spin. The dimensions
+    come from the ``.bands`` file, else from ``size`` with 8 bands.
+    """
+    if Path(bands_file).is_file():
+        header = _bands_header(bands_file)
+        nbands = int(header["eigenvalues"])
+        nrecords = int(header["k-points"] * header.get("spin components", 1))
+    else:
+        nbands = 8
+        nrecords = max(1, size // (48 * nbands**2))
+    payload = bytes(48 * nbands**2)
+    with open(filename, "wb") as f:
+        for record in (
+            struct.pack(">d", 1.0),
+            f"{'Generated by castepkit.testing':<80}".encode(),
+            *[payload] * nrecords,
+        ):
+            marker = struct.pack(">i", len(record))
+            f.write(marker + record + marker)
+
+
+def _ome(prefix, stdin, spec):
+    suffix = stdin[0].strip()
+    _require(f"{prefix}.cell", f"{prefix}.param", f"{prefix}.{suffix}")
+    _work(spec)
+    _write_ome(f"{prefix}.cst_ome", f"{prefix}.bands", _size(spec.output_size))
+    Path(f"{prefix}.castep").write_text(f" Optical matrix elements from {prefix}.{suffix}\n")
+    print(f" Optical matrix elements written to {prefix}.cst_ome")
+
+
+def _atom_cutting(prefix, stdin, spec):
+    input_type = stdin[0].strip()
+    _require(f"{prefix}.cell", f"{prefix}.param")
+    _work(spec)
+    size = _size(spec.output_size)
+    _write_binary(f"{prefix}.cutatom_check", size)
+    _write_binary(f"{prefix}.castep_bin", size)
+    _write_grd(f"{prefix}_den.grd", size, "atom-cut density")
+    Path(f"{prefix}.castep").write_text(f" Atom cutting, input type {input_type}\n")
+    print(f" Atom-cut density written to {prefix}_den.grd")
+
+
+FAKE_PROGRAMS = {
+    "shg": _shg,
+    "weighted_den": _weighted_den,
+    "ome": _ome,
+    "atom_cutting": _atom_cutting,
+}
+
+
+def fake_main(prog_key, spec=None, argv=None):
+    """
+    Entry point of a fake program: ``{exe} PREFIX`` with the parameters on stdin.
+
+    Parameters
+    ----------
+    prog_key : str
+        Program to imitate, a key of :data:`FAKE_PROGRAMS`.
+    spec : dict or FakeSpec, optional
+        Behaviour of the run. ``CASTEPKIT_FAKE_<FIELD>`` environment variables, e.g.
+        ``CASTEPKIT_FAKE_SLEEP=2``, override single fields.
+    argv : list of str, optional
+        Command-line arguments (default: ``sys.argv[1:]``).
+    """
+    spec = spec if isinstance(spec, FakeSpec) else FakeSpec(**(spec or {}))
+    for name, value in asdict(spec).items():
+        env = os.environ.get(f"CASTEPKIT_FAKE_{name.upper()}")
+        if env is not None:
+            setattr(spec, name, type(value)(env) if isinstance(value, (int, float)) else env)
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        _fail(f"usage: fake {prog_key} PREFIX", 1)
+    stdin = sys.stdin.read().splitlines() + [""] * 8
+    if spec.returncode:
+        _fail(f"ERROR: fake {prog_key} failing with exit code {spec.returncode}", spec.returncode)
+    FAKE_PROGRAMS[prog_key](argv[0], stdin, spec)
+
+
+def install_fakes(directory, programs=None, config=True, **spec) -> Path:
+    """
+    Write fake executables and a config that uses them.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory for the ``fake_{prog}`` executables and ``config.toml``.
+    programs : dict, optional
+        Per-program :class:`FakeSpec` fields, e.g. ``{"shg": {"sleep": 1.0}}``; they
+        override ``spec``. Programs not listed still get the shared ``spec``.
+    config : bool or str
+        Write ``config.toml`` with an ``[executables]`` entry per fake. A string is
+        appended to it, e.g. ``"[cache]\\nenabled = true\\n"``.
+    **spec
+        :class:`FakeSpec` fields shared by all programs.
+
+    Returns
+    -------
+    Path
+        ``config.toml``, or the directory when ``config`` is False.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for prog_key in FAKE_PROGRAMS:
+        fields = asdict(FakeSpec(**{**spec, **(programs or {}).get(prog_key, {})}))
+        exe = directory / f"fake_{prog_key}"
+        exe.write_text(
+            f"#!{sys.executable}\n"
+            "from castepkit.testing import fake_main\n\n"
+            f"fake_main({prog_key!r}, {fields!r})\n"
+        )
+        exe.chmod(0o755)
+        entries.append(f'{prog_key} = "{exe}"')
+    if config is False:
+        return directory
+    path = directory / "config.toml"
+    extra = config if isinstance(config, str) else ""
+    path.write_text("[executables]\n" + "\n".join(entries) + "\n" + extra)
+    return path
+
+
+def _array_indices(spec) -> tuple:
+    """Indices and concurrency limit of ``--array``, e.g. ``0-9:2,12%4``."""
+    spec, _, limit = spec.partition("%")
+    indices = []
+    for part in spec.split(","):
+        part, _, step = part.partition(":")
+        first, _, last = part.partition("-")
+        indices += range(int(first), int(last or first) + 1, int(step or 1))
+    return indices, int(limit) if limit else None
+
+
+def _sbatch_options(argv, script) -> dict:
+    """``#SBATCH`` lines of ``script`` overridden by command-line ``--option=value``."""
+    header = re.findall(r"^#SBATCH\s+(\S+)", script.read_text(), flags=re.MULTILINE)
+    options = {}
+    for arg in header + argv:
+        name, _, value = arg.lstrip("-").partition("=")
+        options[name.replace("-", "_")] = value or True
+    return options
+
+
+def sbatch_main(argv=None, workers=None):
+    """
+    Entry point of the stub ``sbatch``: ``sbatch [--option=value ...] SCRIPT``.
+
+    Jobs run to completion before ``sbatch`` returns, the tasks of an array job on a pool
+    of at most ``workers`` concurrent ``bash SCRIPT`` processes with the usual
+    ``SLURM_*`` variables set. ``--array``, ``--output`` (with ``%A``, ``%a``, ``%j`` and
+    ``%x``), ``--job-name``, ``--parsable`` and ``--dependency=afterok:ID`` or
+    ``afterany:ID`` are understood, also as ``#SBATCH`` lines; other options are
+    ignored. Job ids and exit codes are kept in ``sbatch_state.json`` next to the stub.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    scripts = [arg for arg in argv if not arg.startswith("-")]
+    if not scripts:
+        _fail("usage: sbatch [--option=value ...] SCRIPT", 1)
+    script = Path(scripts[0])
+    options = _sbatch_options([arg for arg in argv if arg.startswith("-")], script)
+
+    state_file = Path(sys.argv[0]).resolve().parent / "sbatch_state.json"
+    state = json.loads(state_file.read_text()) if state_file.is_file() else {"jobs": {}}
+    job_id = str(1000 + len(state["jobs"]))
+    dependency = options.get("dependency", "")
+    kind, _, after = str(dependency).partition(":")
+    failed = [state["jobs"].get(j.split("_")[0], 1) for j in after.split(":") if j]
+    if kind == "afterok" and any(failed):
+        print(f"sbatch: job {job_id} never runs: dependency {dependency} not satisfied")
+        state["jobs"][job_id] = 1
+        state_file.write_text(json.dumps(state))
+        return
+
+    name = options.get("job_name", script.name)
+    array = options.get("array")
+    indices, limit = _array_indices(array) if array else ([None], None)
+    default = "slurm-%A_%a.out" if array else "slurm-%j.out"
+
+    def run_task(index):
+        task_id = job_id if index is None else f"{job_id}_{index}"
+        output = str(options.get("output", default))
+        for key, value in {"%A": job_id, "%a": index, "%j": task_id, "%x": name}.items():
+            output = output.replace(key, str(value))
+        env = {**os.environ, "SLURM_JOB_ID": job_id, "SLURM_JOB_NAME": name}
+        if index is not None:
+            env.update(
+                SLURM_ARRAY_JOB_ID=job_id,
+                SLURM_ARRAY_TASK_ID=str(index),
+                SLURM_ARRAY_TASK_COUNT=str(len(indices)),
+            )
+        with open(output, "w") as f:
+            return subprocess.run(
+                ["bash", str(script)], env=env, stdout=f, stderr=subprocess.STDOUT
+            ).returncode
+
+    workers = min(filter(None, [workers or os.cpu_count() or 1, limit, len(indices)]))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        returncodes = list(pool.map(run_task, indices))
+    state["jobs"][job_id] = max(returncodes)
+    state_file.write_text(json.dumps(state))
+    print(job_id if options.get("parsable") else f"Submitted batch job {job_id}")
+
+
+def install_scheduler_stub(directory, workers=None) -> Path:
+    """
+    Write a stub ``sbatch`` that runs jobs locally, see :func:`sbatch_main`.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory for the ``sbatch`` executable; put it first on ``PATH``.
+    workers : int, optional
+        Maximum number of array tasks running at once (default: number of cores).
+
+    Returns
+    -------
+    Path
+        The ``sbatch`` executable.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    exe = directory / "sbatch"
+    exe.write_text(
+        f"#!{sys.executable}\n"
+        "from castepkit.testing import sbatch_main\n\n"
+        f"sbatch_main(workers={workers!r})\n"
+    )
+    exe.chmod(0o755)
+    return exe
+
+
+if __name__ == "__main__":
+    fake_main(sys.argv[1], argv=sys.argv[2:])
@@ -1,28 +1,496 @@
+import asyncio
+import contextlib
+import hashlib
 import os
+import shutil
+import signal
 import subprocess
+import sys
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from castepkit.config import get_env_vars, get_exec_path, get_nproc, use_mpi
+from castepkit.config import (
+    get_env_vars,
+    get_exec_path,
+    get_nproc,
+    get_run_settings,
+    get_threads,
+    use_mpi,
+)
+from castepkit.jobqueue import alease, lease, pinned
 
-__all__ = ["run_program", "check_files_exist"]
+__all__ = [
+    "RunMetrics",
+    "ProgramOutput",
+    "run_program",
+    "arun_program",
+    "set_max_concurrency",
+    "check_files_exist",
+    "split_cores",
+    "link_inputs",
+    "move_outputs",
+    "hash_file",
+]
 
 
-def run_program(prog_key, input_str, args=None):
+@dataclass
+class RunMetrics:
+    """
+    Resources used by one external run.
+
+    Attributes
+    ----------
+    prog : str
+        Key of the executable.
+    wall : float
+        Wall-clock time in seconds.
+    user, system : float
+        CPU time in seconds of the whole process tree (all MPI ranks).
+    max_rss : int
+        Peak resident set size in bytes of the largest process of the tree.
+    returncode : int or None
+        Exit code of the program.
+    nproc : int
+        Number of MPI ranks (1 without MPI).
+    params : str
+        The stdin of the run, which holds the wrapper parameters.
+    input_bytes : dict
+        Sizes of the input files by name.
+    cached : bool
+        The outputs were restored from the result cache instead of running the program.
+    time : float
+        Unix time the record was made.
+    """
+
+    prog: str
+    wall: float
+    user: float = 0.0
+    system: float = 0.0
+    max_rss: int = 0
+    returncode: int = None
+    nproc: int = 1
+    params: str = ""
+    input_bytes: dict = field(default_factory=dict)
+    cached: bool = False
+    time: float = field(default_factory=time.time)
+
+    @property
+    def cpu(self) -> float:
+        return self.user + self.system
+
+
+class ProgramOutput(tuple):
+    """``(stdout, stderr)`` of a run, with its :class:`RunMetrics` as ``metrics``."""
+
+    def __new__(cls, stdout, stderr, metrics=None):
+        obj = super().__new__(cls, (stdout, stderr))
+        obj.metrics = metrics
+        return obj
+
+
+def run_program(
+    prog_key,
+    input_str,
+    args=None,
+    cwd=None,
+    nproc=None,
+    stream=None,
+    log_dir=None,
+    timeout=None,
+    on_stdout=None,
+    on_stderr=None,
+):
+    """
+    Run an external executable, feeding ``input_str`` on stdin.
+
+    By default stdout and stderr are buffered and returned once the program exits. In
+    streaming mode they are instead forwarded line by line, as they are produced, to
+    per-run log files and to the callbacks, so memory stays flat however large the
+    output grows. Options left as None are taken from the ``[run]`` config section.
+
+    Parameters
+    ----------
+    prog_key : str
+        Key of the executable in the ``[executables]`` config section.
+    input_str : str
+        Text written to the program's stdin.
+    args : list of str, optional
+        Extra command-line arguments.
+    cwd : str or Path, optional
+        Working directory of the run (default: current directory).
+    nproc : int, optional
+        Number of MPI ranks, overriding the ``[mpirun] nproc`` config value of this
+        executable. When that value is ``"auto"``, the cores available to this run
+        instead; the ranks are then chosen by :func:`castepkit.sizing.plan_ranks` from
+        the calculation named by the first argument.
+    stream : bool, optional
+        Stream the output instead of buffering it. Implied by ``on_stdout``/``on_stderr``.
+    log_dir : str or Path, optional
+        Directory for the per-run ``{prog_key}-{stamp}.stdout/.stderr`` logs in streaming
+        mode (default: ``castepkit_logs`` in the current directory).
+    timeout : float, optional
+        Wall-clock limit in seconds. On expiry the whole process group, including the
+        ``mpirun`` children, is killed and ``subprocess.TimeoutExpired`` is raised.
+    on_stdout, on_stderr : callable, optional
+        Called with every line (without newline) in streaming mode. By default lines are
+        echoed to this process's stdout/stderr.
+
+    Returns
+    -------
+    ProgramOutput
+        Decoded stdout and stderr (both empty in streaming mode), with the wall time,
+        CPU time and peak memory of the process tree in ``metrics``.
+    """
+    settings = get_run_settings()
+    if stream is None:
+        stream = settings["stream"] or on_stdout is not None or on_stderr is not None
+    log_dir = log_dir or settings["log_dir"]
+    timeout = timeout or settings["timeout"]
+
+    cmd, env, nranks = _command(prog_key, args, cwd, nproc)
+
+    # Cores of the local queue daemon, if one runs, are held until the program exits.
+    with lease(prog_key, _ncores(env, nranks), cwd) as cores:
+        # A new session puts the program and everything it spawns into one process group.
+        start = time.monotonic()
+        with pinned(cores):
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env,
+                cwd=cwd,
+                start_new_session=True,
+            )
+
+        if stream:
+            log_dir = Path(log_dir or "castepkit_logs")
+            log_dir.mkdir(parents=True, exist_ok=True)
+            stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            log_base = log_dir / f"{prog_key}-{stamp}"
+            pumps = [
+                threading.Thread(
+                    target=_pump_lines,
+                    args=(
+                        proc.stdout,
+                        log_base.with_suffix(".stdout"),
+                        on_stdout or _echo(sys.stdout),
+                    ),
+                    daemon=True,
+                ),
+                threading.Thread(
+                    target=_pump_lines,
+                    args=(
+                        proc.stderr,
+                        log_base.with_suffix(".stderr"),
+                        on_stderr or _echo(sys.stderr),
+                    ),
+                    daemon=True,
+                ),
+            ]
+        else:
+            output = {"stdout": [], "stderr": []}
+            pumps = [
+                threading.Thread(target=_collect, args=(getattr(proc, name), chunks), daemon=True)
+                for name, chunks in output.items()
+            ]
+        for pump in pumps:
+            pump.start()
+
+        try:
+            proc.stdin.write(input_str.encode())
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        reaper = _Reaper(proc)
+        reaper.start()
+        reaper.join(timeout)
+        try:
+            if reaper.is_alive():
+                _kill_process_group(proc, reaper)
+                output_hint = f"see {log_base}.stdout" if stream else None
+                raise subprocess.TimeoutExpired(cmd, timeout, output=output_hint)
+        finally:
+            for pump in pumps:
+                pump.join()
+
+        metrics = _metrics(prog_key, start, reaper.rusage, proc.returncode, nranks, input_str)
+        if stream:
+            return ProgramOutput("", "", metrics)
+        return ProgramOutput(
+            b"".join(output["stdout"]).decode(), b"".join(output["stderr"]).decode(), metrics
+        )
+
+
+# Limit on concurrent programs of the async API, with one semaphore per event loop.
+_concurrency = {"limit": None, "semaphores": weakref.WeakKeyDictionary()}
+
+
+def set_max_concurrency(limit) -> None:
+    """
+    Limit how many programs :func:`arun_program` runs at the same time per event loop.
+
+    The limit is shared by all async wrappers and overrides ``[run] max_concurrent``;
+    ``None`` restores the config value (no limit by default). Set it before starting jobs.
+    """
+    _concurrency["limit"] = limit
+    _concurrency["semaphores"].clear()
+
+
+def _semaphore():
+    limit = _concurrency["limit"] or get_run_settings()["max_concurrent"]
+    if not limit:
+        return contextlib.nullcontext()
+    loop = asyncio.get_running_loop()
+    current = _concurrency["semaphores"].get(loop)
+    if current is None or current[0] != limit:
+        current = (limit, asyncio.Semaphore(limit))
+        _concurrency["semaphores"][loop] = current
+    return current[1]
+
+
+async def arun_program(
+    prog_key,
+    input_str,
+    args=None,
+    cwd=None,
+    nproc=None,
+    stream=None,
+    log_dir=None,
+    timeout=None,
+    on_stdout=None,
+    on_stderr=None,
+):
+    """
+    Async counterpart of :func:`run_program`, with the same parameters and result.
+
+    The program runs in its own process group and is awaited without blocking the event
+    loop (through a pidfd where available). Cancelling the awaiting task kills the whole
+    process group, as a timeout does, before the cancellation propagates. At most
+    :func:`set_max_concurrency` programs run at the same time; further calls wait for a
+    free slot.
+    """
+    settings = get_run_settings()
+    if stream is None:
+        stream = settings["stream"] or on_stdout is not None or on_stderr is not None
+    log_dir = log_dir or settings["log_dir"]
+    timeout = timeout or settings["timeout"]
+
+    async with _semaphore():
+        cmd, env, nranks = _command(prog_key, args, cwd, nproc)
+        async with alease(prog_key, _ncores(env, nranks), cwd) as cores:
+            loop = asyncio.get_running_loop()
+            start = time.monotonic()
+            with pinned(cores):
+                proc = subprocess.Popen(
+                    cmd,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=env,
+                    cwd=cwd,
+                    start_new_session=True,
+                )
+            exited = _watch(proc, loop)
+            output = None
+            try:
+                readers = [await _open_reader(pipe) for pipe in (proc.stdout, proc.stderr)]
+                if stream:
+                    log_dir = Path(log_dir or "castepkit_logs")
+                    log_dir.mkdir(parents=True, exist_ok=True)
+                    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+                    log_base = log_dir / f"{prog_key}-{stamp}"
+                    callbacks = [on_stdout or _echo(sys.stdout), on_stderr or _echo(sys.stderr)]
+                    consumers = [
+                        _apump_lines(reader, log_base.with_suffix(suffix), callback)
+                        for reader, suffix, callback in zip(
+                            readers, (".stdout", ".stderr"), callbacks
+                        )
+                    ]
+                else:
+                    consumers = [reader.read() for reader in readers]
+                output = asyncio.gather(*consumers)
+
+                try:
+                    proc.stdin.write(input_str.encode())
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                usage = await asyncio.wait_for(asyncio.shield(exited), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError) as exc:
+                await _akill_process_group(proc, exited)
+                if output is not None:
+                    await asyncio.shield(output)
+                if isinstance(exc, asyncio.CancelledError):
+                    raise
+                output_hint = f"see {log_base}.stdout" if stream else None
+                raise subprocess.TimeoutExpired(cmd, timeout, output=output_hint) from None
+            chunks = await output
+
+    metrics = _metrics(prog_key, start, usage, proc.returncode, nranks, input_str)
+    if stream:
+        return ProgramOutput("", "", metrics)
+    return ProgramOutput(chunks[0].decode(), chunks[1].decode(), metrics)
+
+
+async def _open_reader(pipe):
+    reader = asyncio.StreamReader(limit=1 << 24)
+    loop = asyncio.get_running_loop()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+
+async def _apump_lines(reader, log_file, callback):
+    """Copy lines from ``reader`` to ``log_file`` and ``callback`` until EOF."""
+    with open(log_file, "w") as log:
+        while raw := await reader.readline():
+            line = raw.decode(errors="replace").rstrip("\n")
+            log.write(line + "\n")
+            log.flush()
+            callback(line)
+
+
+def _watch(proc, loop):
+    """Future of the resource usage of ``proc``'s tree, set once it is reaped."""
+    if not hasattr(os, "pidfd_open"):
+        return loop.run_in_executor(None, _reap, proc)
+    future = loop.create_future()
+    fd = os.pidfd_open(proc.pid)
+
+    def on_exit():
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid == 0:
+            return
+        loop.remove_reader(fd)
+        os.close(fd)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if not future.done():
+            future.set_result(usage)
+
+    loop.add_reader(fd, on_exit)
+    return future
+
+
+def _reap(proc):
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+async def _akill_process_group(proc, exited, grace=5.0):
+    """Async counterpart of :func:`_kill_process_group`."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            await asyncio.wait_for(asyncio.shield(exited), grace)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+
+def _command(prog_key, args, cwd, nproc):
+    """Command line, environment and number of MPI ranks of a run (see :func:`run_program`)."""
     exe = get_exec_path(prog_key)
     cmd = [exe] + (args or [])
-    if use_mpi():
-        cmd = ["mpirun", "-n", str(get_nproc())] + cmd
+    mpi = use_mpi(prog_key)
+    auto_ranks = mpi and get_nproc(prog_key) == "auto"
+    nranks = (nproc or get_nproc(prog_key)) if mpi else 1
+    threads = get_threads(prog_key)
+    if auto_ranks or threads == "auto":
+        from castepkit.sizing import plan_ranks
+
+        prefix = Path(cwd or ".") / args[0] if args else None
+        plan = plan_ranks(prog_key, prefix, ncores=nproc if auto_ranks else None)
+        if auto_ranks:
+            nranks = plan.nproc
+        if threads == "auto":
+            threads = str(max(1, plan.budget // nranks))
+    if mpi:
+        cmd = ["mpirun", "-n", str(nranks)] + cmd
 
     env = os.environ.copy()
-    env.update(get_env_vars())  # Inject user-specified env
+    env.update(get_env_vars(prog_key))  # Inject user-specified env
+    if isinstance(threads, str):  # resolved from "auto" above
+        env["OMP_NUM_THREADS"] = threads
+    return cmd, env, nranks
+
+
+def _ncores(env, nranks) -> int:
+    """Cores a run occupies: MPI ranks times OpenMP threads."""
+    threads = env.get("OMP_NUM_THREADS", "")
+    return nranks * (int(threads) if threads.isdigit() else 1)
+
 
-    result = subprocess.run(
-        cmd,
-        input=input_str.encode(),
-        capture_output=True,
-        env=env,
+def _metrics(prog_key, start, usage, returncode, nranks, input_str):
+    return RunMetrics(
+        prog=prog_key,
+        wall=time.monotonic() - start,
+        user=usage.ru_utime,
+        system=usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        max_rss=usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        returncode=returncode,
+        nproc=nranks,
+        params=input_str,
     )
-    return result.stdout.decode(), result.stderr.decode()
+
+
+def _echo(f):
+    def callback(line):
+        print(line, file=f, flush=True)
+
+    return callback
+
+
+def _pump_lines(pipe, log_file, callback):
+    """Copy lines from ``pipe`` to ``log_file`` and ``callback`` until EOF."""
+    with pipe, open(log_file, "w") as log:
+        for raw in pipe:
+            line = raw.decode(errors="replace").rstrip("\n")
+            log.write(line + "\n")
+            log.flush()
+            callback(line)
+
+
+def _collect(pipe, chunks):
+    """Read ``pipe`` until EOF into ``chunks``."""
+    with pipe:
+        chunks.append(pipe.read())
+
+
+class _Reaper(threading.Thread):
+    """Reap a child with ``os.wait4``, which also returns the resource usage of its tree."""
+
+    def __init__(self, proc):
+        super().__init__(daemon=True)
+        self.proc = proc
+        self.rusage = None
+
+    def run(self):
+        _, status, self.rusage = os.wait4(self.proc.pid, 0)
+        # Setting the return code keeps Popen from waiting on the reaped pid again.
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+
+
+def _kill_process_group(proc, reaper, grace=5.0):
+    """Terminate the process group of ``proc``, escalating to SIGKILL after ``grace`` s."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        reaper.join(grace)
+        if not reaper.is_alive():
+            break
 
 
 def check_files_exist(files, label="file(s)", must_exist=True):
@@ -61,3 +529,106 @@ def check_files_exist(files, label="file(s)", must_exist=True):
                 print(f"  - {f}")
             return False
         return True
+
+
+def split_cores(ncores, njobs, max_workers=None):
+    """
+    Split a core budget between concurrent jobs and their MPI ranks.
+
+    Parameters
+    ----------
+    ncores : int or None
+        Total number of cores available (default: ``os.cpu_count()``).
+    njobs : int
+        Number of jobs to run.
+    max_workers : int, optional
+        Upper bound on the number of jobs running at the same time.
+
+    Returns
+    -------
+    tuple of int
+        Number of concurrent workers and number of ranks per job.
+    """
+    ncores = max(1, ncores or os.cpu_count() or 1)
+    workers = min(max(1, njobs), ncores)
+    if max_workers:
+        workers = min(workers, max_workers)
+    return workers, max(1, ncores // workers)
+
+
+def link_inputs(files, workdir):
+    """
+    Symlink input files into ``workdir``, skipping files that do not exist.
+
+    Parameters
+    ----------
+    files : list of str or Path
+        Input files to expose in the working directory.
+    workdir : str or Path
+        Target directory; created if needed.
+
+    Returns
+    -------
+    list of Path
+        The links created in ``workdir``.
+    """
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    links = []
+    for f in map(Path, files):
+        if not f.is_file():
+            continue
+        link = workdir / f.name
+        if link.is_symlink() or link.exists():
+            link.unlink()
+        link.symlink_to(f.resolve())
+        links.append(link)
+    return links
+
+
+def move_outputs(files, workdir, dest):
+    """
+    Move files produced in ``workdir`` into ``dest``.
+
+    Files are renamed atomically when source and destination share a filesystem,
+    and copied otherwise. Missing files are skipped.
+
+    Parameters
+    ----------
+    files : list of str
+        File names relative to ``workdir``.
+    workdir : str or Path
+        Directory the program ran in.
+    dest : str or Path
+        Directory to move the outputs into.
+
+    Returns
+    -------
+    list of Path
+        The moved files at their new location.
+    """
+    workdir, dest = Path(workdir), Path(dest)
+    moved = []
+    for name in files:
+        src = workdir / name
+        if not src.is_file() or src.is_symlink():
+            continue
+        target = dest / name
+        try:
+            os.replace(src, target)
+        except OSError:
+            tmp = target.with_name(f".{target.name}.tmp")
+            shutil.copy2(src, tmp)
+            os.replace(tmp, target)
+            src.unlink()
+        moved.append(target)
+    return moved
+
+
+def hash_file(path, chunk_size=1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,14 +1,19 @@
 import argparse
+from pathlib import Path
 
-from castepkit.utils import check_files_exist, run_program
+from castepkit.cache import arun_steps, run_steps
+from castepkit.config import set_profile
+from castepkit.utils import RunMetrics, check_files_exist
 
-__all__ = ["run_atom_cutting"]
+__all__ = ["run_atom_cutting", "arun_atom_cutting"]
 
 
 def run_atom_cutting(
     prefix: str,
     input_type: int = 2,  # 1 for .charge, 2 for .orbitals
-) -> None:
+    cache: bool = None,
+    stage: bool = None,
+) -> RunMetrics:
     """
     Run atom_cutting_impi_XTIPC on a specified CASTEP prefix.
 
@@ -18,7 +23,37 @@ def run_atom_cutting(
         The prefix of the CASTEP calculation files.
     input_type : int
         Type of wavefunction input: 1 = *.charge, 2 = *.orbitals (default).
+    cache : bool, optional
+        Reuse cached outputs of identical runs (default: ``[cache] enabled`` in config).
+    stage : bool, optional
+        Run in node-local scratch space, copying the inputs there and the outputs back
+        (default: ``[staging] enabled`` in config).
+
+    Returns
+    -------
+    RunMetrics
+        Wall time, CPU time, peak memory and input sizes of the run.
+    """
+    return run_steps(_atom_cutting_steps(prefix, input_type, cache, stage))
+
+
+async def arun_atom_cutting(
+    prefix: str,
+    input_type: int = 2,  # 1 for .charge, 2 for .orbitals
+    cache: bool = None,
+    stage: bool = None,
+) -> RunMetrics:
+    """
+    Async counterpart of :func:`run_atom_cutting`, with the same parameters and result.
+
+    The program runs through :func:`castepkit.utils.arun_program`: cancelling the task
+    kills it, and ``set_max_concurrency`` limits how many run at once.
     """
+    return await arun_steps(_atom_cutting_steps(prefix, input_type, cache, stage))
+
+
+def _atom_cutting_steps(prefix, input_type, cache, stage):
+    """Body of :func:`run_atom_cutting` as a generator, see :func:`castepkit.cache.run_steps`."""
     required_inputs = [
         # TODO: write a script to genreate switch file.
         f"{prefix}.switch",
@@ -36,7 +71,23 @@ def run_atom_cutting(
     input_str = f"{input_type}\n"
 
     # Run the program
-    stdout, stderr = run_program("atom_cutting", input_str, [prefix])
+    cache_inputs = required_inputs + [str(f) for f in Path(".").glob("*.recpot")]
+    expected_outputs = [
+        f"{prefix}.cutatom_check",
+        f"{prefix}_den.grd",
+        f"{prefix}.castep",
+        f"{prefix}.castep_bin",
+    ]
+    output = yield dict(
+        prog_key="atom_cutting",
+        input_str=input_str,
+        args=[prefix],
+        inputs=cache_inputs,
+        enabled=cache,
+        outputs=expected_outputs,
+        stage=stage,
+    )
+    stdout, stderr = output
 
     print("=== atom_cutting STDOUT ===")
     print(stdout)
@@ -44,17 +95,12 @@ def run_atom_cutting(
         print("=== atom_cutting STDERR ===")
         print(stderr)
 
-    expected_outputs = [
-        f"{prefix}.cutatom_check",
-        f"{prefix}_den.grd",
-        f"{prefix}.castep",
-        f"{prefix}.castep_bin",
-    ]
     check_files_exist(expected_outputs, label="atom-cutting output files")
+    return output.metrics
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Wrapper for atom_cutting_impi_XTIPC")
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Wrapper for atom_cutting_impi_XTIPC")
     parser.add_argument("prefix", help="Prefix of the CASTEP calculation")
     parser.add_argument(
         "--input_type",
@@ -63,12 +109,33 @@ def main():
         default=2,
         help="Input file type: 1 = *.charge, 2 = *.orbitals (default: %(default)s)",
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=None,
+        help="Reuse cached outputs of identical runs (default: [cache] enabled in config)",
+    )
+    parser.add_argument(
+        "--stage",
+        action="store_true",
+        default=None,
+        help="Run in node-local scratch space (default: [staging] enabled in config)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Named [profiles.<name>] config overrides to use",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        set_profile(args.profile)
 
     run_atom_cutting(
         prefix=args.prefix,
         input_type=args.input_type,
+        cache=args.cache,
+        stage=args.stage,
     )
 
 
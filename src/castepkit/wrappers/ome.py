@@ -1,14 +1,19 @@
 import argparse
+from pathlib import Path
 
-from castepkit.utils import check_files_exist, run_program
+from castepkit.cache import arun_steps, run_steps
+from castepkit.config import set_profile
+from castepkit.utils import RunMetrics, check_files_exist
 
-__all__ = ["run_ome"]
+__all__ = ["run_ome", "arun_ome"]
 
 
 def run_ome(
     prefix: str,
     orbital_suffix: str = "cutatom_check",
-) -> None:
+    cache: bool = None,
+    stage: bool = None,
+) -> RunMetrics:
     """
     Run calculate_ome_impi_XTIPC on the given CASTEP prefix.
 
@@ -18,7 +23,37 @@ def run_ome(
         The prefix of the CASTEP calculation files.
     orbital_suffix : str
         Extension suffix of the orbital file (e.g., "cutatom_check").
+    cache : bool, optional
+        Reuse cached outputs of identical runs (default: ``[cache] enabled`` in config).
+    stage : bool, optional
+        Run in node-local scratch space, copying the inputs there and the outputs back
+        (default: ``[staging] enabled`` in config).
+
+    Returns
+    -------
+    RunMetrics
+        Wall time, CPU time, peak memory and input sizes of the run.
     """
+    return run_steps(_ome_steps(prefix, orbital_suffix, cache, stage))
+
+
+async def arun_ome(
+    prefix: str,
+    orbital_suffix: str = "cutatom_check",
+    cache: bool = None,
+    stage: bool = None,
+) -> RunMetrics:
+    """
+    Async counterpart of :func:`run_ome`, with the same parameters and result.
+
+    The program runs through :func:`castepkit.utils.arun_program`: cancelling the task
+    kills it, and ``set_max_concurrency`` limits how many run at once.
+    """
+    return await arun_steps(_ome_steps(prefix, orbital_suffix, cache, stage))
+
+
+def _ome_steps(prefix, orbital_suffix, cache, stage):
+    """Body of :func:`run_ome` as a generator, see :func:`castepkit.cache.run_steps`."""
     required_inputs = [
         f"{prefix}.cell",
         f"{prefix}.param",
@@ -30,7 +65,21 @@ def run_ome(
 
     input_str = f"{orbital_suffix}\n"
 
-    stdout, stderr = run_program("ome", input_str, [prefix])
+    cache_inputs = required_inputs + [str(f) for f in Path(".").glob("*.recpot")]
+    expected_outputs = [
+        f"{prefix}.cst_ome",
+        f"{prefix}.castep",
+    ]
+    output = yield dict(
+        prog_key="ome",
+        input_str=input_str,
+        args=[prefix],
+        inputs=cache_inputs,
+        enabled=cache,
+        outputs=expected_outputs,
+        stage=stage,
+    )
+    stdout, stderr = output
 
     print("=== ome STDOUT ===")
     print(stdout)
@@ -38,27 +87,45 @@ def run_ome(
         print("=== ome STDERR ===")
         print(stderr)
 
-    expected_outputs = [
-        f"{prefix}.cst_ome",
-        f"{prefix}.castep",
-    ]
     check_files_exist(expected_outputs, label="ome output files")
+    return output.metrics
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Wrapper for calculate_ome_impi_XTIPC")
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Wrapper for calculate_ome_impi_XTIPC")
     parser.add_argument("prefix", help="Prefix of the CASTEP calculation")
     parser.add_argument(
         "--orbital_suffix",
         default="cutatom_check",
         help="Suffix of the orbital file (default: %(default)s)",
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=None,
+        help="Reuse cached outputs of identical runs (default: [cache] enabled in config)",
+    )
+    parser.add_argument(
+        "--stage",
+        action="store_true",
+        default=None,
+        help="Run in node-local scratch space (default: [staging] enabled in config)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Named [profiles.<name>] config overrides to use",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        set_profile(args.profile)
 
     run_ome(
         prefix=args.prefix,
         orbital_suffix=args.orbital_suffix,
+        cache=args.cache,
+        stage=args.stage,
     )
 
 
@@ -1,10 +1,106 @@
 #!/usr/bin/env python3
 
 import argparse
+import itertools
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from castepkit.utils import check_files_exist, run_program
+from castepkit.config import set_profile
 
-__all__ = ["run_shg"]
+# numpy, the result cache, the readers and the symmetry analysis are imported where they
+# are used, so ``castepkit shg --help`` and the CLI's use of parse_values stay fast.
+if TYPE_CHECKING:
+    import numpy as np
+
+    from castepkit.io.chi import Spectrum
+    from castepkit.utils import RunMetrics
+
+__all__ = [
+    "ShgResult",
+    "ShgSweep",
+    "run_shg",
+    "arun_shg",
+    "run_shg_isolated",
+    "run_shg_batch",
+    "run_shg_tensor",
+    "run_shg_sweep",
+    "stack_sweep",
+    "detect_is_metal",
+]
+
+# Input files NewSHG_ZY-XTIPC.x may read; linked into isolated run directories.
+SHG_INPUT_SUFFIXES = ["bands", "cell", "param", "ome_bin", "cst_ome"]
+
+
+def detect_is_metal(bands_file) -> int:
+    """
+    SHG ``is_metal`` flag (1 = metal, 2 = insulator) from the band occupations of a
+    ``.bands`` file, see :meth:`castepkit.io.bands.Bands.band_gap`. Unreadable files give 2.
+    """
+    from castepkit.io.bands import Bands
+
+    try:
+        gap = Bands(bands_file).band_gap()
+    except (OSError, ValueError) as exc:
+        print(f"❌ Cannot detect is_metal from {bands_file} ({exc}); using is_metal = 2")
+        return 2
+    state = "metallic" if gap.is_metal else f"gap {gap.gap:.3f} eV"
+    flag = 1 if gap.is_metal else 2
+    print(f"✅ {Path(bands_file).name}: {state}, using is_metal = {flag}")
+    return flag
+
+
+def spectrum_name(prefix: str, direction: str) -> str:
+    """Name of the spectrum file NewSHG_ZY-XTIPC.x writes for ``direction``."""
+    return f"{prefix}.chi_all" if direction == "all" else f"{prefix}.chi{direction}"
+
+
+@dataclass
+class ShgResult:
+    """
+    Outcome of one SHG run.
+
+    Attributes
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation.
+    direction : str
+        Direction index, e.g., '123', or 'all'.
+    workdir : Path
+        Directory the program ran in.
+    stdout, stderr : str
+        Output of the program (empty when streamed to log files).
+    spectrum_file : Path
+        The ``{prefix}.chi{direction}`` file (default: in ``workdir``).
+    metrics : RunMetrics
+        Wall time, CPU time, peak memory and input sizes of the run.
+    """
+
+    prefix: str
+    direction: str
+    workdir: Path
+    stdout: str = ""
+    stderr: str = ""
+    spectrum_file: Path = None
+    metrics: "RunMetrics" = None
+    _spectrum: "Spectrum" = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.spectrum_file is None:
+            self.spectrum_file = Path(self.workdir) / spectrum_name(self.prefix, self.direction)
+
+    @property
+    def spectrum(self) -> "Spectrum":
+        """The spectrum, parsed on first access of its data (see :class:`Spectrum`)."""
+        from castepkit.io.chi import Spectrum
+
+        if self._spectrum is None:
+            self._spectrum = Spectrum(self.spectrum_file)
+        return self._spectrum
 
 
 def run_shg(
@@ -15,9 +111,12 @@ def run_shg(
     rank_number: int = 0,
     unit: int = 0,
     output_level: int = 0,
-    is_metal: int = 2,
+    is_metal: int = None,
     energy_range: int = 0,
-) -> None:
+    workdir: str = None,
+    nproc: int = None,
+    cache: bool = None,
+) -> ShgResult:
     """
     Run the NewSHG_ZY-XTIPC.x program for computing second harmonic generation (SHG).
 
@@ -37,11 +136,102 @@ def run_shg(
         Output unit: 0 = pm/V, 1 = esu.
     output_level : int
         Verbosity level.
-    is_metal : int
-        Whether the system is metallic (1 = Yes, 2 = No).
+    is_metal : int, optional
+        Whether the system is metallic (1 = Yes, 2 = No); detected from the
+        ``{prefix}.bands`` file when not given (see :func:`detect_is_metal`).
     energy_range : int
         Energy range option: 0, 1, or 2.
+    workdir : str, optional
+        Directory to run in (default: current directory).
+    nproc : int, optional
+        Number of MPI ranks, overriding the config value.
+    cache : bool, optional
+        Reuse cached outputs of identical runs (default: ``[cache] enabled`` in config).
+
+    Returns
+    -------
+    ShgResult
+        The run, with its spectrum parsed lazily from ``{prefix}.chi{direction}``.
     """
+    from castepkit.cache import run_steps
+
+    return run_steps(
+        _shg_steps(
+            prefix,
+            scissors,
+            direction,
+            band_resolved,
+            rank_number,
+            unit,
+            output_level,
+            is_metal,
+            energy_range,
+            workdir,
+            nproc,
+            cache,
+        )
+    )
+
+
+async def arun_shg(
+    prefix: str,
+    scissors: float = 0.0,
+    direction: str = "123",
+    band_resolved: int = 1,
+    rank_number: int = 0,
+    unit: int = 0,
+    output_level: int = 0,
+    is_metal: int = None,
+    energy_range: int = 0,
+    workdir: str = None,
+    nproc: int = None,
+    cache: bool = None,
+) -> ShgResult:
+    """
+    Async counterpart of :func:`run_shg`, with the same parameters and result.
+
+    The program runs through :func:`castepkit.utils.arun_program`: cancelling the task
+    kills it, and ``set_max_concurrency`` limits how many run at once.
+    """
+    from castepkit.cache import arun_steps
+
+    return await arun_steps(
+        _shg_steps(
+            prefix,
+            scissors,
+            direction,
+            band_resolved,
+            rank_number,
+            unit,
+            output_level,
+            is_metal,
+            energy_range,
+            workdir,
+            nproc,
+            cache,
+        )
+    )
+
+
+def _shg_steps(
+    prefix,
+    scissors,
+    direction,
+    band_resolved,
+    rank_number,
+    unit,
+    output_level,
+    is_metal,
+    energy_range,
+    workdir,
+    nproc,
+    cache,
+):
+    """Body of :func:`run_shg` as a generator, see :func:`castepkit.cache.run_steps`."""
+    from castepkit.io.fortran import check_ome
+    from castepkit.utils import check_files_exist
+
+    workdir = Path(workdir or ".")
     # Check CASTEP files exist
     required_inputs = [
         f"{prefix}.bands",
@@ -53,7 +243,13 @@ def run_shg(
         # f"Ga_00.recpot",
     ]
 
-    check_files_exist(required_inputs, label="required input files")
+    check_files_exist([workdir / f for f in required_inputs], label="required input files")
+    # A stale or truncated matrix element file would only fail deep inside the MPI run.
+    for suffix in ("cst_ome", "ome_bin"):
+        if (workdir / f"{prefix}.{suffix}").is_file():
+            check_ome(workdir / f"{prefix}.{suffix}", workdir / f"{prefix}.bands")
+    if is_metal is None:
+        is_metal = detect_is_metal(workdir / f"{prefix}.bands")
 
     # Prepare input string for the SHG executable
     input_lines = [
@@ -69,7 +265,18 @@ def run_shg(
     input_str = "\n".join(str(x) for x in input_lines) + "\n"
 
     # Run the executable
-    stdout, stderr = run_program("shg", input_str, [prefix])
+    cache_inputs = [f"{prefix}.{suffix}" for suffix in SHG_INPUT_SUFFIXES]
+    cache_inputs += [f.name for f in workdir.glob("*.recpot")]
+    output = yield dict(
+        prog_key="shg",
+        input_str=input_str,
+        args=[prefix],
+        inputs=cache_inputs,
+        cwd=workdir,
+        nproc=nproc,
+        enabled=cache,
+    )
+    stdout, stderr = output
 
     # print("=== SHG STDOUT ===")
     print(stdout)
@@ -82,11 +289,402 @@ def run_shg(
         # e.g., f"{prefix}.chi123", f"{prefix}.shg_spectrum", etc.
     ]
     check_files_exist(expected_outputs, label="SHG output files")
+    return ShgResult(prefix, direction, workdir, stdout, stderr, metrics=output.metrics)
+
+
+def run_shg_isolated(
+    prefix: str,
+    direction: str,
+    collect: list = None,
+    nproc: int = None,
+    run_dir: str = None,
+    **kwargs,
+) -> ShgResult:
+    """
+    Run one SHG component in its own directory ``{prefix}.shg_runs/{direction}``.
+
+    The inputs are symlinked into the run directory, so concurrent runs do not clash on
+    the shared ``{prefix}.castep`` and weight files.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    direction : str
+        Direction index, e.g., '123'.
+    collect : list of str, optional
+        Output files moved back into the current directory after the run (default: the
+        ``{prefix}.chi{direction}`` spectrum). All other outputs stay in the run directory.
+    nproc : int, optional
+        Number of MPI ranks, overriding the config value.
+    run_dir : str or Path, optional
+        Run directory to use instead of ``{prefix}.shg_runs/{direction}``.
+    **kwargs
+        Further keyword arguments passed to :func:`run_shg`.
+
+    Returns
+    -------
+    ShgResult
+        The run; ``workdir`` is the run directory and ``spectrum_file`` points to the
+        collected spectrum when it was moved back.
+    """
+    from castepkit.utils import link_inputs, move_outputs
+
+    name = spectrum_name(prefix, direction)
+    if collect is None:
+        collect = [name]
+    inputs = [f"{prefix}.{suffix}" for suffix in SHG_INPUT_SUFFIXES]
+    inputs += sorted(str(f) for f in Path(".").glob("*.recpot"))
+
+    workdir = Path(run_dir or Path(f"{prefix}.shg_runs") / direction)
+    link_inputs(inputs, workdir)
+    result = run_shg(prefix, direction=direction, workdir=workdir, nproc=nproc, **kwargs)
+    move_outputs(collect, workdir, ".")
+    if name in collect:
+        result.spectrum_file = Path(name)
+    return result
+
+
+def run_shg_batch(
+    prefix: str,
+    directions: list,
+    ncores: int = None,
+    max_workers: int = None,
+    **kwargs,
+) -> dict:
+    """
+    Run several SHG tensor components concurrently.
+
+    Each direction runs through :func:`run_shg_isolated`: the ``{prefix}.chi{direction}``
+    spectrum is moved back into the current directory and all other outputs stay in
+    ``{prefix}.shg_runs/{direction}``.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    directions : list of str
+        Direction indices, e.g., ['111', '123'].
+    ncores : int, optional
+        Total core budget shared by all runs (default: all cores of the machine).
+    max_workers : int, optional
+        Maximum number of runs at the same time (default: one per direction, capped by
+        ``ncores``). The remaining cores are given to each run as MPI ranks.
+    **kwargs
+        Further keyword arguments passed to :func:`run_shg`.
+
+    Returns
+    -------
+    dict
+        Mapping from direction to its :class:`ShgResult`.
+    """
+    from castepkit.utils import split_cores
+
+    directions = list(dict.fromkeys(directions))
+    workers, nproc = split_cores(ncores, len(directions), max_workers)
+    print(f"Running {len(directions)} SHG components: {workers} concurrent x {nproc} rank(s)")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            d: pool.submit(run_shg_isolated, prefix, d, nproc=nproc, **kwargs) for d in directions
+        }
+        return {d: future.result() for d, future in futures.items()}
+
+
+def run_shg_tensor(
+    prefix: str,
+    ncores: int = None,
+    max_workers: int = None,
+    symprec: float = 1e-4,
+    **kwargs,
+):
+    """
+    Compute the full SHG tensor from its symmetry-independent components only.
+
+    The point group is derived from ``{prefix}.cell``; only the minimal set of directions
+    is run (concurrently, see :func:`run_shg_batch`) and the other components are rebuilt
+    by symmetry. The result is also saved to ``{prefix}.chi_tensor.npz``.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    ncores : int, optional
+        Total core budget shared by all runs (default: all cores of the machine).
+    max_workers : int, optional
+        Maximum number of runs at the same time.
+    symprec : float
+        Tolerance for the symmetry search.
+    **kwargs
+        Further keyword arguments passed to :func:`run_shg`.
+
+    Returns
+    -------
+    tuple or None
+        Photon energies (n_energies,) and the complex tensor (3, 3, 3, n_energies),
+        or None if all components vanish by symmetry.
+    """
+    import numpy as np
+
+    from castepkit.symmetry import plan_shg_tensor
+
+    plan = plan_shg_tensor(f"{prefix}.cell", symprec=symprec)
+    print(
+        f"Point group of order {len(plan.rotations)}: "
+        f"{len(plan.directions)} independent component(s) {plan.directions}, "
+        f"{len(plan.zero_directions)} zero by symmetry"
+    )
+    if not plan.directions:
+        print("All SHG tensor components vanish by symmetry; nothing to run.")
+        return None
+
+    results = run_shg_batch(
+        prefix, plan.directions, ncores=ncores, max_workers=max_workers, **kwargs
+    )
+
+    failed = [d for d, result in results.items() if result.metrics and result.metrics.returncode]
+    if failed:
+        raise RuntimeError(f"SHG runs of {failed} failed; not rebuilding the tensor")
+    spectra = {d: result.spectrum for d, result in results.items()}
+    energy = spectra[plan.directions[0]].energy
+    tensor = plan.rebuild({d: spectrum.chi for d, spectrum in spectra.items()})
+    np.savez(f"{prefix}.chi_tensor.npz", energy=energy, chi=tensor, directions=plan.directions)
+    return energy, tensor
+
+
+SWEEP_PARAMETERS = ("scissors", "energy_range", "is_metal")
 
 
-def main():
+def parse_values(text: str, kind=float) -> list:
+    """
+    Expand a sweep specification into a list of values.
+
+    ``start:stop:step`` is an inclusive range (``0:1.5:0.1`` gives 16 values) and
+    ``a,b,c`` an explicit list.
+    """
+    if ":" in text:
+        try:
+            start, stop, step = (float(x) for x in text.split(":"))
+        except ValueError:
+            raise ValueError(f"Range must be start:stop:step, got {text}") from None
+        if step <= 0 or stop < start:
+            raise ValueError(f"Empty range {text}")
+        count = math.floor((stop - start) / step + 1e-9) + 1
+        return [kind(round(start + i * step, 10)) for i in range(count)]
+    return [kind(x) for x in text.split(",")]
+
+
+@dataclass
+class ShgSweep:
+    """
+    Spectra of a parameter sweep, stacked on the parameter grid.
+
+    Attributes
+    ----------
+    direction : str
+        Direction index of the sweep.
+    parameters : dict
+        Swept parameter names mapped to their values, in grid-axis order.
+    energy : np.ndarray
+        Photon energies (n_energies,).
+    chi : np.ndarray
+        Complex chi(2) of shape ``(*[len(v) for v in parameters.values()], n_energies)``.
+    results : dict
+        Mapping from a tuple of parameter values to the :class:`ShgResult` of that point.
+    """
+
+    direction: str
+    parameters: dict
+    energy: "np.ndarray"
+    chi: "np.ndarray"
+    results: dict
+
+
+def run_shg_sweep(
+    prefix: str,
+    parameters: dict,
+    direction: str = "123",
+    ncores: int = None,
+    max_workers: int = None,
+    cache: bool = True,
+    **kwargs,
+) -> ShgSweep:
+    """
+    Run SHG over a grid of parameter values concurrently.
+
+    Every point runs in its own directory ``{prefix}.shg_runs/sweep_{direction}/<point>``
+    and through the result cache, so extending a sweep only computes the new points. The
+    stacked result is also saved to ``{prefix}.sweep_{direction}.npz``.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    parameters : dict
+        Parameters of :func:`run_shg` to sweep mapped to lists of values, e.g.
+        ``{"scissors": [0.0, 0.5, 1.0]}``. The full product grid is run.
+    direction : str
+        Direction index, e.g., '123'.
+    ncores : int, optional
+        Total core budget shared by all runs (default: all cores of the machine).
+    max_workers : int, optional
+        Maximum number of runs at the same time.
+    cache : bool
+        Reuse cached outputs of points already computed (default: on).
+    **kwargs
+        Fixed keyword arguments passed to :func:`run_shg`.
+
+    Returns
+    -------
+    ShgSweep
+        The stacked spectra.
+    """
+    from castepkit.utils import split_cores
+
+    if not parameters:
+        raise ValueError("Nothing to sweep: no parameter values given")
+    names = list(parameters)
+    values = [list(parameters[name]) for name in names]
+    points = list(itertools.product(*values))
+    workers, nproc = split_cores(ncores, len(points), max_workers)
+    print(f"Sweeping {len(points)} points: {workers} concurrent x {nproc} rank(s)")
+
+    def run_point(point):
+        tag = ",".join(f"{name}={value:g}" for name, value in zip(names, point))
+        return run_shg_isolated(
+            prefix,
+            direction,
+            collect=[],
+            nproc=nproc,
+            run_dir=Path(f"{prefix}.shg_runs") / f"sweep_{direction}" / tag,
+            cache=cache,
+            **{**kwargs, **dict(zip(names, point))},
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(points, pool.map(run_point, points)))
+
+    spectra = [results[p].spectrum for p in points]
+    energy, chi = stack_sweep(f"{prefix}.sweep_{direction}.npz", names, values, spectra)
+    return ShgSweep(direction, dict(zip(names, values)), energy, chi, results)
+
+
+def stack_sweep(filename, names, values, spectra) -> tuple:
+    """
+    Stack the spectra of a sweep on its parameter grid and save them to ``filename``.
+
+    Parameters
+    ----------
+    filename : str or Path
+        Output ``.npz`` with ``energy``, ``chi`` and one array of values per parameter.
+    names : list of str
+        Swept parameters, in grid-axis order.
+    values : list of list
+        Values of each parameter.
+    spectra : list of Spectrum
+        One spectrum per grid point, in ``itertools.product(*values)`` order.
+
+    Returns
+    -------
+    tuple
+        Photon energies (n_energies,) and chi(2) of shape ``(*grid, n_energies)``.
+    """
+    import numpy as np
+
+    energy = np.asarray(spectra[0].energy)
+    points = list(itertools.product(*values))
+    for point, spectrum in zip(points, spectra):
+        if spectrum.energy.shape != energy.shape:
+            raise ValueError(f"Spectrum of {point} has a different energy grid")
+    chi = np.stack([spectrum.chi for spectrum in spectra])
+    chi = chi.reshape(*(len(v) for v in values), len(energy))
+    np.savez(
+        filename,
+        energy=energy,
+        chi=chi,
+        **{name: np.array(v) for name, v in zip(names, values)},
+    )
+    return energy, chi
+
+
+def sweep_main(argv=None, prog="castepkit-shg sweep"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Run NewSHG_ZY-XTIPC.x over a grid of parameter values",
+    )
+    parser.add_argument("prefix", help="Prefix of the CASTEP calculation")
+    parser.add_argument(
+        "--direction",
+        default="123",
+        help="Direction index for SHG tensor (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--scissors",
+        default=None,
+        help="Scissors values in eV: start:stop:step (inclusive) or a,b,c",
+    )
+    parser.add_argument("--energy_range", default=None, help="Energy range types, e.g. 0,1,2")
+    parser.add_argument("--is_metal", default=None, help="Metallic flags, e.g. 1,2")
+    parser.add_argument(
+        "--unit",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="Output unit: 0=pm/V, 1=esu (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ncores",
+        type=int,
+        default=None,
+        help="Core budget shared by the runs (default: all cores)",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="Maximum concurrent runs (default: one per point, capped by --ncores)",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Recompute every point instead of reusing cached results",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Named [profiles.<name>] config overrides to use",
+    )
+
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        set_profile(args.profile)
+
+    parameters = {}
+    for name in SWEEP_PARAMETERS:
+        text = getattr(args, name)
+        if text is not None:
+            parameters[name] = parse_values(text, float if name == "scissors" else int)
+    if not parameters:
+        parser.error("give at least one of --scissors, --energy_range, --is_metal")
+
+    sweep = run_shg_sweep(
+        args.prefix,
+        parameters,
+        direction=args.direction,
+        ncores=args.ncores,
+        max_workers=args.max_workers,
+        cache=not args.no_cache,
+        band_resolved=0,
+        unit=args.unit,
+    )
+    print(f"✅ Stacked {sweep.chi.shape} spectra into {args.prefix}.sweep_{args.direction}.npz")
+
+
+def main(argv=None, prog=None):
     parser = argparse.ArgumentParser(
-        description="Wrapper for SHG calculation using NewSHG_ZY-XTIPC.x"
+        prog=prog,
+        description="Wrapper for SHG calculation using NewSHG_ZY-XTIPC.x",
+        epilog="Parameter sweeps: castepkit-shg sweep PREFIX --scissors 0:1.5:0.1 (see sweep -h)",
     )
     parser.add_argument("prefix", help="Prefix of the CASTEP calculation")
     parser.add_argument(
@@ -94,6 +692,39 @@ def main():
         default="123",
         help="Direction index for SHG tensor (default: %(default)s)",
     )
+    parser.add_argument(
+        "--directions",
+        help="Comma-separated direction indices run concurrently, e.g., 111,123,333",
+    )
+    parser.add_argument(
+        "--full_tensor",
+        "--full-tensor",
+        action="store_true",
+        help="Run only the symmetry-independent components and rebuild the full tensor",
+    )
+    parser.add_argument(
+        "--ncores",
+        type=int,
+        default=None,
+        help="Core budget for --directions/--full_tensor (default: all cores)",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="Maximum concurrent runs for --directions (default: one per direction)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=None,
+        help="Reuse cached outputs of identical runs (default: [cache] enabled in config)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Named [profiles.<name>] config overrides to use",
+    )
     parser.add_argument(
         "--scissors",
         type=float,
@@ -131,8 +762,8 @@ def main():
         "--is_metal",
         type=int,
         choices=[1, 2],
-        default=2,
-        help="Is the system metallic? 1=yes, 2=no (default: %(default)s)",
+        default=None,
+        help="Is the system metallic? 1=yes, 2=no (default: detect from the .bands file)",
     )
     parser.add_argument(
         "--energy_range",
@@ -142,19 +773,38 @@ def main():
         help="Energy range selection: 0, 1, or 2 (default: %(default)s)",
     )
 
-    args = parser.parse_args()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["sweep"]:
+        sweep_main(argv[1:], prog=f"{parser.prog} sweep")
+        return
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        set_profile(args.profile)
 
-    run_shg(
-        prefix=args.prefix,
+    params = dict(
         scissors=args.scissors,
-        direction=args.direction,
         band_resolved=args.band_resolved,
         rank_number=args.rank_number,
         unit=args.unit,
         output_level=args.output_level,
         is_metal=args.is_metal,
         energy_range=args.energy_range,
+        cache=args.cache,
     )
+    if args.full_tensor:
+        run_shg_tensor(args.prefix, ncores=args.ncores, max_workers=args.max_workers, **params)
+        return
+    if args.directions:
+        run_shg_batch(
+            args.prefix,
+            args.directions.split(","),
+            ncores=args.ncores,
+            max_workers=args.max_workers,
+            **params,
+        )
+        return
+
+    run_shg(prefix=args.prefix, direction=args.direction, **params)
 
 
 if __name__ == "__main__":
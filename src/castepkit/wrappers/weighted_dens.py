@@ -1,42 +1,229 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from castepkit.utils import check_files_exist, run_program
-from castepkit.wrappers.shg import run_shg
+from castepkit.config import set_profile
 
-__all__ = ["run_weighted_den"]
+# numpy, the result cache, the band tools and the SHG wrapper are imported where they are
+# used, so ``castepkit dens --help`` stays fast (see castepkit.wrappers.shg).
+if TYPE_CHECKING:
+    from castepkit.utils import RunMetrics
 
+__all__ = [
+    "WeightedDenResult",
+    "run_weighted_den",
+    "arun_weighted_den",
+    "run_weighted_den_batch",
+]
+
+# CASTEP files weighted_den.x may read besides the weight file.
+WDEN_INPUT_SUFFIXES = ["cell", "param", "bands", "check", "orbitals", "castep_bin"]
+
+
+@dataclass
+class WeightedDenResult:
+    """
+    Outcome of one weighted_den.x run.
+
+    The result is path-like (``os.fspath`` gives ``output_file``), so it can be passed
+    wherever the output file is expected.
+
+    Attributes
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation.
+    suffix : str
+        Suffix of the output, e.g. 'veocc'.
+    output_file : Path
+        The renamed output ``{prefix}_{suffix}.{ext}``.
+    stdout, stderr : str
+        Output of the program (empty when streamed to log files).
+    metrics : RunMetrics
+        Wall time, CPU time, peak memory and input sizes of the run.
+    """
+
+    prefix: str
+    suffix: str
+    output_file: Path
+    stdout: str = ""
+    stderr: str = ""
+    metrics: "RunMetrics" = None
+
+    def __fspath__(self) -> str:
+        return os.fspath(self.output_file)
+
+
+def run_weighted_den(
+    prefix: str,
+    weight_file: str,
+    suffix: str,
+    output_format: int,
+    cache: bool = None,
+    nproc: int = None,
+) -> WeightedDenResult:
+    """
+    Run weighted_den.x on a specific input and rename the output file.
+
+    The program runs in a private scratch directory next to the inputs, with the weight
+    file and CASTEP files symlinked in and its own ``{prefix}.wden_in``. The output is
+    then moved back atomically as ``{prefix}_{suffix}.{ext}``, so several invocations can
+    share a directory at the same time. Raises ``RuntimeError`` when the program exits
+    with a non-zero code.
+
+    Returns
+    -------
+    WeightedDenResult
+        The output file and the metrics of the run.
+    """
+    from castepkit.cache import run_steps
+
+    return run_steps(_weighted_den_steps(prefix, weight_file, suffix, output_format, cache, nproc))
+
+
+async def arun_weighted_den(
+    prefix: str,
+    weight_file: str,
+    suffix: str,
+    output_format: int,
+    cache: bool = None,
+    nproc: int = None,
+) -> WeightedDenResult:
+    """
+    Async counterpart of :func:`run_weighted_den`, with the same parameters and result.
+
+    The program runs through :func:`castepkit.utils.arun_program`: cancelling the task
+    kills it, and ``set_max_concurrency`` limits how many run at once.
+    """
+    from castepkit.cache import arun_steps
+
+    return await arun_steps(
+        _weighted_den_steps(prefix, weight_file, suffix, output_format, cache, nproc)
+    )
 
-def run_weighted_den(prefix: str, weight_file: str, suffix: str, output_format: int) -> Path:
-    """Run weighted_den.x on a specific input and rename the output file."""
-    check_files_exist([weight_file], label=f"input weight file ({suffix})")
-    Path(f"{prefix}.wden_in").write_text(weight_file)
 
-    stdout, stderr = run_program("weighted_den", f"{output_format}\n", [prefix])
-    # print(f"[weighted_den.x STDOUT ({suffix})]")
-    print(stdout)
-    if stderr:
-        # print(f"[weighted_den.x STDERR ({suffix})]")
-        print(stderr)
+def _weighted_den_steps(prefix, weight_file, suffix, output_format, cache, nproc):
+    """Body of :func:`run_weighted_den` as a generator, see :func:`castepkit.cache.run_steps`."""
+    from castepkit.utils import check_files_exist, link_inputs
+
+    check_files_exist([weight_file], label=f"input weight file ({suffix})")
 
     ext_map = {1: "pot", 2: "check", 3: "grd"}
     ext = ext_map.get(output_format, "grd")
-
-    output_file = Path(f"{prefix}_wden.{ext}")
+    output_name = f"{Path(prefix).name}_wden.{ext}"
     target_file = Path(f"{prefix}_{suffix}.{ext}")
-    if not check_files_exist([output_file], label=f"raw output ({output_file})"):
-        raise FileNotFoundError(f"Expected output file not found: {output_file}")
 
-    output_file.rename(target_file)
+    scratch = Path(
+        tempfile.mkdtemp(prefix=f".{Path(prefix).name}.wden_{suffix}.", dir=target_file.parent)
+    )
+    # Removed however the run ends (failure, timeout, Ctrl-C, cancellation), except when
+    # the program succeeded without its output: then the scratch is kept for inspection.
+    keep = False
+    try:
+        inputs = [weight_file] + [f"{prefix}.{e}" for e in WDEN_INPUT_SUFFIXES]
+        inputs += [str(f) for f in Path(prefix).parent.glob("*.recpot")]
+        link_inputs(inputs, scratch)
+        (scratch / f"{Path(prefix).name}.wden_in").write_text(Path(weight_file).name)
+
+        cache_inputs = [f"{Path(prefix).name}.wden_in"] + [Path(f).name for f in inputs]
+        output = yield dict(
+            prog_key="weighted_den",
+            input_str=f"{output_format}\n",
+            args=[Path(prefix).name],
+            inputs=cache_inputs,
+            cwd=scratch,
+            nproc=nproc,
+            enabled=cache,
+        )
+        stdout, stderr = output
+        # print(f"[weighted_den.x STDOUT ({suffix})]")
+        print(stdout)
+        if stderr:
+            # print(f"[weighted_den.x STDERR ({suffix})]")
+            print(stderr)
+
+        if output.metrics.returncode:
+            raise RuntimeError(
+                f"weighted_den.x ({suffix}) exited with code {output.metrics.returncode}"
+            )
+
+        output_file = scratch / output_name
+        if not check_files_exist([output_file], label=f"raw output ({output_name})"):
+            keep = True
+            raise FileNotFoundError(f"Expected output file not found: {output_file} (scratch kept)")
+
+        os.replace(output_file, target_file)
+    finally:
+        if not keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
     check_files_exist([target_file], label=f"final renamed output ({suffix})")
 
-    return target_file
+    return WeightedDenResult(
+        Path(prefix).name, suffix, target_file, stdout, stderr, metrics=output.metrics
+    )
+
+
+def run_weighted_den_batch(
+    prefix: str,
+    weight_files: dict,
+    output_format: int = 3,
+    ncores: int = None,
+    max_workers: int = None,
+    cache: bool = None,
+) -> dict:
+    """
+    Run weighted_den.x concurrently for several weight files.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the CASTEP calculation (e.g., 'GaAs_Optics').
+    weight_files : dict
+        Mapping from output suffix (e.g., 'veocc') to weight file.
+    output_format : int
+        Output format: 1=.pot, 2=.check, 3=.grd.
+    ncores : int, optional
+        Total core budget shared by all runs (default: all cores of the machine).
+    max_workers : int, optional
+        Maximum number of runs at the same time (default: one per weight file).
+    cache : bool, optional
+        Reuse cached outputs of identical runs (default: ``[cache] enabled`` in config).
+
+    Returns
+    -------
+    dict
+        Mapping from output suffix to its :class:`WeightedDenResult`.
+    """
+    from castepkit.utils import split_cores
+
+    workers, nproc = split_cores(ncores, len(weight_files), max_workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            suffix: pool.submit(
+                run_weighted_den, prefix, weight_file, suffix, output_format, cache, nproc
+            )
+            for suffix, weight_file in weight_files.items()
+        }
+        return {suffix: future.result() for suffix, future in futures.items()}
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Unified CLI for SHG + weighted_den.x")
+def _weight_suffix(prefix: str, weight_file: str) -> str:
+    """Output suffix for a weight file, e.g. '{prefix}.shg_weight_veocc' -> 'veocc'."""
+    name = Path(weight_file).name
+    if name.startswith(f"{Path(prefix).name}."):
+        name = name[len(Path(prefix).name) + 1 :]
+    return name.removeprefix("shg_weight_")
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Unified CLI for SHG + weighted_den.x")
     subparsers = parser.add_subparsers(dest="mode", required=True)
 
     # === run ===
@@ -52,6 +239,12 @@ def main():
         default="veocc",
         help="Suffix for renamed output file (default: %(default)s)",
     )
+    p_run.add_argument(
+        "--weights",
+        default=None,
+        help="Comma-separated weight files run concurrently, e.g., "
+        "GaAs.shg_weight_veocc,GaAs.vbm_window; outputs are named after the file suffix",
+    )
     p_run.add_argument(
         "--wden_format",
         type=int,
@@ -117,8 +310,8 @@ def main():
         "--is_metal",
         type=int,
         choices=[1, 2],
-        default=2,
-        help="Is metallic? 1=yes, 2=no (default: %(default)s)",
+        default=None,
+        help="Is metallic? 1=yes, 2=no (default: detect from the .bands file)",
     )
     p_shg.add_argument(
         "--energy_range",
@@ -135,21 +328,137 @@ def main():
         help="weighted_den.x output format: 1=.pot, 2=.check, 3=.grd (default: %(default)s)",
     )
 
-    args = parser.parse_args()
+    # === weights ===
+    p_weights = subparsers.add_parser(
+        "weights", help="Write a weight file from the .bands file, optionally run weighted_den.x"
+    )
+    p_weights.add_argument("prefix", help="Prefix of CASTEP output files")
+    p_weights.add_argument(
+        "name", help="Weight file suffix, e.g., vbm_window -> {prefix}.vbm_window"
+    )
+    p_weights.add_argument(
+        "--window",
+        default=None,
+        help="Energy window EMIN:EMAX in eV relative to --ref, e.g., -1:0 (default: none)",
+    )
+    p_weights.add_argument(
+        "--ref",
+        default="vbm",
+        help="Reference energy of --window: vbm, cbm, fermi or absolute (default: %(default)s)",
+    )
+    p_weights.add_argument(
+        "--bands",
+        default=None,
+        help="1-based bands, e.g., 5-9,12, or 'occupied'/'unoccupied' (default: all)",
+    )
+    p_weights.add_argument("--kpoints", default=None, help="1-based k-points (default: all)")
+    p_weights.add_argument("--spins", default=None, help="1-based spins (default: all)")
+    p_weights.add_argument(
+        "--from_file",
+        default=None,
+        help="Custom weights in a .npy file, shaped (nbands,), (nkpts, nbands) or "
+        "(nspins, nkpts, nbands)",
+    )
+    p_weights.add_argument(
+        "--run", action="store_true", help="Run weighted_den.x on the new weight file"
+    )
+    p_weights.add_argument(
+        "--wden_format",
+        type=int,
+        choices=[1, 2, 3],
+        default=3,
+        help="Output format: 1=.pot, 2=.check, 3=.grd (default: %(default)s)",
+    )
+
+    for p in (p_run, p_ve, p_shg, p_weights):
+        p.add_argument(
+            "--cache",
+            action="store_true",
+            default=None,
+            help="Reuse cached outputs of identical runs (default: [cache] enabled in config)",
+        )
+        p.add_argument(
+            "--ncores",
+            type=int,
+            default=None,
+            help="Core budget shared by concurrent runs (default: all cores)",
+        )
+        p.add_argument(
+            "--max_workers",
+            type=int,
+            default=None,
+            help="Maximum concurrent weighted_den.x runs (default: one per weight file)",
+        )
+        p.add_argument(
+            "--profile",
+            default=None,
+            help="Named [profiles.<name>] config overrides to use",
+        )
+
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        set_profile(args.profile)
+
+    batch = dict(
+        output_format=args.wden_format,
+        ncores=args.ncores,
+        max_workers=args.max_workers,
+        cache=args.cache,
+    )
+    input_cases = {
+        "veocc": f"{args.prefix}.shg_weight_veocc",
+        "veunocc": f"{args.prefix}.shg_weight_veunocc",
+    }
+
+    if args.mode == "run" and args.weights:
+        weight_files = {_weight_suffix(args.prefix, f): f for f in args.weights.split(",")}
+        run_weighted_den_batch(args.prefix, weight_files, **batch)
 
-    if args.mode == "run":
+    elif args.mode == "run":
         input_file = f"{args.prefix}.{args.input_file_suffix}"
-        run_weighted_den(args.prefix, input_file, args.suffix, args.wden_format)
+        run_weighted_den(args.prefix, input_file, args.suffix, args.wden_format, args.cache)
 
     elif args.mode == "ve":
-        input_cases = {
-            "veocc": f"{args.prefix}.shg_weight_veocc",
-            "veunocc": f"{args.prefix}.shg_weight_veunocc",
-        }
-        for suffix, input_file in input_cases.items():
-            run_weighted_den(args.prefix, input_file, suffix, args.wden_format)
+        run_weighted_den_batch(args.prefix, input_cases, **batch)
+
+    elif args.mode == "weights":
+        import numpy as np
+
+        from castepkit.analysis.band_weights import (
+            REFERENCES,
+            band_selection,
+            energy_window,
+            expand_weights,
+            parse_indices,
+            write_band_weights,
+        )
+        from castepkit.io.bands import Bands
+
+        if args.ref not in REFERENCES:
+            p_weights.error(
+                f"argument --ref: invalid choice: '{args.ref}' (choose from {REFERENCES})"
+            )
+        bands = Bands(f"{args.prefix}.bands")
+        weights = np.ones((bands.nspins, bands.nkpts, bands.nbands))
+        if args.window:
+            emin, emax = (float(e) for e in args.window.split(":"))
+            weights *= energy_window(bands, emin, emax, args.ref)
+        if args.bands or args.kpoints or args.spins:
+            selection = args.bands
+            if selection not in (None, "occupied", "unoccupied"):
+                selection = parse_indices(selection)
+            kpoints = parse_indices(args.kpoints) if args.kpoints else None
+            spins = parse_indices(args.spins) if args.spins else None
+            weights *= band_selection(bands, selection, kpoints, spins)
+        if args.from_file:
+            weights *= expand_weights(bands, np.load(args.from_file))
+        weight_file = write_band_weights(args.prefix, args.name, weights, bands)
+        if args.run:
+            run_weighted_den(args.prefix, str(weight_file), args.name, args.wden_format, args.cache)
 
     elif args.mode == "shg":
+        from castepkit.wrappers.shg import run_shg
+
         run_shg(
             prefix=args.prefix,
             scissors=args.scissors,
@@ -160,14 +469,9 @@ def main():
             output_level=args.output_level,
             is_metal=args.is_metal,
             energy_range=args.energy_range,
+            cache=args.cache,
         )
-
-        input_cases = {
-            "veocc": f"{args.prefix}.shg_weight_veocc",
-            "veunocc": f"{args.prefix}.shg_weight_veunocc",
-        }
-        for suffix, input_file in input_cases.items():
-            run_weighted_den(args.prefix, input_file, suffix, args.wden_format)
+        run_weighted_den_batch(args.prefix, input_cases, **batch)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import itertools
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from castepkit.analysis.atoms import PeriodicCellList, atom_contributions
+from castepkit.io.cell import lattice_from_abc, read_cell
+from castepkit.io.grd import write_grd
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+def _brute_force(lattice, positions, frac):
+    images = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+    atoms = (np.mod(positions, 1.0)[None] + images[:, None]).reshape(-1, 3) @ lattice
+    d = np.linalg.norm((frac @ lattice)[:, None] - atoms[None], axis=-1)
+    return d.argmin(axis=1) % len(positions), d
+
+
+def test_cell_list_matches_brute_force():
+    rng = np.random.default_rng(3)
+    lattice = lattice_from_abc(9.0, 10.0, 11.0, 80.0, 95.0, 110.0)
+    positions = rng.random((40, 3))
+    frac = rng.random((500, 3))
+    expected, d = _brute_force(lattice, positions, frac)
+
+    index, dist = PeriodicCellList(lattice, positions, cutoff=2.0).nearest(frac)
+    np.testing.assert_array_equal(index, expected)
+    np.testing.assert_allclose(dist, d.min(axis=1))
+
+    points, atoms = PeriodicCellList(lattice, positions, cutoff=2.5).within(frac, 2.5)
+    i, j = np.nonzero(d < 2.5)
+    assert sorted(zip(points, atoms)) == sorted(zip(i, j % len(positions)))
+
+
+def test_atom_contributions(tmp_path):
+    cell = read_cell(TEST_DATA / "GaAs_Optics.cell")
+    abc = np.linalg.norm(cell["lattice"], axis=1)
+    angles = [
+        np.degrees(
+            np.arccos(cell["lattice"][i - 2] @ cell["lattice"][i - 1] / abc[i - 2] / abc[i - 1])
+        )
+        for i in range(3)
+    ]
+    grid = tmp_path / "GaAs_veocc.grd"
+    write_grd(grid, np.ones((12, 12, 12)), [*abc, *angles])
+
+    voronoi = atom_contributions(grid, TEST_DATA / "GaAs_Optics.cell", block=5)
+    volume = abs(np.linalg.det(cell["lattice"]))
+    assert voronoi.total == pytest.approx(volume, rel=1e-4)
+    assert voronoi.per_atom.sum() == pytest.approx(volume, rel=1e-4)
+    assert sum(voronoi.per_species.values()) == pytest.approx(volume, rel=1e-4)
+
+    sphere = atom_contributions(grid, TEST_DATA / "GaAs_Optics.cell", "sphere", radius=1.0)
+    assert sphere.per_atom.sum() + sphere.interstitial == pytest.approx(volume, rel=1e-4)
+    assert sphere.interstitial > 0
@@ -0,0 +1,145 @@
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import castepkit.cache
+import castepkit.config
+from castepkit.cache import (
+    _link_or_copy,
+    _store,
+    clear,
+    list_entries,
+    parse_size,
+    prune,
+    run_cached,
+)
+
+FAKE_PROGRAM = """#!/bin/sh
+read value
+echo "run" >> "$1.calls"
+echo "$value" > "$1.out"
+echo "stdout $value"
+[ "$value" != fail ]
+"""
+
+
+@pytest.fixture
+def fake_setup(tmp_path, monkeypatch):
+    exe = tmp_path / "fake.sh"
+    exe.write_text(FAKE_PROGRAM)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(
+        f'[executables]\nfake = "{exe}"\n\n[cache]\nenabled = true\ndir = "{tmp_path / "cache"}"\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "x.in").write_text("input\n")
+    monkeypatch.chdir(workdir)
+    return tmp_path
+
+
+def test_parse_size():
+    assert parse_size(1024) == 1024
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5GB") == int(1.5 * 1024**3)
+    assert parse_size("3MiB") == 3 * 1024**2
+
+
+def test_run_cached_hit_and_miss(fake_setup):
+    stdout, _ = run_cached("fake", "1\n", ["x"], ["x.in"])
+    assert stdout.strip() == "stdout 1"
+    assert len(list_entries(fake_setup / "cache")) == 1
+
+    # Identical run: restored from cache, the program is not called again.
+    os.remove("x.out")
+    stdout, _ = run_cached("fake", "1\n", ["x"], ["x.in"])
+    assert stdout.strip() == "stdout 1"
+    assert open("x.out").read() == "1\n"
+    assert open("x.calls").read().count("run") == 1
+
+    # Hit again over the outputs restored by the previous hit.
+    run_cached("fake", "1\n", ["x"], ["x.in"])
+    assert open("x.out").read() == "1\n"
+    assert not [f for f in os.listdir() if f.startswith(".x.out.")]
+
+    # Changed stdin or input file content: recomputed.
+    run_cached("fake", "2\n", ["x"], ["x.in"])
+    with open("x.in", "a") as f:
+        f.write("changed\n")
+    run_cached("fake", "2\n", ["x"], ["x.in"])
+    assert len(list_entries(fake_setup / "cache")) == 3
+
+
+def test_prune_lru(fake_setup):
+    for value in range(3):
+        run_cached("fake", f"{value}\n", ["x"], ["x.in"])
+    entries = list_entries(fake_setup / "cache")
+    assert len(entries) == 3
+    keep = entries[0][1]["size"]
+    assert prune(max_size=keep, cache_dir=fake_setup / "cache") == 2
+    assert [key for key, _ in list_entries(fake_setup / "cache")] == [entries[0][0]]
+    assert clear(fake_setup / "cache") == 1
+
+
+def test_failed_runs_not_stored(fake_setup):
+    output = run_cached("fake", "fail\n", ["x"], ["x.in"])
+    assert output.metrics.returncode == 1 and open("x.out").read() == "fail\n"
+    assert list_entries(fake_setup / "cache") == []
+    run_cached("fake", "fail\n", ["x"], ["x.in"])
+    assert open("x.calls").read().count("run") == 2
+
+
+def test_input_digests_memoized(fake_setup, monkeypatch):
+    calls = []
+    hash_file = castepkit.cache.hash_file
+    monkeypatch.setattr(castepkit.cache, "hash_file", lambda f: calls.append(f) or hash_file(f))
+    monkeypatch.setattr(castepkit.cache, "_DIGESTS", {})
+    for value in range(2):
+        run_cached("fake", f"{value}\n", ["x"], ["x.in"])
+    assert len(calls) == 1
+
+    # A new process reuses the stored digest; a changed file is hashed again.
+    monkeypatch.setattr(castepkit.cache, "_DIGESTS", {})
+    run_cached("fake", "0\n", ["x"], ["x.in"])
+    assert len(calls) == 1
+    with open("x.in", "a") as f:
+        f.write("changed\n")
+    run_cached("fake", "0\n", ["x"], ["x.in"])
+    assert len(calls) == 2
+
+
+def test_concurrent_store_and_restore(fake_setup):
+    # Threads of one process (run_shg_batch, the pipeline) store and restore the same
+    # result at the same time; they must not share temporary names.
+    settings = castepkit.config.get_cache_settings()
+    open("x.out", "w").write("out\n")
+    barrier = threading.Barrier(8)
+
+    def store(_):
+        barrier.wait()
+        _store("ab" * 32, "fake", ".", ["x.out"], "", "", settings)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(store, range(8)))
+    assert [key for key, _ in list_entries(fake_setup / "cache")] == ["ab" * 32]
+    assert os.listdir(fake_setup / "cache" / "ab") == ["ab" * 32]
+
+    cached = fake_setup / "cache" / "ab" / ("ab" * 32) / "files" / "x.out"
+    for i in range(8):
+        open(f"copy{i}", "w").write("old\n")
+
+    def restore(i):
+        barrier.wait()
+        _link_or_copy(cached, "restored")
+        _link_or_copy(cached, f"copy{i}")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(restore, range(8)))
+    assert all(open(f"copy{i}").read() == "out\n" for i in range(8))
+    assert open("restored").read() == "out\n"
+    assert not [f for f in os.listdir() if f.startswith(".")]
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import stat
+import sys
+
+import pytest
+
+from castepkit.campaign import Journal, load_manifest, run_campaign
+
+FAKE_SHG = """#!/bin/sh
+read scissors
+read direction
+echo "0.0 $scissors 1.0" > "$1.chi$direction"
+[ "$scissors" != 9.5 ]
+"""
+
+MANIFEST = """
+[defaults]
+task = "shg"
+scissors = 0.5
+
+[[jobs]]
+dirs = "materials/*"
+prefix = "{name}_Optics"
+
+[[jobs]]
+dir = "materials/AlP"
+prefix = "AlP_Optics"
+bogus_option = 1
+"""
+
+
+@pytest.fixture
+def campaign(tmp_path, monkeypatch):
+    exe = tmp_path / "fake_shg.sh"
+    exe.write_text(FAKE_SHG)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    # Child processes read the config from the default location.
+    (tmp_path / "xdg" / "castepkit").mkdir(parents=True)
+    (tmp_path / "xdg" / "castepkit" / "config.toml").write_text(f'[executables]\nshg = "{exe}"\n')
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+    for name in ("AlP", "GaAs"):
+        (tmp_path / "materials" / name).mkdir(parents=True)
+        for suffix in ("bands", "cell"):
+            (tmp_path / "materials" / name / f"{name}_Optics.{suffix}").write_text("")
+    manifest = tmp_path / "campaign.toml"
+    manifest.write_text(MANIFEST)
+    return manifest
+
+
+def test_load_manifest(campaign):
+    jobs = load_manifest(campaign)
+    assert [j.prefix for j in jobs] == ["AlP_Optics", "GaAs_Optics", "AlP_Optics"]
+    assert jobs[0].params == {"scissors": 0.5}
+    assert len({j.id for j in jobs}) == 3
+
+
+def test_run_and_resume(campaign):
+    result = run_campaign(campaign, max_workers=2)
+    assert result == {"done": 2, "failed": 1, "skipped": 0}
+    assert (campaign.parent / "materials/GaAs/GaAs_Optics.chi123").read_text().split()[1] == "0.5"
+
+    journal_path = campaign.with_name("campaign.toml.journal.sqlite")
+    journal = Journal(journal_path)
+    done = journal.rows("done")
+    assert all(row["returncode"] == 0 and row["elapsed"] > 0 for row in done)
+    assert any(
+        path.endswith("GaAs_Optics.chi123") for row in done for path in json.loads(row["outputs"])
+    )
+    assert journal.rows("failed")[0]["returncode"] != 0
+    assert journal.summary()["counts"] == {"done": 2, "failed": 1}
+    journal.close()
+
+    # A job interrupted while running is re-run; finished jobs are not.
+    with sqlite3.connect(journal_path) as conn:
+        conn.execute("UPDATE jobs SET state = 'running' WHERE id = ?", (done[0]["id"],))
+    assert run_campaign(campaign) == {"done": 1, "failed": 0, "skipped": 2}
+    assert run_campaign(campaign, retry_failed=True)["failed"] == 1
+
+
+def test_failed_program_is_journalled(campaign):
+    # The fake writes its spectrum, then exits non-zero; run_shg itself does not raise.
+    campaign.write_text(
+        '[[jobs]]\ndir = "materials/GaAs"\nprefix = "GaAs_Optics"\nscissors = 9.5\n'
+    )
+    assert run_campaign(campaign) == {"done": 0, "failed": 1, "skipped": 0}
+    assert run_campaign(campaign, retry_failed=True)["failed"] == 1
+
+
+# Records how many jobs the journal shows as running while it runs.
+FAKE_SHG_RUNNING = """#!{python}
+import sqlite3, sys
+with sqlite3.connect("{journal}") as conn:
+    running = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'running'").fetchone()[0]
+with open("{record}", "a") as f:
+    f.write(f"{{running}}\\n")
+open(sys.argv[1] + ".chi123", "w").write("0.0 0.5 1.0\\n")
+"""
+
+
+def test_queued_jobs_stay_pending(campaign):
+    record = campaign.parent / "running.txt"
+    journal_path = campaign.with_name("campaign.toml.journal.sqlite")
+    exe = campaign.parent / "fake_shg.sh"
+    exe.write_text(
+        FAKE_SHG_RUNNING.format(python=sys.executable, journal=journal_path, record=record)
+    )
+    campaign.write_text(
+        "".join(
+            f'[[jobs]]\ndir = "materials/GaAs"\nprefix = "GaAs_Optics"\nscissors = {s}\n'
+            for s in (0.1, 0.2, 0.3, 0.4)
+        )
+    )
+    assert run_campaign(campaign, max_workers=1)["done"] == 4
+    assert record.read_text().split() == ["1"] * 4
+    journal = Journal(journal_path)
+    started = [row["started"] for row in journal.rows()]
+    assert all(a < b for a, b in zip(started, started[1:]))
+    assert all(row["attempts"] == 1 for row in journal.rows())
+    journal.close()
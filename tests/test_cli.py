@@ -0,0 +1,74 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from common import prepare_test_data
+
+import castepkit.config
+from castepkit.cli import main, run, run_batch
+from castepkit.config import get_profile
+from castepkit.testing import install_fakes
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+def test_import_is_lazy():
+    code = (
+        "import sys, castepkit.cli; "
+        "print(sorted(m for m in sys.modules if m == 'numpy' or m.startswith('castepkit.')))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "['castepkit.cli']"
+
+
+def test_help_lists_wrappers(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["--help"])
+    assert e.value.code == 0
+    out = capsys.readouterr().out
+    assert "castepkit-shg" in out and "inspect" in out
+
+    with pytest.raises(SystemExit):
+        main(["shg", "sweep", "--help"])
+    assert "usage: castepkit shg sweep" in capsys.readouterr().out
+
+
+def test_batch(tmp_path, monkeypatch, capsys):
+    config = install_fakes(
+        tmp_path / "bin", config=f'[cache]\nenabled = false\ndir = "{tmp_path / "cache"}"\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    (tmp_path / "work").mkdir()
+    prepare_test_data(TEST_DATA, tmp_path / "work", prefix="GaAs_Optics")
+    monkeypatch.chdir(tmp_path)
+
+    lines = [
+        "# SHG, then the density of its weights",
+        "castepkit -C work shg GaAs_Optics --direction 123 --band_resolved 1",
+        "",
+        "castepkit -C work dens run GaAs_Optics",
+        "castepkit-grid --help",
+        "-C work --profile missing config shg",
+        "inspect 'no such file.cst_ome'",
+        "shg --no_such_option",
+    ]
+    assert run_batch(lines) == 3
+    assert (tmp_path / "work" / "GaAs_Optics.chi123").is_file()
+    assert (tmp_path / "work" / "GaAs_Optics_veocc.grd").is_file()
+    err = capsys.readouterr().err
+    assert ":7: inspect 'no such file.cst_ome'" in err
+    assert "3 of 6 commands failed" in err
+    assert Path.cwd() == tmp_path and get_profile() is None
+
+    # A wrapper's own --profile does not leak into the following lines.
+    config.write_text(config.read_text() + "[profiles.big.cache]\nenabled = false\n")
+    run(["-C", "work", "shg", "GaAs_Optics", "--direction", "111", "--profile", "big"])
+    assert (tmp_path / "work" / "GaAs_Optics.chi111").is_file()
+    assert get_profile() is None
+
+    batch = tmp_path / "commands.txt"
+    batch.write_text("config shg\n")
+    main(["-C", "work", "--batch", str(batch)])
+    with pytest.raises(SystemExit):
+        run(["--batch", str(batch)])
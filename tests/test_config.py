@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import castepkit.config
+from castepkit.config import get_env_vars, get_nproc, load_config, set_profile, use_mpi
+
+CONFIG = """
+threads = 1
+
+[mpirun]
+enabled = true
+nproc = 8
+
+[shg.mpirun]
+nproc = 32
+
+[weighted_den]
+threads = 4
+mpirun = { enabled = false }
+
+[profiles.big.mpirun]
+nproc = 64
+
+[profiles.big.shg.mpirun]
+nproc = 128
+"""
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.toml"
+    path.write_text(CONFIG)
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", path)
+    monkeypatch.delenv("CASTEPKIT_PROFILE", raising=False)
+    yield path
+    set_profile(None)
+
+
+def test_per_executable_sections(config_file):
+    assert use_mpi("shg") and get_nproc("shg") == 32
+    assert not use_mpi("weighted_den")
+    assert get_nproc("ome") == 8
+    assert get_env_vars("weighted_den")["OMP_NUM_THREADS"] == "4"
+    assert get_env_vars("ome")["OMP_NUM_THREADS"] == "1"
+
+
+def test_profiles(config_file, monkeypatch):
+    set_profile("big")
+    assert get_nproc("shg") == 128
+    assert get_nproc("ome") == 64
+    set_profile(None)
+    monkeypatch.setenv("CASTEPKIT_PROFILE", "missing")
+    with pytest.raises(ValueError, match="Unknown profile"):
+        get_nproc()
+
+
+def test_reload_on_change(config_file):
+    first = load_config()
+    assert load_config() is first
+    config_file.write_text("[mpirun]\nnproc = 2\n")
+    st = config_file.stat()
+    os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert get_nproc("shg") == 2
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("[mpirun]\nnproc = 'many'\n", "mpirun.nproc"),
+        ("[mpirun]\nenabled = 1\n", "mpirun.enabled"),
+        ("[cache]\nsize = 3\n", "Unknown key 'size'"),
+        ("[shg]\nnproc = 3\n", "Unknown key 'nproc' in \\[shg\\]"),
+        ("[profiles.big.shg.mpirun]\nnproc = true\n", "profiles.big.shg.mpirun.nproc"),
+    ],
+)
+def test_validation(config_file, text, message):
+    config_file.write_text(text)
+    with pytest.raises(ValueError, match=message):
+        load_config()
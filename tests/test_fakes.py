@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from common import prepare_test_data
+
+import castepkit.cache
+import castepkit.config
+from castepkit.io.chi import read_chi
+from castepkit.io.grd import read_grd
+from castepkit.io.weights import read_weights
+from castepkit.pipeline import shg_pipeline
+from castepkit.testing import install_fakes
+from castepkit.utils import run_program
+from castepkit.wrappers.shg import run_shg
+from castepkit.wrappers.weighted_dens import run_weighted_den, run_weighted_den_batch
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+@pytest.fixture
+def fake_gaas(tmp_path, monkeypatch):
+    config = install_fakes(
+        tmp_path / "bin",
+        output_size="20KB",
+        config=f'[cache]\ndir = "{tmp_path / "cache"}"\n',
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    (tmp_path / "work").mkdir()
+    work = prepare_test_data(TEST_DATA, tmp_path / "work", prefix="GaAs_Optics")
+    for suffix in ("param", "switch", "orbitals"):
+        (work / f"GaAs_Optics.{suffix}").write_text(suffix)
+    monkeypatch.chdir(work)
+    return tmp_path
+
+
+def test_fake_shg_and_weighted_den(fake_gaas):
+    result = run_shg("GaAs_Optics", direction="123", band_resolved=1)
+    assert result.metrics.returncode == 0
+    chi = read_chi("GaAs_Optics.chi123")
+    assert chi.shape[1] == 3 and chi.nbytes > 0
+
+    # 18 electrons: 9 of the 26 bands are occupied at every k-point.
+    veocc = read_weights("GaAs_Optics.shg_weight_veocc")
+    assert veocc.shape == (1, 28, 26)
+    assert veocc[..., :9].all() and not veocc[..., 9:].any()
+
+    wden = run_weighted_den("GaAs_Optics", "GaAs_Optics.shg_weight_veocc", "veocc", 3)
+    assert wden.output_file == Path("GaAs_Optics_veocc.grd")
+    assert wden.metrics.returncode == 0 and wden.metrics.wall > 0
+    assert read_grd(wden).data.size > 1000
+
+    weights = {s: f"GaAs_Optics.shg_weight_{s}" for s in ("veocc", "veunocc")}
+    batch = run_weighted_den_batch("GaAs_Optics", weights, ncores=2)
+    assert [r.suffix for r in batch.values()] == ["veocc", "veunocc"]
+    assert all(r.metrics is not None and r.output_file.is_file() for r in batch.values())
+
+
+def test_weighted_den_scratch_removed(fake_gaas, monkeypatch):
+    def scratches():
+        return list(Path(".").glob(".GaAs_Optics.wden_veocc.*"))
+
+    def interrupted(**call):
+        assert Path(call["cwd"]).is_dir()
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(castepkit.cache, "run_cached", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            run_weighted_den("GaAs_Optics", "GaAs_Optics.bands", "veocc", 3)
+    assert scratches() == []
+
+    install_fakes(fake_gaas / "bin", programs={"weighted_den": {"returncode": 3}}, config=False)
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        run_weighted_den("GaAs_Optics", "GaAs_Optics.bands", "veocc", 3, cache=False)
+    assert scratches() == []
+
+
+def test_fake_pipeline(fake_gaas):
+    pipe = shg_pipeline("GaAs_Optics", directions=("123", "111"), atom_cutting=True, ome=True)
+    status = pipe.run()
+    assert set(status.values()) == {"done"}, status
+    assert Path("GaAs_Optics.cst_ome").stat().st_size > 0
+    assert set(pipe.run().values()) == {"skipped"}
+
+
+def test_fake_behaviour(fake_gaas, monkeypatch):
+    install_fakes(
+        fake_gaas / "bin", programs={"ome": {"memory": "50MB", "returncode": 4}}, config=False
+    )
+    out = run_program("ome", "orbitals\n", ["GaAs_Optics"])
+    assert out.metrics.returncode == 4 and "failing" in out[1]
+
+    monkeypatch.setenv("CASTEPKIT_FAKE_RETURNCODE", "0")
+    monkeypatch.setenv("CASTEPKIT_FAKE_CPU", "0.2")
+    out = run_program("ome", "orbitals\n", ["GaAs_Optics"])
+    assert out.metrics.returncode == 0
+    assert out.metrics.cpu >= 0.2
+    assert out.metrics.max_rss > 50 * 1024**2
+
+    out = run_program("ome", "orbitals_missing\n", ["GaAs_Optics"])
+    assert out.metrics.returncode == 2 and "GaAs_Optics.orbitals_missing" in out[1]
+    assert np.isfinite(out.metrics.wall)
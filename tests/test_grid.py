@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from castepkit.analysis.grid import (
+    compile_expression,
+    crop,
+    downsample,
+    evaluate,
+    integrate,
+    planar_average,
+    spherical_average,
+)
+from castepkit.io.grd import read_grd, write_grd
+
+CELL = [4.0, 5.0, 6.0, 90.0, 90.0, 90.0]
+
+
+@pytest.fixture
+def grids(tmp_path):
+    rng = np.random.default_rng(1)
+    a, b = rng.random((8, 6, 10)), rng.random((8, 6, 10))
+    write_grd(tmp_path / "a.grd", a, CELL)
+    write_grd(tmp_path / "b.grd", b, CELL)
+    return tmp_path, a, b
+
+
+def test_expression_whitelist():
+    func = compile_expression("where(a > 0.5, sqrt(a), -b) / 2", ["a", "b"])
+    a, b = np.array([0.25, 0.81]), np.array([1.0, 2.0])
+    np.testing.assert_allclose(func({"a": a, "b": b}), [-0.5, 0.45])
+    for bad in ["__import__('os')", "a.T", "c + 1", "a; b"]:
+        with pytest.raises(ValueError):
+            compile_expression(bad, ["a", "b"])
+
+
+def test_evaluate(grids):
+    tmp, a, b = grids
+    out = evaluate("a / (a + b)", {"a": tmp / "a.grd", "b": tmp / "b.grd"}, tmp / "r.grd", block=3)
+    np.testing.assert_allclose(read_grd(out).data, a / (a + b), rtol=1e-4)
+
+
+def test_evaluate_nonfinite(grids, capsys):
+    tmp, a, _ = grids
+    zero = np.zeros_like(a)
+    zero[0] = 1.0
+    write_grd(tmp / "z.grd", zero, CELL)
+    named = {"a": tmp / "a.grd", "z": tmp / "z.grd"}
+    data = read_grd(evaluate("a / z", named, tmp / "r.grd")).data
+    # Division by zero is not hidden as a plausible 0.
+    assert np.isinf(data[1:]).all() and np.isfinite(data[0]).all()
+    assert f"{a[1:].size} of {a.size} points" in capsys.readouterr().out
+
+    data = read_grd(evaluate("a / z", named, tmp / "r.grd", fill=-1.0)).data
+    np.testing.assert_allclose(data[0], a[0], rtol=1e-4)
+    assert (data[1:] == -1.0).all()
+    assert "set to -1" in capsys.readouterr().out
+    evaluate("a", named, tmp / "r.grd")
+    assert capsys.readouterr().out == ""
+
+
+def test_reductions(grids):
+    tmp, a, _ = grids
+    dv = 120.0 / a.size
+    assert integrate(tmp / "a.grd", block=3) == pytest.approx(a.sum() * dv, rel=1e-5)
+    box = (slice(2, 5), slice(None), slice(4, 9))
+    assert integrate(tmp / "a.grd", box=box) == pytest.approx(a[2:5, :, 4:9].sum() * dv, rel=1e-5)
+
+    for axis in range(3):
+        pos, avg = planar_average(tmp / "a.grd", axis=axis, block=4)
+        other = tuple(i for i in range(3) if i != axis)
+        np.testing.assert_allclose(avg, a.mean(axis=other), rtol=1e-5)
+    assert pos[1] == pytest.approx(0.6)
+
+    r, avg, cumulative = spherical_average(tmp / "a.grd", [0, 0, 0], rmax=10.0, nbins=100)
+    # A sphere larger than the cell holds every point exactly once.
+    assert cumulative[-1] == pytest.approx(a.sum() * dv, rel=1e-5)
+    assert avg[0] == pytest.approx(a[0, 0, 0], rel=1e-5)
+
+
+def test_downsample_crop(grids):
+    tmp, a, _ = grids
+    coarse = read_grd(downsample(tmp / "a.grd", 2, tmp / "c.grd"))
+    assert coarse.shape == (4, 3, 5)
+    np.testing.assert_allclose(
+        coarse.data, a.reshape(4, 2, 3, 2, 5, 2).mean(axis=(1, 3, 5)), rtol=1e-4
+    )
+
+    box = (slice(1, 5), slice(0, 3), slice(2, 7))
+    cut = read_grd(crop(tmp / "a.grd", box, tmp / "x.grd", block=3))
+    np.testing.assert_allclose(cut.data, a[1:5, 0:3, 2:7], rtol=1e-5)
+    np.testing.assert_allclose(cut.cell[:3], [2.0, 2.5, 3.0])
@@ -0,0 +1,293 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from castepkit.analysis.band_weights import (
+    band_selection,
+    energy_window,
+    expand_weights,
+    parse_indices,
+    write_band_weights,
+)
+from castepkit.analysis.grid import integrate
+from castepkit.io import grd
+from castepkit.io.bands import Bands
+from castepkit.io.chi import load_spectra, read_chi
+from castepkit.io.fortran import FortranFile, OrbitalsFile, check_ome, read_ome
+from castepkit.io.grd import read_grd, read_grd_header, write_grd
+from castepkit.io.weights import read_weights, write_weights
+from castepkit.testing import _write_shg_weights
+from castepkit.wrappers.shg import detect_is_metal
+
+GAAS_BANDS = Path(__file__).parent / "data" / "GaAs" / "GaAs_Optics.bands"
+
+# Two k-points, one band per spin channel filled with one electron each: a half metal.
+SPIN_BANDS = """Number of k-points     2
+Number of spin components 2
+Number of electrons    1.0   1.0
+Number of eigenvalues      2     2
+Fermi energies (in atomic units)     0.0  0.0
+Unit cell vectors
+    5.0 0.0 0.0
+    0.0 5.0 0.0
+    0.0 0.0 5.0
+K-point    2  0.5 0.0 0.0  0.5
+Spin component 1
+  -0.1
+   0.2
+Spin component 2
+  -0.2
+   0.1
+K-point    1  0.0 0.0 0.0  0.5
+Spin component 1
+   0.05
+   0.3
+Spin component 2
+  -0.3
+   0.0
+"""
+
+
+@pytest.fixture
+def grid_file(tmp_path):
+    data = np.random.default_rng(0).random((6, 5, 7))
+    path = tmp_path / "x_den.grd"
+    write_grd(path, data, [4.0, 5.0, 6.0, 90.0, 90.0, 90.0])
+    return path, data
+
+
+def test_grd_header(grid_file):
+    path, _ = grid_file
+    header = read_grd_header(path)
+    assert header["shape"] == (6, 5, 7)
+    np.testing.assert_allclose(np.diag(header["lattice"]), [4.0, 5.0, 6.0], atol=1e-12)
+
+
+def test_grd_sidecar(grid_file):
+    path, data = grid_file
+    grid = read_grd(path)
+    np.testing.assert_allclose(grid.data, data, rtol=1e-5)
+    assert grid.sidecar_path.is_file()
+    assert grid.voxel_volume == pytest.approx(120.0 / data.size)
+
+    again = read_grd(path)
+    assert again._sidecar_valid()
+    assert isinstance(again.data, np.memmap)
+    np.testing.assert_allclose(again.data, data, rtol=1e-5)
+
+    # A grid swapped in with an old mtime is not the one the sidecar was built from.
+    other = path.parent / "other.grd"
+    write_grd(other, data + 1.0, [4.0, 5.0, 6.0, 90.0, 90.0, 90.0])
+    os.utime(other, ns=(0, 0))
+    os.replace(other, path)
+    assert not read_grd(path)._sidecar_valid()
+    np.testing.assert_allclose(read_grd(path).data, data + 1.0, rtol=1e-5)
+
+
+def test_grd_periodic_endpoint(tmp_path):
+    # 5 x 4 x 6 intervals stored with the periodic endpoint: 6 x 5 x 7 points.
+    path = tmp_path / "end.grd"
+    write_grd(path, np.ones((6, 5, 7)), [4.0, 5.0, 6.0, 90.0, 90.0, 90.0])
+    lines = path.read_text().splitlines(keepends=True)
+    lines[3] = f"{5:6d}{4:6d}{6:6d}\n"
+    path.write_text("".join(lines))
+    grid = read_grd(path)
+    assert grid.shape == (6, 5, 7)
+    assert grid.voxel_volume == pytest.approx(120.0 / 120)
+    assert integrate(grid) == pytest.approx(120.0)
+
+
+def test_grd_stream_slabs(grid_file, monkeypatch):
+    path, data = grid_file
+    # Tiny chunks exercise numbers split across chunk boundaries.
+    monkeypatch.setattr(grd, "CHUNK_SIZE", 37)
+    slabs = list(read_grd(path, sidecar=False).iter_z_slabs(3))
+    assert [z0 for z0, _ in slabs] == [0, 3, 6]
+    assert slabs[-1][1].shape == (6, 5, 1)
+    np.testing.assert_allclose(np.concatenate([s for _, s in slabs], axis=2), data, rtol=1e-5)
+    assert not path.with_name(path.name + ".npy").exists()
+
+
+def test_grd_truncated(grid_file):
+    path, _ = grid_file
+    path.write_text("\n".join(path.read_text().splitlines()[:-3]) + "\n")
+    with pytest.raises(ValueError, match="expected"):
+        read_grd(path, sidecar=False).data
+
+
+CHI_TEXT = """ # SHG susceptibility chi(2)_123
+ # Energy(eV)   Re   Im   |chi|
+  0.00  1.0E-01  0.0  1.0E-01
+  0.01  1.1E-01  2.0E-03  1.1E-01
+  0.02  1.2E-01  4.0E-03  1.2E-01
+"""
+
+
+def test_read_chi_sidecar(tmp_path):
+    path = tmp_path / "X.chi123"
+    path.write_text(CHI_TEXT)
+    data = read_chi(path)
+    assert data.shape == (3, 4)
+    np.testing.assert_allclose(data[:, 2], [0.0, 2e-3, 4e-3])
+    assert path.with_name("X.chi123.npy").is_file()
+    np.testing.assert_array_equal(read_chi(path), data)
+
+    # Comment lines inside the table fall back to line-by-line parsing.
+    path.write_text(CHI_TEXT.replace("  0.01", " # gap\n  0.01"))
+    np.testing.assert_array_equal(read_chi(path, cache=False), data)
+
+    # A file swapped in with an old mtime, like a hardlink restored from the cache, is
+    # not the file the sidecar was built from.
+    other = tmp_path / "other"
+    other.write_text(CHI_TEXT.replace("2.0E-03", "9.0E-03"))
+    os.utime(other, ns=(0, 0))
+    os.replace(other, path)
+    assert read_chi(path)[1, 2] == pytest.approx(9e-3)
+
+
+def test_load_spectra(tmp_path):
+    for d in ("111", "123"):
+        (tmp_path / "run" / d).mkdir(parents=True)
+        (tmp_path / "run" / d / f"X.chi{d}").write_text(CHI_TEXT)
+    (tmp_path / "X.chi_tensor.npz").write_text("")
+    spectra = load_spectra(tmp_path, max_workers=2)
+    assert [s.direction for s in spectra.values()] == ["111", "123"]
+    np.testing.assert_allclose(spectra[tmp_path / "run/123/X.chi123"].abs, [0.1, 0.11, 0.12])
+
+
+def test_bands_reader(tmp_path):
+    path = tmp_path / GAAS_BANDS.name
+    shutil.copy(GAAS_BANDS, path)
+    bands = Bands(path)
+    assert bands.eigenvalues.shape == (1, 28, 26)
+    assert bands.weights.sum() == pytest.approx(1.0)
+    assert bands.eigenvalues[0, 0, 0] == pytest.approx(-0.58611867 * 27.211386245988)
+    assert path.with_name(path.name + ".npy").is_file()
+    np.testing.assert_array_equal(Bands(path).eigenvalues, bands.eigenvalues)
+
+    # A copy with a preserved, older mtime (cp -p, rsync) replacing the file.
+    copy = tmp_path / "copy.bands"
+    copy.write_text(GAAS_BANDS.read_text().replace("-0.58611867", "-0.48611867", 1))
+    os.utime(copy, ns=(0, 0))
+    os.replace(copy, path)
+    assert Bands(path).eigenvalues[0, 0, 0] == pytest.approx(-0.48611867 * 27.211386245988)
+    shutil.copy(GAAS_BANDS, path)
+
+    # 18 electrons fill 9 bands; GaAs has its valence band maximum at the k-point nearest Gamma.
+    gap = bands.band_gap()
+    assert not gap.is_metal and gap.k_vbm == gap.k_direct
+    assert gap.gap == pytest.approx(1.3336, abs=1e-3)
+    assert detect_is_metal(path) == 2
+
+    for shape in ("gaussian", "lorentzian"):
+        energies, dos = bands.dos(sigma=0.1, shape=shape, npoints=4001)
+        total = np.trapezoid(dos.sum(0), energies)
+        assert total == pytest.approx(52, rel=0.01 if shape == "gaussian" else 0.05)
+
+
+def test_bands_spin_polarized(tmp_path):
+    path = tmp_path / "X.bands"
+    path.write_text(SPIN_BANDS)
+    bands = Bands(path, cache=False)
+    np.testing.assert_allclose(bands.kpoints[:, 0], [0.0, 0.5])
+    np.testing.assert_allclose(bands.eigenvalues[1, :, 0] / 27.211386245988, [-0.3, -0.2])
+    gap = bands.band_gap()
+    # The occupied spin-up band at the first k-point lies above the empty spin-down band.
+    assert gap.is_metal and gap.vbm > gap.cbm
+    energies, dos = bands.dos(sigma=0.05)
+    assert dos.shape == (2, energies.size)
+    assert np.trapezoid(dos.sum(0), energies) == pytest.approx(4, rel=0.01)
+
+    path.write_text(SPIN_BANDS.replace("   0.3\n", ""))
+    with pytest.raises(ValueError, match="expected 2 k-points"):
+        Bands(path, cache=False).eigenvalues
+
+
+def test_band_weights(tmp_path, monkeypatch):
+    shutil.copy(GAAS_BANDS, tmp_path / "GaAs.bands")
+    monkeypatch.chdir(tmp_path)
+    bands = Bands("GaAs.bands")
+
+    window = energy_window(bands, -1.0, 0.0, "vbm")
+    assert window[0, bands.band_gap().k_vbm, 8] == 1
+    assert not window[..., 9:].any()
+    occupied = band_selection(bands, "occupied")
+    assert occupied.sum() == 28 * 9
+    picked = band_selection(bands, parse_indices("5-9"), kpoints=[1, 3])
+    assert picked.sum() == 10 and picked[0, 2, 4] == 1
+
+    custom = np.linspace(0, 1, 26)
+    path = write_band_weights("GaAs", "custom", custom * window, bands)
+    np.testing.assert_allclose(read_weights(path), custom * window, atol=1e-8)
+    with pytest.raises(ValueError, match="Cannot use weights"):
+        expand_weights(bands, np.ones(5))
+
+
+def test_weights_follow_bands_order(tmp_path):
+    # GaAs_Optics.bands lists the k-points as 1 3 5 ... 27 2 4 ... 28.
+    bands = Bands(GAAS_BANDS, cache=False)
+    assert bands.kpoint_indices.tolist() == list(range(1, 29))
+    assert bands.kpoint_indices[bands.file_order][:3].tolist() == [1, 3, 5]
+    occupied = band_selection(bands, "occupied")
+    write_weights(tmp_path / "ours", bands, occupied)
+    _write_shg_weights(GAAS_BANDS, tmp_path / "theirs", True)
+    assert (tmp_path / "ours").read_text() == (tmp_path / "theirs").read_text()
+    np.testing.assert_array_equal(read_weights(tmp_path / "ours"), occupied)
+
+
+def _write_records(path, records, endian=">"):
+    with open(path, "wb") as f:
+        for record in records:
+            payload = np.asarray(record).astype(np.asarray(record).dtype.newbyteorder(endian))
+            marker = np.array([payload.nbytes], dtype=f"{endian}i4").tobytes()
+            f.write(marker + payload.tobytes() + marker)
+
+
+def test_ome_reader(tmp_path):
+    for suffix in ("ome_bin", "bands"):
+        shutil.copy(GAAS_BANDS.with_suffix(f".{suffix}"), tmp_path)
+    path = tmp_path / "GaAs_Optics.ome_bin"
+    ome = read_ome(path)
+    assert ome.endian == ">" and ome.version == 1.0
+    assert ome.header.startswith("Generated by CASTEP")
+    elements = ome.elements
+    assert elements.shape == (28, 1, 3, 26, 26)
+    assert np.shares_memory(elements, ome._buffer)
+    # Each Cartesian component is Hermitian in the band indices.
+    np.testing.assert_allclose(elements[5, 0], elements[5, 0].conj().swapaxes(-1, -2))
+
+    assert path.with_name(path.name + ".idx.npy").is_file()
+    np.testing.assert_array_equal(read_ome(path).index, ome.index)
+    check_ome(path, tmp_path / "GaAs_Optics.bands")
+    (tmp_path / "X.bands").write_text(SPIN_BANDS)
+    with pytest.raises(ValueError, match="holds 14 k-points x 26 bands but .* has 2 x 2"):
+        check_ome(path, tmp_path / "X.bands")
+
+    truncated = tmp_path / "cut.cst_ome"
+    truncated.write_bytes(path.read_bytes()[:-100])
+    with pytest.raises(ValueError, match="not a Fortran unformatted"):
+        FortranFile(truncated).index
+
+
+def test_orbitals_reader(tmp_path):
+    path = tmp_path / "X.orbitals"
+    rng = np.random.default_rng(0)
+    coeffs, records = [], [np.array([1.0]), np.array([b"header"])]
+    for k, npw in enumerate([5, 7]):
+        c = rng.random((2, 2, npw)) + 1j * rng.random((2, 2, npw))
+        coeffs.append(c)
+        records += [np.array([0.25 * k, 0.0, 0.5]), np.array([npw], dtype=np.int32)]
+        records += [np.arange(3 * npw, dtype=np.int32)] + list(c.reshape(4, npw))
+    _write_records(path, records, endian="<")
+
+    orbitals = OrbitalsFile(path, nbands=2, nspins=2)
+    assert orbitals.endian == "<" and orbitals.nkpts == 2
+    assert [orbitals.nplanewaves(k) for k in range(2)] == [5, 7]
+    np.testing.assert_array_equal(orbitals.kpoint(1), [0.25, 0.0, 0.5])
+    np.testing.assert_array_equal(orbitals.coefficients(1), coeffs[1])
+    np.testing.assert_array_equal(orbitals.coefficients(0, spin=1, bands=0), coeffs[0][1, 0])
+    with pytest.raises(ValueError, match="No coefficients"):
+        OrbitalsFile(path, nbands=3, nspins=2).nkpts
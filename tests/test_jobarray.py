@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+from common import prepare_test_data
+
+from castepkit.campaign import Job
+from castepkit.jobarray import (
+    _input_files,
+    collect,
+    direction_jobs,
+    load_array,
+    sweep_jobs,
+    write_array,
+)
+from castepkit.testing import install_fakes, install_scheduler_stub
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+def test_packing(tmp_path):
+    jobs = [Job(str(tmp_path), "X", "shg", {"direction": d}) for d in "123456"] + [
+        Job(str(tmp_path), "X", "dens", {"ncores": 2})
+    ]
+    submit = write_array(
+        jobs, tmp_path / "arr", node_cores=8, task_cores=3, directives=["--time=01:00:00"]
+    )
+    spec = load_array(submit.parent)
+    # Two jobs of three cores fit on an eight-core node.
+    assert spec["count"] == 4 and [t["bundle"] for t in spec["tasks"]] == [0, 0, 1, 1, 2, 2, 3]
+    assert spec["tasks"][0]["params"] == {"direction": "1", "nproc": 3}
+    assert spec["tasks"][-1]["params"] == {"ncores": 2}
+    script = (tmp_path / "arr" / "array.sbatch").read_text()
+    assert "#SBATCH --array=0-3" in script and "#SBATCH --ntasks=6" in script
+    assert "#SBATCH --time=01:00:00" in script and "array run" in script
+    assert "afterany" in submit.read_text()
+
+    write_array(jobs[:1], tmp_path / "pbs", scheduler="pbs", node_cores=4)
+    script = (tmp_path / "pbs" / "array.pbs").read_text()
+    assert "#PBS -J" not in script and "select=1:ncpus=4" in script
+    with pytest.raises(ValueError, match="Unknown scheduler"):
+        write_array(jobs, tmp_path / "arr", scheduler="lsf")
+
+
+def test_pipeline_outputs_not_linked(tmp_path):
+    for suffix in ("cell", "orbitals", "castep_bin", "cutatom_check", "cst_ome"):
+        (tmp_path / f"X.{suffix}").write_text("")
+    task = {"dir": str(tmp_path), "prefix": "X", "task": "pipeline", "params": {}}
+    linked = {f.suffix for f in _input_files(task) if f.is_file()}
+    assert linked == {".cell", ".orbitals", ".castep_bin", ".cutatom_check", ".cst_ome"}
+    # Files the pipeline's own steps write would be overwritten through the links.
+    task["params"] = {"atom_cutting": True, "ome": True}
+    assert {f.suffix for f in _input_files(task) if f.is_file()} == {".cell", ".orbitals"}
+
+
+def test_submit_with_stub(tmp_path, monkeypatch):
+    # Child processes read the config from the default location.
+    install_fakes(
+        tmp_path / "xdg" / "castepkit",
+        config="[cache]\nenabled = false\n[queue]\nenabled = false\n",
+    )
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+    stub = install_scheduler_stub(tmp_path / "bin", workers=2)
+    monkeypatch.setenv("PATH", f"{stub.parent}{os.pathsep}{os.environ['PATH']}")
+    work = tmp_path / "work"
+    work.mkdir()
+    prepare_test_data(TEST_DATA, work, prefix="GaAs_Optics")
+    # The log of the SCF run; every fake SHG run writes a .castep of its own.
+    (work / "GaAs_Optics.castep").write_text("SCF log\n")
+
+    jobs, sweep = sweep_jobs("GaAs_Optics", {"scissors": [0.0, 0.5, 1.0]}, directory=work)
+    jobs += direction_jobs("GaAs_Optics", ["111"], directory=work)
+    submit = write_array(jobs, tmp_path / "arr", node_cores=2, task_cores=1, sweep=sweep)
+    out = subprocess.run(["bash", str(submit)], capture_output=True, text=True, check=True)
+    assert "Submitted array job 1000 (2 tasks) and collector 1001" in out.stdout
+
+    # Each job ran in its own directory; the inputs are links, not copies.
+    assert sorted(p.name for p in (tmp_path / "arr" / "tasks").iterdir()) == [
+        "0000",
+        "0001",
+        "0002",
+        "0003",
+    ]
+    assert (tmp_path / "arr" / "tasks" / "0000" / "GaAs_Optics.bands").is_symlink()
+    summary = json.loads((tmp_path / "arr" / "collect.json").read_text())
+    assert summary["done"] == 4 and summary["failed"] == summary["missing"] == 0
+    sweep_file = work / "GaAs_Optics.sweep_123.npz"
+    sweep = np.load(sweep_file)
+    assert sweep["chi"].shape[0] == 3 and list(sweep["scissors"]) == [0.0, 0.5, 1.0]
+    assert (work / "GaAs_Optics.chi111").is_file()
+    assert (work / "GaAs_Optics.castep").read_text() == "SCF log\n"
+    assert (tmp_path / "arr" / "tasks" / "0003" / "GaAs_Optics.castep").is_file()
+    assert summary["outputs"] == [str(work / "GaAs_Optics.chi111"), str(sweep_file)]
+    # Collecting again never replaces the results already in the calculation directory.
+    (tmp_path / "arr" / "tasks" / "0003" / "GaAs_Optics.chi111").write_text("rerun")
+    assert collect(tmp_path / "arr")["outputs"] == [str(sweep_file)]
+    assert (work / "GaAs_Optics.chi111").read_text() != "rerun"
+    assert not (work / "GaAs_Optics.chi123").exists()
+    assert list((tmp_path / "arr" / "logs").glob("castepkit_1000_*.out"))
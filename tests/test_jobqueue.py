@@ -0,0 +1,133 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import castepkit.config
+import castepkit.jobqueue
+from castepkit.jobqueue import (
+    Job,
+    QueueServer,
+    format_cores,
+    parse_cores,
+    queue_status,
+    stop_daemon,
+)
+from castepkit.utils import arun_program, run_program
+
+
+def test_cores():
+    assert parse_cores("0-3, 8,10-11") == [0, 1, 2, 3, 8, 10, 11]
+    assert format_cores([11, 0, 1, 2, 3, 8, 10]) == "0-3,8,10-11"
+    assert len(parse_cores(1)) == 1 and parse_cores() == parse_cores(len(parse_cores()))
+
+
+def test_fair_share(tmp_path):
+    server = QueueServer(tmp_path / "queue.sock", cores="0-3")
+    jobs = {}
+    for name, user in [("a1", "alice"), ("a2", "alice"), ("a3", "alice"), ("b1", "bob")]:
+        jobs[name] = Job(len(jobs) + 1, user, "shg", 2, estimate=60.0)
+        server.submit(jobs[name])
+    assert [job.cores for job in server.running.values()] == [[0, 1], [2, 3]]
+
+    # bob has no cores in use, so he goes before alice's third job.
+    order = server.forecast()
+    assert [job for job, _ in order] == [jobs["b1"], jobs["a3"]]
+    assert all(eta == pytest.approx(60, abs=1) for _, eta in order)
+
+    server.finish(jobs["a1"])
+    assert jobs["b1"].cores == [0, 1] and server.queued == [jobs["a3"]]
+    server.finish(jobs["a3"])  # withdrawn while queued
+    big = Job(5, "alice", "shg", 16)
+    server.submit(big)
+    assert big.ncores == 4 and server.queued == [big]
+    assert server.status()["queued"][0]["eta"] == pytest.approx(60, abs=1)
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """A one-core queue daemon in a thread, and a config pointing at it."""
+    script = tmp_path / "affinity"
+    script.write_text(
+        f"#!{sys.executable}\nimport os, time\ntime.sleep(0.3)\n"
+        "print(sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else '')\n"
+    )
+    script.chmod(0o755)
+    socket_path = tmp_path / "queue.sock"
+    config = tmp_path / "config.toml"
+    config.write_text(
+        f'[executables]\naffinity = "{script}"\n[queue]\nenabled = true\nsocket = "{socket_path}"\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+
+    server = QueueServer(socket_path, cores=1)
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(ready.set),), daemon=True)
+    thread.start()
+    assert ready.wait(10)
+    yield server
+    stop_daemon(socket_path)
+    thread.join(10)
+
+
+def test_daemon_runs(daemon, capsys):
+    start = time.monotonic()
+    with ThreadPoolExecutor(2) as pool:
+        outputs = list(pool.map(lambda _: run_program("affinity", ""), range(2)))
+    # One core: the two runs take turns, each pinned to the daemon's core.
+    assert time.monotonic() - start > 0.6
+    if hasattr(os, "sched_getaffinity"):
+        assert {out[0].strip() for out in outputs} == {str(daemon.cores)}
+    out = capsys.readouterr().out
+    assert "affinity (1 cores) queued at position 1" in out
+    assert daemon.history["affinity"][0] == 2
+
+    out = asyncio.run(arun_program("affinity", ""))
+    assert out.metrics.returncode == 0
+    status = queue_status(daemon.socket_path)
+    assert status["running"] == [] and status["free"] == daemon.cores
+
+    # Without a daemon the programs run directly.
+    assert stop_daemon(daemon.socket_path)
+    for _ in range(100):
+        if not daemon.socket_path.exists():
+            break
+        time.sleep(0.05)
+    assert queue_status(daemon.socket_path) is None
+    assert run_program("affinity", "").metrics.returncode == 0
+
+
+def test_untrusted_daemon(daemon, monkeypatch, capsys):
+    # A daemon squatting the socket as another user is not asked for cores.
+    with monkeypatch.context() as m:
+        m.setattr(castepkit.jobqueue, "_peer_uid", lambda sock: 4242)
+        assert run_program("affinity", "").metrics.returncode == 0
+    assert "runs as another user" in capsys.readouterr().out
+    assert daemon.history == {}
+    assert castepkit.jobqueue._trusted(4242, daemon.socket_path, owner="4242")
+
+
+def test_bad_grants(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "silent.sock"
+    config = tmp_path / "config.toml"
+    config.write_text(f'[queue]\nenabled = true\nsocket = "{path}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    monkeypatch.setattr(castepkit.jobqueue, "ACK_TIMEOUT", 0.2)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(path))
+        server.listen()
+        # Accepts connections but never answers.
+        with castepkit.jobqueue.lease("shg", 1) as cores:
+            assert cores is None
+        assert "no grant from the queue daemon" in capsys.readouterr().out
+
+    assert castepkit.jobqueue._check_grant([0, 0]) is not None
+    assert castepkit.jobqueue._check_grant(["0"]) is not None
+    if hasattr(os, "sched_getaffinity"):
+        assert "outside the affinity" in castepkit.jobqueue._check_grant([10**6])
+        assert castepkit.jobqueue._check_grant(sorted(os.sched_getaffinity(0))) is None
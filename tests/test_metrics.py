@@ -0,0 +1,41 @@
+import pytest
+
+import castepkit.config
+from castepkit.cache import run_cached
+from castepkit.metrics import load_metrics, record, summarize
+from castepkit.utils import RunMetrics
+
+
+@pytest.mark.parametrize("name", ["metrics.jsonl", "metrics.csv"])
+def test_record_roundtrip(tmp_path, name):
+    path = tmp_path / name
+    record(RunMetrics("shg", wall=2.0, user=3.0, nproc=2, params="0.5\n123\n"), path)
+    record(RunMetrics("shg", wall=4.0, user=7.0, nproc=2, params="0.5\n123\n", max_rss=10), path)
+    record(RunMetrics("shg", wall=0.1, params="0.5\n123\n", cached=True), path)
+    record(RunMetrics("ome", wall=1.0, user=1.0, input_bytes={"x.cell": 5}), path)
+    records = load_metrics(path)
+    assert len(records) == 4 and records[3]["input_bytes"] == {"x.cell": 5}
+
+    shg, ome = summarize(records)
+    assert (shg["runs"], shg["cached"], shg["wall_mean"], shg["rss_max"]) == (2, 1, 3.0, 10)
+    assert shg["efficiency"] == pytest.approx(10.0 / 12.0)
+    assert ome["input_bytes"] == 5
+
+
+def test_run_cached_records(tmp_path, monkeypatch):
+    exe = tmp_path / "fake.sh"
+    exe.write_text("#!/bin/sh\nread value\necho $value > out.txt\n")
+    exe.chmod(0o755)
+    config = tmp_path / "config.toml"
+    config.write_text(
+        f'[executables]\nfake = "{exe}"\n\n[metrics]\nenabled = true\n'
+        f'file = "{tmp_path / "m.jsonl"}"\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "x.in").write_text("12345")
+
+    output = run_cached("fake", "1\n", inputs=["x.in"])
+    assert output.metrics.input_bytes == {"x.in": 5}
+    (rec,) = load_metrics()
+    assert rec["prog"] == "fake" and rec["returncode"] == 0 and not rec["cached"]
@@ -0,0 +1,46 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from castepkit.analysis.optics import dielectric, kramers_kronig
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+@pytest.fixture
+def gaas(tmp_path, monkeypatch):
+    for suffix in ("bands", "cell", "ome_bin"):
+        shutil.copy(TEST_DATA / f"GaAs_Optics.{suffix}", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return "GaAs_Optics"
+
+
+def test_kramers_kronig_lorentz_oscillator():
+    energies = np.linspace(0, 100, 4001)
+    eps = 1 + 10.0 / (3.0**2 - energies**2 - 0.5j * energies)
+    eps1 = kramers_kronig(energies, eps.imag)
+    window = energies < 10
+    np.testing.assert_allclose(eps1[window], eps.real[window], atol=0.02)
+
+
+def test_dielectric_gaas(gaas):
+    result = dielectric(gaas, emax=30, npoints=3001)
+    # Cubic: isotropic once averaged over the point group, and eps_inf near the LDA value.
+    assert result.eps_inf == pytest.approx(12.36, abs=0.05)
+    np.testing.assert_allclose(result.eps2, result.eps2[:, :1, :1] * np.eye(3), atol=1e-8)
+    assert 4.0 < result.energies[np.argmax(result.average.imag)] < 5.0
+    assert np.all(result.absorption[result.energies < 1.0] < 1.0)
+
+    # Chunking over k-points does not change the result.
+    chunked = dielectric(gaas, emax=30, npoints=3001, max_memory=20000)
+    np.testing.assert_allclose(chunked.eps2, result.eps2, atol=1e-10)
+
+    # The scissors operator shifts eps2 rigidly and lowers eps_inf.
+    shifted = dielectric(gaas, scissors=0.5, emax=30, npoints=3001)
+    np.testing.assert_allclose(shifted.eps2[50:2500], result.eps2[:2450], atol=1e-6)
+    assert shifted.eps_inf < result.eps_inf
+
+    table = np.loadtxt(result.save("GaAs_Optics.eps"))
+    assert table.shape == (3001, 7)
@@ -0,0 +1,120 @@
+import time
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from castepkit.pipeline import Pipeline
+
+
+def _copy(src, dst, calls, delay=0.0, fail=False):
+    calls.append(dst)
+    time.sleep(delay)
+    if fail:
+        raise RuntimeError("step failed")
+    Path(dst).write_text(Path(src).read_text() + dst + "\n")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path("a.txt").write_text("a\n")
+    return tmp_path
+
+
+def _diamond(calls, check="mtime", fail_c=False):
+    pipe = Pipeline(state_file="state.json", check=check)
+    pipe.add(
+        "b",
+        _copy,
+        inputs=["a.txt"],
+        outputs=["b.txt"],
+        src="a.txt",
+        dst="b.txt",
+        calls=calls,
+        delay=0.2,
+    )
+    pipe.add(
+        "c",
+        _copy,
+        inputs=["a.txt"],
+        outputs=["c.txt"],
+        src="a.txt",
+        dst="c.txt",
+        calls=calls,
+        delay=0.2,
+        fail=fail_c,
+    )
+    pipe.add(
+        "d",
+        _copy,
+        inputs=["b.txt", "c.txt"],
+        outputs=["d.txt"],
+        src="b.txt",
+        dst="d.txt",
+        calls=calls,
+    )
+    return pipe
+
+
+def test_order_and_cycles():
+    pipe = _diamond([])
+    order = pipe.order()
+    assert order.index("d") > order.index("b") and order.index("d") > order.index("c")
+    pipe.add("e", _copy, inputs=["f.txt"], outputs=["e.txt"])
+    pipe.add("f", _copy, inputs=["e.txt"], outputs=["f.txt"])
+    with pytest.raises(ValueError, match="Cycle"):
+        pipe.order()
+
+
+def test_parallel_and_skip(workdir):
+    calls = []
+    start = time.time()
+    status = _diamond(calls).run()
+    # b and c are independent and run concurrently.
+    assert time.time() - start < 0.35
+    assert status == {"b": "done", "c": "done", "d": "done"}
+
+    calls.clear()
+    assert set(_diamond(calls).run().values()) == {"skipped"}
+    assert calls == []
+
+    time.sleep(0.01)
+    Path("a.txt").write_text("changed\n")
+    assert _diamond(calls).run()["d"] == "done"
+
+
+def test_resume_after_failure(workdir):
+    calls = []
+    status = _diamond(calls, fail_c=True).run()
+    assert status == {"b": "done", "c": "failed", "d": "blocked"}
+
+    calls.clear()
+    status = _diamond(calls).run()
+    assert status == {"b": "skipped", "c": "done", "d": "done"}
+    assert sorted(calls) == ["c.txt", "d.txt"]
+
+
+def test_hash_mode_and_locks(workdir):
+    calls = []
+    pipe = Pipeline(state_file="state.json", check="hash")
+    for name in ("x", "y"):
+        pipe.add(
+            name,
+            partial(_copy, calls=calls, delay=0.2),
+            inputs=["a.txt"],
+            outputs=[f"{name}.txt"],
+            locks=["shared"],
+            src="a.txt",
+            dst=f"{name}.txt",
+        )
+    start = time.time()
+    pipe.run()
+    # Steps holding the same lock are serialized.
+    assert time.time() - start >= 0.4
+
+    # Touching an input does not invalidate hash-checked steps, changing it does.
+    Path("a.txt").touch()
+    assert set(pipe.run().values()) == {"skipped"}
+    Path("a.txt").write_text("changed\n")
+    assert set(pipe.run().values()) == {"done"}
@@ -0,0 +1,89 @@
+import asyncio
+import stat
+
+import numpy as np
+import pytest
+
+import castepkit.config
+from castepkit.wrappers.shg import (
+    ShgResult,
+    arun_shg,
+    parse_values,
+    run_shg,
+    run_shg_batch,
+    run_shg_sweep,
+)
+
+# Writes a 4-point spectrum whose real part is the scissors value read from stdin.
+FAKE_SHG = """#!/bin/sh
+read scissors
+read direction
+out="$1.chi$direction"
+printf '# SHG spectrum\\n#  E   Re   Im   Abs\\n' > "$out"
+for e in 0.0 0.5 1.0 1.5; do echo "$e $scissors 2.0 3.0" >> "$out"; done
+echo "done $direction"
+"""
+
+
+@pytest.fixture
+def shg_setup(tmp_path, monkeypatch):
+    exe = tmp_path / "fake_shg.sh"
+    exe.write_text(FAKE_SHG)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\nshg = "{exe}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    for suffix in ("bands", "cell"):
+        (workdir / f"X.{suffix}").write_text("")
+    monkeypatch.chdir(workdir)
+    return workdir
+
+
+def test_run_shg_result(shg_setup):
+    result = run_shg("X", scissors=0.5, direction="123")
+    assert isinstance(result, ShgResult)
+    assert result.stdout.strip() == "done 123"
+    np.testing.assert_allclose(result.spectrum.energy, [0.0, 0.5, 1.0, 1.5])
+    np.testing.assert_allclose(result.spectrum.chi, 0.5 + 2.0j)
+    assert (shg_setup / "X.chi123.npy").is_file()
+
+
+def test_run_shg_batch_results(shg_setup):
+    results = run_shg_batch("X", ["111", "123"], ncores=2)
+    assert set(results) == {"111", "123"}
+    assert str(results["111"].spectrum_file) == "X.chi111"
+    assert results["111"].workdir.name == "111"
+    np.testing.assert_allclose(results["123"].spectrum.abs, 3.0)
+
+
+def test_parse_values():
+    assert parse_values("0:1.5:0.1") == pytest.approx(np.arange(16) / 10)
+    assert parse_values("1,2", int) == [1, 2]
+    with pytest.raises(ValueError):
+        parse_values("1:0:0.1")
+
+
+def test_run_shg_sweep(shg_setup, tmp_path):
+    with open(tmp_path / "config.toml", "a") as f:
+        f.write(f'\n[cache]\ndir = "{tmp_path / "cache"}"\n')
+    sweep = run_shg_sweep("X", {"scissors": [0.0, 0.5], "energy_range": [0, 1]}, ncores=2)
+    assert sweep.chi.shape == (2, 2, 4)
+    np.testing.assert_allclose(sweep.chi.real[:, 0, 0], [0.0, 0.5])
+    assert (shg_setup / "X.shg_runs/sweep_123/scissors=0.5,energy_range=1/X.chi123").is_file()
+    assert np.load("X.sweep_123.npz")["scissors"].tolist() == [0.0, 0.5]
+
+    # Extending the sweep reuses the cached points.
+    sweep = run_shg_sweep("X", {"scissors": [0.0, 0.5, 1.0], "energy_range": [0, 1]})
+    assert sweep.chi.shape == (3, 2, 4)
+    assert len(list((tmp_path / "cache").glob("*/*/meta.json"))) == 6
+
+
+def test_arun_shg(shg_setup):
+    async def run_all():
+        return await asyncio.gather(*(arun_shg("X", direction=d) for d in ("111", "123", "333")))
+
+    results = asyncio.run(run_all())
+    assert [r.direction for r in results] == ["111", "123", "333"]
+    assert all(isinstance(r, ShgResult) and r.spectrum.energy.size == 4 for r in results)
@@ -0,0 +1,84 @@
+import stat
+from pathlib import Path
+
+import pytest
+
+import castepkit.config
+from castepkit.utils import move_outputs, split_cores
+from castepkit.wrappers.shg import run_shg_batch
+
+# Reads the direction from stdin and, like the real program, writes the spectrum next to
+# a .castep log and weight file with fixed names; fails if another run's log is present.
+FAKE_SHG = """#!/bin/sh
+read scissors
+read direction
+test -f "$1.cell" || exit 3
+test -f "$1.castep" && exit 4
+echo "$direction" > "$1.castep"
+echo "$direction" > "$1.weight"
+pwd > "$1.chi$direction"
+"""
+
+
+@pytest.fixture
+def shg_dir(tmp_path, monkeypatch):
+    exe = tmp_path / "fake_shg.sh"
+    exe.write_text(FAKE_SHG)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\nshg = "{exe}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    work = tmp_path / "work"
+    work.mkdir()
+    for suffix in ("bands", "cell", "param"):
+        (work / f"GaAs.{suffix}").write_text(suffix)
+    monkeypatch.chdir(work)
+    return work
+
+
+def test_batch_runs_isolated(shg_dir):
+    directions = ["111", "123", "333"]
+    run_shg_batch("GaAs", directions + ["123"], ncores=2)
+    for d in directions:
+        run_dir = shg_dir / "GaAs.shg_runs" / d
+        # The spectrum is moved back; the log and weights stay with their own run.
+        assert (shg_dir / f"GaAs.chi{d}").read_text().strip() == str(run_dir.resolve())
+        assert not (run_dir / f"GaAs.chi{d}").exists()
+        assert (run_dir / "GaAs.castep").read_text().strip() == d
+        assert (run_dir / "GaAs.weight").read_text().strip() == d
+        assert (run_dir / "GaAs.cell").is_symlink()
+    assert not (shg_dir / "GaAs.castep").exists()
+    assert not (shg_dir / "GaAs.weight").exists()
+
+
+@pytest.mark.parametrize(
+    "ncores, njobs, max_workers, expected",
+    [
+        (8, 3, None, (3, 2)),
+        (8, 8, None, (8, 1)),
+        (2, 5, None, (2, 1)),
+        (8, 4, 2, (2, 4)),
+        (1, 0, None, (1, 1)),
+    ],
+)
+def test_split_cores(ncores, njobs, max_workers, expected):
+    assert split_cores(ncores, njobs, max_workers) == expected
+
+
+def test_move_outputs(tmp_path):
+    run_dir, dest = tmp_path / "run", tmp_path / "dest"
+    run_dir.mkdir()
+    dest.mkdir()
+    (run_dir / "a.chi123").write_text("new")
+    (dest / "a.chi123").write_text("old")
+    (tmp_path / "input").write_text("input")
+    (run_dir / "a.cell").symlink_to(tmp_path / "input")
+
+    moved = move_outputs(["a.chi123", "a.cell", "a.missing"], run_dir, dest)
+    assert moved == [dest / "a.chi123"]
+    assert (dest / "a.chi123").read_text() == "new"
+    assert not (run_dir / "a.chi123").exists()
+    # Linked inputs are never moved.
+    assert (run_dir / "a.cell").is_symlink()
+    assert not (dest / "a.cell").exists()
+    assert [p.name for p in Path(run_dir).iterdir()] == ["a.cell"]
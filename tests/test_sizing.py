@@ -0,0 +1,96 @@
+import os
+import shutil
+import stat
+from pathlib import Path
+
+import pytest
+
+import castepkit.config
+from castepkit.config import validate_config
+from castepkit.io.bands import read_bands_header
+from castepkit.sizing import _grid_points, _read_param, plan_ranks, problem_size
+from castepkit.utils import run_program
+
+DATA = Path(__file__).parent / "data" / "GaAs"
+PREFIX = DATA / "GaAs_Optics"
+
+FAKE_MPIRUN = """#!/bin/sh
+echo "ranks $2 threads $OMP_NUM_THREADS"
+"""
+
+
+def test_problem_size():
+    header = read_bands_header(f"{PREFIX}.bands")
+    assert (header["nkpts"], header["nspins"], header["nbands"]) == (28, 1, 26)
+    size = problem_size(PREFIX)
+    assert size["units"] == 28
+    assert size["natoms"] == 2
+
+
+def test_read_param(tmp_path):
+    param = tmp_path / "X.param"
+    param.write_text(
+        "! cut_off_energy : 300\n# grid_scale : 1.0\n"
+        "task : SinglePoint\ncut_off_energy : 500\ngrid_scale : 2.0\nfine_grid_scale 3\n"
+    )
+    values = _read_param(param)
+    # A unit-less value must not take the keyword of the next line as its unit.
+    assert values["cut_off_energy"] == ("500", "")
+    assert values["grid_scale"] == ("2.0", "")
+    assert values["fine_grid_scale"] == ("3", "")
+    param.write_text("cut_off_energy = 20 Ha  ! converged\n")
+    assert _read_param(param)["cut_off_energy"] == ("20", "ha")
+    lattice = read_bands_header(f"{PREFIX}.bands")["lattice"]
+    param.write_text("cut_off_energy : 500\ngrid_scale : 1.0\n")
+    single = _grid_points(lattice, param)
+    param.write_text("cut_off_energy : 500\ngrid_scale : 2.0\n")
+    # The grid scale was read, not left at its default.
+    assert all(2 * n - 1 <= d <= 2 * n for d, n in zip(_grid_points(lattice, param), single))
+
+
+def test_plan_ranks():
+    # 28 k-points: 16 cores would leave 4 ranks idle in the second round.
+    assert plan_ranks("shg", PREFIX, ncores=16).nproc == 14
+    assert plan_ranks("shg", PREFIX, ncores=64).nproc == 28
+    plan = plan_ranks("shg", PREFIX, ncores=64, concurrent=4)
+    assert (plan.nproc, plan.threads) == (14, 1)
+    assert plan_ranks("shg", None, ncores=8).nproc == 8
+
+    size = Path(f"{PREFIX}.bands").stat().st_size
+    history = [
+        {
+            "prog": "shg",
+            "cached": False,
+            "returncode": 0,
+            "user": 100.0,
+            "system": 20.0,
+            "input_bytes": {"GaAs_Optics.bands": size, "GaAs_Optics.cst_ome": 1},
+        }
+    ]
+    plan = plan_ranks("shg", PREFIX, ncores=64, records=history)
+    assert (plan.nproc, plan.reason) == (2, "timing history")
+    assert plan.predicted_cpu == pytest.approx(120.0)
+    assert plan_ranks("ome", PREFIX, ncores=64, records=history).nproc == 28
+
+
+def test_auto_config(tmp_path, monkeypatch):
+    validate_config({"mpirun": {"nproc": "auto"}, "shg": {"threads": "auto"}})
+    with pytest.raises(ValueError, match="nproc"):
+        validate_config({"mpirun": {"nproc": "many"}})
+
+    mpirun = tmp_path / "bin" / "mpirun"
+    mpirun.parent.mkdir()
+    mpirun.write_text(FAKE_MPIRUN)
+    mpirun.chmod(mpirun.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{mpirun.parent}:{os.environ['PATH']}")
+    config = tmp_path / "config.toml"
+    config.write_text(
+        'threads = "auto"\n[executables]\nshg = "true"\n[mpirun]\nenabled = true\nnproc = "auto"\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    shutil.copy(f"{PREFIX}.bands", tmp_path)
+
+    stdout, _ = run_program("shg", "", ["GaAs_Optics"], cwd=tmp_path, nproc=32)
+    assert stdout.split() == ["ranks", "28", "threads", "1"]
+    stdout, _ = run_program("shg", "", ["GaAs_Optics"], cwd=tmp_path, nproc=16)
+    assert stdout.split() == ["ranks", "14", "threads", "1"]
@@ -0,0 +1,69 @@
+import stat
+
+import pytest
+
+import castepkit.config
+from castepkit.staging import stage_files
+from castepkit.wrappers.ome import run_ome
+
+# Writes the directory it ran in into its output and appends it to the .castep log, as
+# the real programs do; fails without its orbital input.
+FAKE_OME = """#!/bin/sh
+read suffix
+test -f "$1.$suffix" || exit 3
+pwd > "$1.cst_ome"
+pwd >> "$1.castep"
+"""
+
+
+@pytest.fixture
+def ome_dir(tmp_path, monkeypatch):
+    exe = tmp_path / "fake_ome.sh"
+    exe.write_text(FAKE_OME)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    (tmp_path / "scratch").mkdir()
+    config = tmp_path / "config.toml"
+    config.write_text(
+        f'[executables]\nome = "{exe}"\n'
+        f'[staging]\nenabled = true\ndir = "{tmp_path / "scratch"}"\nreserve = 0\n'
+    )
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    work = tmp_path / "work"
+    work.mkdir()
+    for suffix in ("cell", "param", "cutatom_check"):
+        (work / f"GaAs.{suffix}").write_text(suffix)
+    monkeypatch.chdir(work)
+    return tmp_path
+
+
+def test_staged_run(ome_dir):
+    log = ome_dir / "work" / "GaAs.castep"
+    log.write_text("SCF log\n")
+    run_ome("GaAs")
+    ran_in = (ome_dir / "work" / "GaAs.cst_ome").read_text().strip()
+    assert ran_in.startswith(str(ome_dir / "scratch" / "castepkit-ome-"))
+    # The log of the SCF run is kept, with the staged run's lines appended.
+    assert log.read_text() == f"SCF log\n{ran_in}\n"
+    assert list((ome_dir / "scratch").iterdir()) == []
+
+    run_ome("GaAs", stage=False)
+    assert (ome_dir / "work" / "GaAs.cst_ome").read_text().strip() == str(ome_dir / "work")
+
+
+def test_staging_falls_back_without_space(ome_dir):
+    config = castepkit.config.CONFIG_PATH
+    config.write_text(config.read_text().replace("reserve = 0", 'reserve = "1000000T"'))
+    run_ome("GaAs")
+    assert (ome_dir / "work" / "GaAs.cst_ome").read_text().strip() == str(ome_dir / "work")
+
+
+def test_stage_files_copies(tmp_path):
+    pairs = []
+    for i in range(5):
+        src = tmp_path / f"in{i}.dat"
+        src.write_bytes(b"x" * 100 * (i + 1))
+        pairs.append((src, tmp_path / "out" / "sub" / src.name))
+    assert stage_files(pairs, workers=3, link=False) == 1500
+    assert all(dst.read_bytes() == src.read_bytes() for src, dst in pairs)
+    assert stage_files([(tmp_path / "in0.dat", tmp_path / "linked.dat")]) == 0
+    assert (tmp_path / "linked.dat").stat().st_nlink == 2
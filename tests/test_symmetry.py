@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from castepkit.io.cell import read_cell
+from castepkit.symmetry import plan_shg_tensor, point_group_rotations
+
+TEST_DATA = Path(__file__).parent / "data" / "GaAs"
+
+
+def test_read_cell():
+    cell = read_cell(TEST_DATA / "GaAs_Optics.cell")
+    assert cell["symbols"] == ["Ga", "As"]
+    assert cell["lattice"].shape == (3, 3)
+    assert cell["lattice"][0, 1] == pytest.approx(2.850252134776680)
+    np.testing.assert_allclose(cell["positions"][1], [0.25, 0.25, 0.25])
+
+
+def test_plan_gaas():
+    plan = plan_shg_tensor(TEST_DATA / "GaAs_Optics.cell")
+    # Zinc blende (-43m) has 24 operations and a single independent component.
+    assert len(plan.rotations) == 24
+    assert plan.directions == ["123"]
+    assert len(plan.zero_directions) == 21
+
+    tensor = plan.rebuild({"123": np.array([1.0, 2.0])})
+    assert tensor.shape == (3, 3, 3, 2)
+    for ijk in ["123", "132", "213", "231", "312", "321"]:
+        i, j, k = (int(x) - 1 for x in ijk)
+        np.testing.assert_allclose(tensor[i, j, k], [1.0, 2.0])
+    np.testing.assert_allclose(tensor[0, 0, 0], 0.0)
+
+
+def test_plan_wurtzite(tmp_path):
+    cell = tmp_path / "ZnO.cell"
+    cell.write_text(
+        "%BLOCK LATTICE_ABC\n3.0 3.0 5.0\n90 90 120\n%ENDBLOCK LATTICE_ABC\n"
+        "%BLOCK POSITIONS_FRAC\n"
+        "Zn 0.3333333333 0.6666666667 0.0\n"
+        "Zn 0.6666666667 0.3333333333 0.5\n"
+        "O  0.3333333333 0.6666666667 0.375\n"
+        "O  0.6666666667 0.3333333333 0.875\n"
+        "%ENDBLOCK POSITIONS_FRAC\n"
+    )
+    plan = plan_shg_tensor(cell)
+    # 6mm: chi_xxz = chi_yyz, chi_zxx = chi_zyy and chi_zzz.
+    assert len(plan.rotations) == 12
+    assert plan.directions == ["113", "311", "333"]
+    tensor = plan.rebuild({"113": 1.0, "311": 2.0, "333": 3.0})
+    assert tensor[1, 1, 2] == pytest.approx(1.0)
+    assert tensor[2, 1, 1] == pytest.approx(2.0)
+    assert tensor[0, 1, 2] == pytest.approx(0.0)
+
+
+def test_point_group_triclinic():
+    rng = np.random.default_rng(1)
+    lattice = 3 * np.eye(3) + rng.random((3, 3))
+    rotations = point_group_rotations(lattice, rng.random((3, 3)), ["A", "B", "C"])
+    np.testing.assert_allclose(rotations, [np.eye(3)], atol=1e-12)
+
+
+def _sorted_ops(rotations):
+    return sorted(np.round(rotations, 6).reshape(len(rotations), -1).tolist())
+
+
+def test_point_group_skewed_setting():
+    # GaAs in an equivalent but non-reduced cell: a3' = 2 a1 + a2 + a3. The operations
+    # then have fractional entries beyond -1..1 and must still all be found.
+    cell = read_cell(TEST_DATA / "GaAs_Optics.cell")
+    change = np.array([[1, 0, 0], [0, 1, 0], [2, 1, 1]])
+    lattice = change @ cell["lattice"]
+    positions = cell["positions"] @ np.linalg.inv(change)
+    rotations = point_group_rotations(lattice, positions, cell["symbols"])
+    reference = point_group_rotations(cell["lattice"], cell["positions"], cell["symbols"])
+    assert len(rotations) == len(reference) == 24
+    assert _sorted_ops(rotations) == _sorted_ops(reference)
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+import castepkit.config
+from castepkit.utils import arun_program, run_program, set_max_concurrency, split_cores
+
+FAKE_PROGRAM = """#!/bin/sh
+read value
+for i in 1 2 3; do echo "out $i $value"; echo "err $i" >&2; done
+sleep "$1"
+"""
+
+
+@pytest.fixture
+def fake_exe(tmp_path, monkeypatch):
+    exe = tmp_path / "fake.sh"
+    exe.write_text(FAKE_PROGRAM)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\nfake = "{exe}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    monkeypatch.chdir(tmp_path)
+    return exe
+
+
+def test_split_cores():
+    assert split_cores(64, 27) == (27, 2)
+    assert split_cores(64, 4) == (4, 16)
+    assert split_cores(64, 27, max_workers=8) == (8, 8)
+    assert split_cores(2, 27) == (2, 1)
+
+
+def test_run_program_buffered(fake_exe):
+    stdout, stderr = run_program("fake", "x\n", ["0"])
+    assert stdout.splitlines() == ["out 1 x", "out 2 x", "out 3 x"]
+    assert stderr.splitlines() == ["err 1", "err 2", "err 3"]
+
+
+def test_run_program_streaming(fake_exe, tmp_path):
+    lines = []
+    stdout, stderr = run_program(
+        "fake", "x\n", ["0"], log_dir="logs", on_stdout=lines.append, on_stderr=lines.append
+    )
+    assert (stdout, stderr) == ("", "")
+    assert sorted(lines) == ["err 1", "err 2", "err 3", "out 1 x", "out 2 x", "out 3 x"]
+    (log,) = (tmp_path / "logs").glob("fake-*.stdout")
+    assert log.read_text().splitlines() == ["out 1 x", "out 2 x", "out 3 x"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_run_program_timeout(fake_exe, stream):
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_program("fake", "x\n", ["30"], stream=stream, timeout=0.5, on_stdout=lambda line: None)
+    assert time.time() - start < 10
+
+
+def test_run_program_metrics(tmp_path, monkeypatch):
+    # The work happens in a grandchild, so only usage of the whole tree is seen.
+    exe = tmp_path / "busy.sh"
+    exe.write_text(
+        f'#!/bin/sh\n{sys.executable} -c "x = bytearray(60_000_000); sum(range(3_000_000))"\n'
+    )
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\nbusy = "{exe}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+
+    output = run_program("busy", "1\n")
+    stdout, _ = output
+    metrics = output.metrics
+    assert stdout == "" and metrics.returncode == 0
+    assert metrics.prog == "busy" and metrics.params == "1\n" and metrics.nproc == 1
+    assert metrics.cpu > 0.01 and metrics.wall >= metrics.cpu * 0.5
+    assert metrics.max_rss > 60_000_000
+
+
+def _config_script(tmp_path, monkeypatch, name, script):
+    exe = tmp_path / f"{name}.sh"
+    exe.write_text(script)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\n{name} = "{exe}"\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    monkeypatch.chdir(tmp_path)
+
+
+def test_arun_program(fake_exe):
+    async def run_both():
+        lines = []
+        buffered = await arun_program("fake", "x\n", ["0"])
+        streamed = await arun_program(
+            "fake", "y\n", ["0"], log_dir="logs", on_stdout=lines.append, on_stderr=lines.append
+        )
+        return buffered, streamed, lines
+
+    buffered, streamed, lines = asyncio.run(run_both())
+    assert buffered[0].splitlines() == ["out 1 x", "out 2 x", "out 3 x"]
+    assert buffered[1].splitlines() == ["err 1", "err 2", "err 3"]
+    assert buffered.metrics.returncode == 0 and buffered.metrics.wall > 0
+    assert tuple(streamed) == ("", "") and "out 3 y" in lines
+
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(arun_program("fake", "x\n", ["30"], timeout=0.5))
+    assert time.time() - start < 10
+
+
+def _alive(pid):
+    """True unless the process is gone or a zombie (nobody may reap orphans here)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_arun_program_cancel_kills_tree(tmp_path, monkeypatch):
+    _config_script(
+        tmp_path, monkeypatch, "tree", "#!/bin/sh\nsleep 30 &\necho $! > child.pid\nwait\n"
+    )
+
+    async def cancel_soon():
+        task = asyncio.create_task(arun_program("tree", ""))
+        while not (tmp_path / "child.pid").is_file() or not (tmp_path / "child.pid").read_text():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.time()
+    asyncio.run(cancel_soon())
+    assert time.time() - start < 10
+    assert not _alive(int((tmp_path / "child.pid").read_text()))
+
+
+def test_arun_program_concurrency_limit(tmp_path, monkeypatch):
+    _config_script(
+        tmp_path, monkeypatch, "slot", "#!/bin/sh\necho + >> slots\nsleep 0.2\necho - >> slots\n"
+    )
+
+    async def run_many():
+        await asyncio.gather(*(arun_program("slot", "") for _ in range(6)))
+
+    set_max_concurrency(2)
+    try:
+        asyncio.run(run_many())
+    finally:
+        set_max_concurrency(None)
+    depth, peak = 0, 0
+    for mark in (tmp_path / "slots").read_text().split():
+        depth += 1 if mark == "+" else -1
+        peak = max(peak, depth)
+    assert peak == 2
@@ -0,0 +1,77 @@
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import castepkit.config
+from castepkit.wrappers.weighted_dens import run_weighted_den, run_weighted_den_batch
+
+# Like the real program, reads the weight file named in {prefix}.wden_in and always writes
+# {prefix}_wden.grd; the pause makes concurrent runs overlap, and a run fails if it sees
+# another run's output in its directory.
+FAKE_WDEN = """#!/bin/sh
+read format
+weights=$(cat "$1.wden_in")
+test -f "$1_wden.grd" && exit 4
+sleep 0.2
+cat "$weights" > "$1_wden.grd"
+pwd >> "$1_wden.grd"
+"""
+
+
+@pytest.fixture
+def wden_dir(tmp_path, monkeypatch):
+    exe = tmp_path / "fake_wden.sh"
+    exe.write_text(FAKE_WDEN)
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    config = tmp_path / "config.toml"
+    config.write_text(f'[executables]\nweighted_den = "{exe}"\n[cache]\nenabled = false\n')
+    monkeypatch.setattr(castepkit.config, "CONFIG_PATH", config)
+    work = tmp_path / "work"
+    work.mkdir()
+    for suffix in ("cell", "param", "bands"):
+        (work / f"GaAs.{suffix}").write_text(suffix)
+    for name in ("veocc", "veunocc", "vbm"):
+        (work / f"GaAs.shg_weight_{name}").write_text(f"{name}\n")
+    monkeypatch.chdir(work)
+    return work
+
+
+def check_outputs(work, suffixes):
+    scratches = set()
+    for suffix in suffixes:
+        weights, ran_in = (work / f"GaAs_{suffix}.grd").read_text().splitlines()
+        assert weights == suffix
+        assert Path(ran_in).parent == work.resolve()
+        assert Path(ran_in).name.startswith(f".GaAs.wden_{suffix}.")
+        scratches.add(ran_in)
+    # Every run had its own scratch directory, and none is left behind.
+    assert len(scratches) == len(suffixes)
+    assert sorted(os.listdir(work)) == sorted(
+        ["GaAs.cell", "GaAs.param", "GaAs.bands"]
+        + [f"GaAs.shg_weight_{s}" for s in ("veocc", "veunocc", "vbm")]
+        + [f"GaAs_{s}.grd" for s in suffixes]
+    )
+
+
+def test_concurrent_runs_same_prefix(wden_dir):
+    suffixes = ["veocc", "veunocc", "vbm"]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [
+            pool.submit(run_weighted_den, "GaAs", f"GaAs.shg_weight_{s}", s, 3) for s in suffixes
+        ]
+        for future in futures:
+            future.result()
+    check_outputs(wden_dir, suffixes)
+
+
+def test_batch(wden_dir):
+    weights = {s: f"GaAs.shg_weight_{s}" for s in ("veocc", "veunocc")}
+    outputs = run_weighted_den_batch("GaAs", weights, ncores=2)
+    assert {s: Path(f).name for s, f in outputs.items()} == {
+        "veocc": "GaAs_veocc.grd",
+        "veunocc": "GaAs_veunocc.grd",
+    }
+    check_outputs(wden_dir, list(weights))